@@ -1,6 +1,7 @@
 import asyncio
 import json
 import sys
+import time
 from pathlib import Path
 from typing import Annotated, Dict, List
 
@@ -10,7 +11,9 @@ from luxai_runner.episode import Episode, EpisodeConfig, ReplayConfig
 from luxai_runner.logger import Logger
 from luxai_runner.tournament import Tournament, TournamentConfig
 
-from luxai_s3.wrappers import LuxAIS3GymEnv, RecordEpisode
+from luxai_s3.aot import enable_compilation_cache
+from luxai_s3.map_bank import MapBank
+from luxai_s3.wrappers import LuxAIS3GymEnv, RecordEpisode, get_compiled_jax_env
 import tyro
 from dataclasses import dataclass, field
 from typing import Optional
@@ -46,6 +49,12 @@ class Args:
     """Max concurrent number of episodes to run. Recommended to set no higher than the number of CPUs / 2"""
     tournament_cfg_ranking_system: str = "elo"
     """The ranking system to use. Default is 'elo'. Can be 'elo', 'wins'."""
+    no_compilation_cache: bool = False
+    """Do not cache the compiled env on disk and do not load it from exported executables, trace and compile it in every run instead. By default the env is exported and compiled once per machine and cached in ~/.cache/luxai_s3"""
+    map_bank: Optional[str] = None
+    """Directory of a map bank (see luxai_s3.map_bank). Episodes with a seed in the bank load their map from it instead of generating it"""
+    experimental_numpy_engine: bool = False
+    """Experimental: run episodes with the pure numpy engine (luxai_s3.numpy_env) instead of the jax engine, the reference implementation of the rules. It steps a single game faster and plays the same game from the same seed, but is not the engine used in competition"""
     # skip_validate_action_space: bool = False
     # """Set this for a small performance increase. Note that turning this on means the engine assumes your submitted actions are valid. If your actions are not well formatted there could be errors"""
 
@@ -65,13 +74,26 @@ def main():
                 save_format = output_ext
     if args.seed:
         np.random.seed(args.seed)
+    map_bank = MapBank(args.map_bank) if args.map_bank is not None else None
+    # compile the env once up front, all episodes in this process share it. The env is loaded from exported executables
+    # and compiled with the persistent compilation cache, so only the first run on a machine pays for compiling
+    engine = "numpy" if args.experimental_numpy_engine else "jax"
+    if engine == "jax":
+        if not args.no_compilation_cache:
+            enable_compilation_cache()
+        stime = time.time()
+        get_compiled_jax_env(use_exported=not args.no_compilation_cache)
+        if args.verbose >= 3:
+            print(f"Compiled env in {time.time() - stime:.3f}s")
     cfg = EpisodeConfig(
         players=args.players,
         env_cls=lambda **kwargs: RecordEpisode(
-            LuxAIS3GymEnv(numpy_output=True), save_on_close=False
+            LuxAIS3GymEnv(numpy_output=True, map_bank=map_bank, **kwargs), save_on_close=False
         ),
         seed=args.seed,
         env_cfg=dict(
+            engine=engine,
+            use_exported=not args.no_compilation_cache,
             # verbose=args.verbose,
             # validate_action_space=not args.skip_validate_action_space,
             # max_episode_length=args.len,
@@ -117,8 +139,6 @@ def main():
         asyncio.run(tourney.run())
         # exit()
     else:
-        import time
-
         stime = time.time()
         eps = Episode(cfg=cfg)
         results = asyncio.run(eps.run())
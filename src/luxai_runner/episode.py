@@ -40,8 +40,10 @@ class EpisodeResults:
 class Episode:
     def __init__(self, cfg: EpisodeConfig) -> None:
         self.cfg = cfg
-        self.env = cfg.env_cls(**cfg.env_cfg)
         self.log = Logger(identifier="Episode", verbosity=cfg.verbosity)
+        stime = time.time()
+        self.env = cfg.env_cls(**cfg.env_cfg)
+        self.log.info(f"Created env in {time.time() - stime:.3f}s")
         self.seed = cfg.seed if cfg.seed is not None else np.random.randint(9999999)
         self.players = cfg.players
 
@@ -0,0 +1,187 @@
+import dataclasses
+import functools
+import hashlib
+import importlib.metadata
+import json
+import os
+import warnings
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional
+
+import jax
+import jax.numpy as jnp
+import tyro
+from jax import export
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams
+from luxai_s3.state import EnvObs, EnvState, MapTile, UnitState
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "luxai_s3")
+"""default directory for exported env executables and the jax compilation cache"""
+
+for _cls in [UnitState, MapTile, EnvState, EnvObs, EnvParams]:
+    # struct dataclasses keep their static fields as the pytree auxdata
+    export.register_pytree_node_serialization(
+        _cls,
+        serialized_name=f"{_cls.__module__}.{_cls.__name__}",
+        serialize_auxdata=lambda auxdata: json.dumps(list(auxdata)).encode(),
+        deserialize_auxdata=lambda data: tuple(json.loads(data)),
+    )
+
+
+def enable_compilation_cache(cache_dir: str = DEFAULT_CACHE_DIR):
+    """Enable jax's persistent compilation cache in cache_dir. Exported executables skip tracing but still need to be
+    compiled by XLA when first called, with the cache that compilation is also only done once per machine"""
+    jax.config.update("jax_compilation_cache_dir", os.path.join(cache_dir, "xla"))
+    jax.config.update("jax_persistent_cache_min_compile_time_secs", 0)
+
+
+def _luxai_s3_version() -> str:
+    try:
+        return importlib.metadata.version("luxai-s3")
+    except importlib.metadata.PackageNotFoundError:
+        # running from a source checkout that was not installed
+        return "unknown"
+
+
+@functools.lru_cache
+def _source_hash() -> str:
+    """Hash of the luxai_s3 source files, so executables exported from an edited checkout are never loaded"""
+    source_hash = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith(".py"):
+            source_hash.update(name.encode())
+            with open(os.path.join(package_dir, name), "rb") as f:
+                source_hash.update(f.read())
+    return source_hash.hexdigest()
+
+
+def exported_env_path(env: LuxAIS3Env, cache_dir: str = DEFAULT_CACHE_DIR) -> str:
+    """Directory holding the exported reset and step of envs configured like env, for this jax version and backend and
+    this version and source of luxai_s3"""
+    config = dict(
+        luxai_s3_version=_luxai_s3_version(),
+        source_hash=_source_hash(),
+        auto_reset=env.auto_reset,
+        stacked_obs=env.stacked_obs,
+        egocentric=env.egocentric,
+        fixed_env_params=dataclasses.asdict(env.fixed_env_params),
+    )
+    config_hash = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+    return os.path.join(
+        cache_dir, "exported", f"jax-{jax.__version__}-{jax.default_backend()}", config_hash
+    )
+
+
+def _matching_args(exported: export.Exported, args: tuple) -> Optional[list]:
+    """Flattened args converted to the dtypes the exported function takes, or None if they do not fit it"""
+    leaves, in_tree = jax.tree.flatten((args, {}))
+    if in_tree != exported.in_tree:
+        return None
+    converted = []
+    for leaf, aval in zip(leaves, exported.in_avals):
+        leaf = jnp.asarray(leaf)
+        if leaf.shape != aval.shape:
+            return None
+        if leaf.dtype != aval.dtype:
+            # only convert between dtypes of the same kind, e.g. int64 actions to int16
+            if jax.dtypes.issubdtype(leaf.dtype, jax.dtypes.prng_key) or leaf.dtype.kind != aval.dtype.kind:
+                return None
+            leaf = leaf.astype(aval.dtype)
+        converted.append(leaf)
+    return converted
+
+
+class ExportedLuxAIS3Env:
+    """LuxAIS3Env whose reset and step run ahead-of-time exported executables instead of tracing and compiling them.
+
+    Calls with arguments of different shapes or tree structure than the exported ones fall back to the regular jitted
+    reset and step of env. All other attributes are those of env.
+    """
+
+    def __init__(self, env: LuxAIS3Env, exported_reset: export.Exported, exported_step: export.Exported):
+        self.env = env
+        self.exported_reset = exported_reset
+        self.exported_step = exported_step
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.env, name)
+
+    def reset(self, key, params: Optional[EnvParams] = None):
+        if params is None:
+            params = self.env.default_params
+        args = _matching_args(self.exported_reset, (key, params))
+        if args is None:
+            return self.env.reset(key, params)
+        return self.exported_reset.call(*jax.tree.unflatten(self.exported_reset.in_tree, args)[0])
+
+    def step(self, key, state, action, params: Optional[EnvParams] = None):
+        if params is None:
+            params = self.env.default_params
+        if isinstance(action, Mapping):
+            # actions of any mapping type, e.g. the OrderedDict sampled from action_space, run the same executable
+            action = dict(action)
+        args = _matching_args(self.exported_step, (key, state, action, params))
+        if args is None:
+            return self.env.step(key, state, action, params)
+        return self.exported_step.call(*jax.tree.unflatten(self.exported_step.in_tree, args)[0])
+
+
+def export_env(env: LuxAIS3Env, cache_dir: str = DEFAULT_CACHE_DIR) -> ExportedLuxAIS3Env:
+    """Export reset and step of env for the default env params and a sampled action, and save them to cache_dir"""
+    params = env.default_params
+    key = jax.random.key(0)
+    _, state = jax.eval_shape(env.reset, key, params)
+    action = jax.eval_shape(env.action_space(params).sample, key)
+    if isinstance(action, Mapping):
+        action = dict(action)
+    exported_reset = export.export(jax.jit(lambda key, params: env.reset(key, params)))(key, params)
+    exported_step = export.export(
+        jax.jit(lambda key, state, action, params: env.step(key, state, action, params))
+    )(key, state, action, params)
+    path = exported_env_path(env, cache_dir)
+    os.makedirs(path, exist_ok=True)
+    for name, exported in [("reset", exported_reset), ("step", exported_step)]:
+        tmp_path = os.path.join(path, f"{name}.tmp.bin")
+        with open(tmp_path, "wb") as f:
+            f.write(exported.serialize())
+        os.replace(tmp_path, os.path.join(path, f"{name}.bin"))
+    return ExportedLuxAIS3Env(env, exported_reset, exported_step)
+
+
+def load_exported_env(env: LuxAIS3Env, cache_dir: str = DEFAULT_CACHE_DIR) -> ExportedLuxAIS3Env:
+    """Load the exported reset and step of env from cache_dir, exporting them first if they are not there yet"""
+    path = exported_env_path(env, cache_dir)
+    if not os.path.isfile(os.path.join(path, "step.bin")):
+        return export_env(env, cache_dir)
+    with open(os.path.join(path, "reset.bin"), "rb") as f:
+        exported_reset = export.deserialize(bytearray(f.read()))
+    with open(os.path.join(path, "step.bin"), "rb") as f:
+        exported_step = export.deserialize(bytearray(f.read()))
+    return ExportedLuxAIS3Env(env, exported_reset, exported_step)
+
+
+def try_load_exported_env(env: LuxAIS3Env, cache_dir: str = DEFAULT_CACHE_DIR):
+    """Same as load_exported_env but returns env itself, with a warning, if exporting or loading fails because the
+    optional flatbuffers package jax needs for serialization is not installed or the cache directory can not be read or
+    written. Other errors, e.g. from tracing the env or deserializing corrupted executables, are raised"""
+    try:
+        return load_exported_env(env, cache_dir)
+    except (ImportError, OSError) as e:
+        warnings.warn(f"Could not load exported env, compiling it instead: {e}")
+        return env
+
+
+@dataclass
+class Args:
+    cache_dir: str = DEFAULT_CACHE_DIR
+    """Directory to save the exported executables to"""
+
+
+if __name__ == "__main__":
+    args = tyro.cli(Args)
+    env = LuxAIS3Env(auto_reset=False)
+    export_env(env, args.cache_dir)
+    print(f"Exported env to {exported_env_path(env, args.cache_dir)}")
@@ -0,0 +1,82 @@
+"""Egocentric frames for the two player game.
+
+Maps are symmetric about the anti-diagonal: tile (x, y) mirrors tile (map_width - 1 - y, map_height - 1 - x), and team 1
+starts in the corner mirroring the start of team 0. Mirroring every position and map of an observation of team 1 and
+swapping its team axis gives team 1 the same view of the game that team 0 has, so a single policy can play both seats.
+Moves and sap targets given in that mirrored frame are mapped back to the real board with egocentric_action.
+
+The functions here are jittable and vmappable. They work on numpy arrays as well when xp=np is passed.
+"""
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from luxai_s3.params import EnvParams
+from luxai_s3.state import EnvObs, MapTile, UnitState
+
+
+def mirror_positions(position, fixed_env_params: EnvParams = EnvParams(), xp=jnp):
+    """Mirror positions of shape (..., 2) about the anti-diagonal. Positions of -1 (not visible) stay -1"""
+    mirrored = xp.stack(
+        [
+            fixed_env_params.map_width - 1 - position[..., 1],
+            fixed_env_params.map_height - 1 - position[..., 0],
+        ],
+        axis=-1,
+    ).astype(position.dtype)
+    return xp.where(position >= 0, mirrored, position)
+
+
+def mirror_map(x):
+    """Mirror maps of shape (..., W, H) about the anti-diagonal, i.e. x[..., ::-1, ::-1].T for a single map"""
+    return x[..., ::-1, ::-1].swapaxes(-1, -2)
+
+
+def mirror_obs(obs: EnvObs, fixed_env_params: EnvParams = EnvParams(), xp=jnp) -> EnvObs:
+    """Mirror all positions and maps of an observation and swap its team axis"""
+    return obs.replace(
+        units=UnitState(
+            position=mirror_positions(obs.units.position[::-1], fixed_env_params, xp),
+            energy=obs.units.energy[::-1],
+        ),
+        units_mask=obs.units_mask[::-1],
+        sensor_mask=mirror_map(obs.sensor_mask),
+        map_features=MapTile(
+            energy=mirror_map(obs.map_features.energy),
+            tile_type=mirror_map(obs.map_features.tile_type),
+        ),
+        team_points=obs.team_points[::-1],
+        team_wins=obs.team_wins[::-1],
+        relic_nodes=mirror_positions(obs.relic_nodes, fixed_env_params, xp),
+    )
+
+
+def mirror_action(action, xp=jnp):
+    """Mirror actions of shape (..., 3) about the anti-diagonal. Up and right as well as down and left swap, and sap deltas
+    (dx, dy) become (-dy, -dx). Mirroring is its own inverse"""
+    move = action[..., 0]
+    is_move = (move >= 1) & (move <= 4)
+    # 1 (up) <-> 2 (right) and 3 (down) <-> 4 (left)
+    move = xp.where(is_move, xp.where(move % 2 == 1, move + 1, move - 1), move)
+    return xp.stack([move, -action[..., 2], -action[..., 1]], axis=-1).astype(action.dtype)
+
+
+def egocentric_obs(obs: EnvObs, team_id, fixed_env_params: EnvParams = EnvParams(), xp=jnp) -> EnvObs:
+    """The observation obs of team team_id in the egocentric frame of that team, where the team starts in the corner of
+    team 0 and is first along the team axis. Observations of team 0 are unchanged.
+
+    team_id may be a traced value, e.g. when vmapping over the team axis of stacked observations.
+    """
+    if isinstance(team_id, (int, np.integer)):
+        return mirror_obs(obs, fixed_env_params, xp) if team_id == 1 else obs
+    return jax.tree.map(
+        lambda x, y: xp.where(team_id == 1, x, y), mirror_obs(obs, fixed_env_params, xp), obs
+    )
+
+
+def egocentric_action(action, team_id, xp=jnp):
+    """Map actions of shape (..., 3) between the egocentric frame of team team_id and the real board, in either direction.
+    Actions of team 0 are unchanged. team_id may be a traced value"""
+    if isinstance(team_id, (int, np.integer)):
+        return mirror_action(action, xp) if team_id == 1 else action
+    return xp.where(team_id == 1, mirror_action(action, xp), action)
@@ -1,5 +1,5 @@
 import functools
-from typing import Any, Dict, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
 import chex
 import gymnax
@@ -9,67 +9,226 @@ import numpy as np
 from gymnax.environments import environment, spaces
 from jax import lax
 
-from luxai_s3.params import EnvParams, env_params_ranges
+from luxai_s3.egocentric import egocentric_action, egocentric_obs, mirror_map
+from luxai_s3.params import EnvParams, canonicalize_env_params, check_fog_of_war, env_params_ranges
 from luxai_s3.spaces import MultiDiscrete
 from luxai_s3.state import (
     ASTEROID_TILE,
     ENERGY_NODE_FNS,
     NEBULA_TILE,
+    EnvConstants,
     EnvObs,
     EnvState,
     MapTile,
     UnitState,
-    gen_state
+    check_packable_params,
+    gen_state,
+    merge_env_state,
+    nodes_are_symmetric,
+    pack_env_state,
+    split_env_state,
 )
 from luxai_s3.pygame_render import LuxAIPygameRenderer
 
 
+def sum_shifted_maps(maps: chex.Array, offsets):
+    """Sum copies of maps of shape (..., W, H) where each copy has its tile (x, y) moved to (x + dx, y + dy) for (dx, dy) in offsets.
+
+    Tiles moved beyond the map edges are dropped, so each tile of the result holds the sum of the tiles at (x - dx, y - dy).
+    """
+    pad = max(max(abs(dx), abs(dy)) for dx, dy in offsets)
+    width, height = maps.shape[-2:]
+    padded = jnp.pad(maps, [(0, 0)] * (maps.ndim - 2) + [(pad, pad), (pad, pad)])
+    result = jnp.zeros_like(maps)
+    for dx, dy in offsets:
+        result = result + padded[
+            ..., pad - dx : pad - dx + width, pad - dy : pad - dy + height
+        ]
+    return result
+
+
 class LuxAIS3Env(environment.Environment):
     def __init__(
-        self, auto_reset=False, fixed_env_params: EnvParams = EnvParams(), **kwargs
+        self,
+        auto_reset=False,
+        fixed_env_params: EnvParams = EnvParams(),
+        stacked_obs: bool = False,
+        egocentric: bool = False,
+        **kwargs,
     ):
         super().__init__(**kwargs)
         self.renderer = LuxAIPygameRenderer()
         self.auto_reset = auto_reset
+        self.stacked_obs = stacked_obs
+        """whether observations are returned as one EnvObs with a leading team axis instead of a dict keyed by player. Actions
+        can then also be given as one array of shape (num_teams, max_units, 3)"""
+        self.egocentric = egocentric
+        """whether player_1 observes the game and gives its actions in its egocentric frame, mirrored about the anti-diagonal
+        so that it starts in the corner of player_0 and is first along the team axis, see luxai_s3.egocentric"""
         self.fixed_env_params = fixed_env_params
         """fixed env params for concrete/static values. Necessary for jit/vmap capability with randomly sampled maps which must of consistent shape"""
+        dx, dy = np.meshgrid(
+            np.arange(-fixed_env_params.map_width, fixed_env_params.map_width + 1),
+            np.arange(-fixed_env_params.map_height, fixed_env_params.map_height + 1),
+            indexing="ij",
+        )
+        self.energy_node_distances = np.sqrt((dx**2 + dy**2).astype(np.float32))
+        """distance between a tile and an energy node at offset (dx, dy) from it, indexed by [dx + map_width, dy + map_height].
+        Energy nodes lie in [0, map_width] x [0, map_height], so this table covers every pair of tile and energy node"""
 
     @property
     def default_params(self) -> EnvParams:
-        return EnvParams()
+        """The fixed env params, so that the default params match the env's static fields and any dynamic param values
+        it was created with"""
+        return canonicalize_env_params(self.fixed_env_params)
 
-    def compute_unit_counts_map(self, state: EnvState, params: EnvParams):
-        # map of total units per team on each tile, shape (num_teams, map_width, map_height)
-        unit_counts_map = jnp.zeros(
-            (self.fixed_env_params.num_teams, self.fixed_env_params.map_width, self.fixed_env_params.map_height), dtype=jnp.int16
+    def scatter_to_tiles(self, positions: chex.Array, values: chex.Array):
+        """Sum per unit values onto the map of their team with a single segment sum over flattened tile ids.
+
+        positions has shape (num_teams, N, 2) and values has shape (num_teams, N, ...). Returns an array of shape
+        (num_teams, map_width, map_height, ...). Values at positions outside of the map are dropped.
+        """
+        num_teams = self.fixed_env_params.num_teams
+        map_width = self.fixed_env_params.map_width
+        map_height = self.fixed_env_params.map_height
+        positions = positions.astype(jnp.int32)
+        in_map = (
+            (positions >= 0).all(-1)
+            & (positions[..., 0] < map_width)
+            & (positions[..., 1] < map_height)
         )
+        team_ids = jnp.arange(num_teams, dtype=jnp.int32)[:, None]
+        tile_ids = (team_ids * map_width + positions[..., 0]) * map_height + positions[..., 1]
+        # out of range segment ids are dropped by segment_sum
+        tile_ids = jnp.where(in_map, tile_ids, num_teams * map_width * map_height)
+        tile_values = jax.ops.segment_sum(
+            values.reshape((-1,) + values.shape[positions.ndim - 1:]),
+            tile_ids.reshape(-1),
+            num_segments=num_teams * map_width * map_height,
+        )
+        return tile_values.reshape((num_teams, map_width, map_height) + values.shape[positions.ndim - 1:])
 
-        def update_unit_counts_map(unit_position, unit_mask, unit_counts_map):
-            unit_counts_map = unit_counts_map.at[
-                unit_position[0], unit_position[1]
-            ].add(unit_mask.astype(jnp.int16))
-            return unit_counts_map
+    def compute_unit_aggregates(self, state: EnvState, unit_energy: chex.Array):
+        """Compute per team tile aggregates of units in one pass.
 
-        for t in range(self.fixed_env_params.num_teams):
-            unit_counts_map = unit_counts_map.at[t].add(
-                jnp.sum(
-                    jax.vmap(update_unit_counts_map, in_axes=(0, 0, None), out_axes=0)(
-                        state.units.position[t], state.units_mask[t], unit_counts_map[t]
-                    ),
-                    axis=0,
-                    dtype=jnp.int16
-                )
+        Returns a tuple of arrays, each of shape (num_teams, map_width, map_height):
+        the number of units on each tile, the total (stacked) energy of units on each tile and the
+        energy void field, which is the total energy of units on the 4 adjacent tiles.
+        """
+        unit_mask = state.units_mask.astype(jnp.int16)
+        tile_values = self.scatter_to_tiles(
+            state.units.position, jnp.stack([unit_mask, unit_energy[..., 0] * unit_mask], axis=-1)
+        )
+        unit_counts_map = tile_values[..., 0]
+        unit_aggregate_energy_map = tile_values[..., 1]
+        unit_aggregate_energy_void_map = sum_shifted_maps(
+            unit_aggregate_energy_map, [(-1, 0), (1, 0), (0, -1), (0, 1)]
+        )
+        return unit_counts_map, unit_aggregate_energy_map, unit_aggregate_energy_void_map
+
+    def apply_sap_actions(self, state: EnvState, action: chex.Array, params: EnvParams) -> EnvState:
+        """Remove the energy of units sapped by other teams and of the units that sapped.
+
+        Sap actions are resolved like the original pairwise comparison of units: unit j of a team is hit by the sap
+        targets of every unit of another team, and by the 8 tiles around the sap target of unit j of that team, but only
+        when unit j of the sapping team saps validly.
+        """
+        num_teams = self.fixed_env_params.num_teams
+        all_units = state.units
+        units_mask = state.units_mask
+        # energy of units after moving, which decides whether they can sap
+        current_energy = all_units.energy
+        sap_action_mask = action[..., 0] == 5
+        sap_action_deltas = action[..., 1:]
+        team_sapped_positions = (
+            all_units.position + sap_action_deltas
+        )  # (num_teams, max_units, 2)
+        # whether the unit is really sapping or not (needs to exist, have enough energy, and a valid sap action)
+        team_unit_sapped = (
+            units_mask
+            & sap_action_mask
+            & (current_energy[..., 0] >= params.unit_sap_cost)
+            & (
+                jnp.max(jnp.abs(sap_action_deltas), axis=-1)
+                <= params.unit_sap_range
             )
-        return unit_counts_map
+        )  # (num_teams, max_units)
+        team_unit_sapped = (
+            team_unit_sapped
+            & (team_sapped_positions >= 0).all(-1)
+            & (team_sapped_positions[..., 0] < self.fixed_env_params.map_width)
+            & (team_sapped_positions[..., 1] < self.fixed_env_params.map_height)
+        )
+
+        # per team map of the number of sap targets of all units, valid or not, on each tile
+        sap_target_counts_map = self.scatter_to_tiles(
+            team_sapped_positions, jnp.ones_like(units_mask, dtype=jnp.int16)
+        )  # (num_teams, map_width, map_height)
+        # the number of sap targets of each team on each unit, shape (num_teams, num_teams, max_units)
+        units_sapped_count = sap_target_counts_map[
+            :, all_units.position[..., 0], all_units.position[..., 1]
+        ]
+        # whether each unit is on one of the 8 tiles adjacent to the sap target of the unit in the same slot of each team
+        units_adjacent_sapped = (
+            jnp.max(jnp.abs(all_units.position[None] - team_sapped_positions[:, None]), axis=-1) == 1
+        )  # (num_teams, num_teams, max_units)
+        # only opposition units are sapped, and only when the unit in the same slot of the sapping team saps
+        units_sap_applied = (
+            units_mask[None]
+            & ~jnp.eye(num_teams, dtype=jnp.bool)[:, :, None]
+            & team_unit_sapped[:, None, :]
+        )
+
+        # remove unit_sap_cost energy from opposition units that were in the middle of a sap action.
+        sap_damage = jnp.sum(
+            jnp.where(
+                units_sap_applied,
+                params.unit_sap_cost * units_sapped_count,
+                0,
+            ),
+            axis=0,
+            dtype=jnp.int16,
+        )
+        # remove unit_sap_cost * unit_sap_dropoff_factor energy from opposition units that were on tiles adjacent to the center of a sap action.
+        sap_damage = sap_damage + jnp.sum(
+            jnp.where(
+                units_sap_applied & units_adjacent_sapped,
+                jnp.array(
+                    params.unit_sap_cost.astype(jnp.float32)
+                    * params.unit_sap_dropoff_factor,
+                    dtype=jnp.int16,
+                ),
+                0,
+            ),
+            axis=0,
+            dtype=jnp.int16,
+        )
+        # remove unit_sap_cost energy from units that tried to sap some position within the unit's range
+        sap_damage = sap_damage + jnp.where(
+            team_unit_sapped, params.unit_sap_cost, 0
+        ).astype(jnp.int16)
+        return state.replace(
+            units=all_units.replace(energy=all_units.energy - sap_damage[..., None])
+        )
 
-    def compute_energy_features(self, state: EnvState, params: EnvParams):
-        # first compute a array of shape (map_height, map_width, num_energy_nodes) with values equal to the distance of the tile to the energy node
-        mm = jnp.meshgrid(jnp.arange(self.fixed_env_params.map_width), jnp.arange(self.fixed_env_params.map_height))
-        mm = jnp.stack([mm[0], mm[1]]).T.astype(jnp.int16)  # mm[x, y] gives [x, y]
-        distances_to_nodes = jax.vmap(lambda pos: jnp.linalg.norm(mm - pos, axis=-1))(
-            state.energy_nodes
+    def compute_unit_counts_map(self, state: EnvState, params: EnvParams):
+        # map of total units per team on each tile, shape (num_teams, map_width, map_height)
+        return self.scatter_to_tiles(
+            state.units.position, state.units_mask.astype(jnp.int16)
         )
 
+    def compute_energy_features(self, state: EnvState, params: EnvParams, nodes_symmetric: bool = False):
+        """Compute the energy field of the energy nodes.
+
+        With EnvParams.exploit_map_symmetry the fields of only the first half of the energy nodes are computed when the
+        second half mirrors them, and mirrored to get the fields of the other half. Whether they do is checked unless
+        nodes_symmetric is True, which callers may only pass for energy nodes placed by gen_map_state that did not drift yet
+        """
+        # first compute a array of shape (num_energy_nodes, map_width, map_height) with values equal to the distance of the tile to the energy node
+        # by slicing the precomputed distance table
+        map_width = self.fixed_env_params.map_width
+        map_height = self.fixed_env_params.map_height
+
         def compute_energy_field(node_fn_spec, distances_to_node, mask):
             fn_i, x, y, z = node_fn_spec
             return jnp.where(
@@ -80,9 +239,42 @@ class LuxAIS3Env(environment.Environment):
                 jnp.zeros_like(distances_to_node),
             )
 
-        energy_field = jax.vmap(compute_energy_field)(
-            state.energy_node_fns, distances_to_nodes, state.energy_nodes_mask
-        )
+        def compute_energy_fields(energy_nodes, energy_node_fns, energy_nodes_mask):
+            distances_to_nodes = jax.vmap(
+                lambda pos: lax.dynamic_slice(
+                    self.energy_node_distances,
+                    start_indices=(map_width - pos[0], map_height - pos[1]),
+                    slice_sizes=(map_width, map_height),
+                )
+            )(energy_nodes)
+            return jax.vmap(compute_energy_field)(
+                energy_node_fns, distances_to_nodes, energy_nodes_mask
+            )
+
+        if self.fixed_env_params.exploit_map_symmetry:
+            half = self.fixed_env_params.max_energy_nodes // 2
+
+            def mirrored_energy_fields():
+                energy_field = compute_energy_fields(
+                    state.energy_nodes[:half], state.energy_node_fns[:half], state.energy_nodes_mask[:half]
+                )
+                # distances are symmetric under mirroring, so this is exactly the field of the mirrored nodes
+                return jnp.concatenate([energy_field, mirror_map(energy_field)])
+
+            if nodes_symmetric and map_width == map_height and self.fixed_env_params.max_energy_nodes % 2 == 0:
+                energy_field = mirrored_energy_fields()
+            else:
+                energy_field = lax.cond(
+                    nodes_are_symmetric(
+                        state.energy_nodes, map_width, map_height, state.energy_node_fns, state.energy_nodes_mask
+                    ),
+                    mirrored_energy_fields,
+                    lambda: compute_energy_fields(state.energy_nodes, state.energy_node_fns, state.energy_nodes_mask),
+                )
+        else:
+            energy_field = compute_energy_fields(
+                state.energy_nodes, state.energy_node_fns, state.energy_nodes_mask
+            )
         energy_field = jnp.where(
             energy_field.mean() < 0.25,
             energy_field + (0.25 - energy_field.mean()),
@@ -108,81 +300,53 @@ class LuxAIS3Env(environment.Environment):
 
         With 2 vision power maps, take the nebula vision mask * nebula vision power and subtract it from the vision power maps.
         Now any time the vision power map has value > 0, the team can sense the tile. This forms the sensor mask
-        """
 
-        max_sensor_range = env_params_ranges["unit_sensor_range"][-1]
-        vision_power_map_padding = max_sensor_range
-        vision_power_map = jnp.zeros(
-            shape=(
+        Without fog of war (see EnvParams.fog_of_war) nothing is computed, every tile is sensed and vision power is 0.
+        """
+        check_fog_of_war(params, self.fixed_env_params)
+        if not self.fixed_env_params.fog_of_war:
+            map_shape = (
                 self.fixed_env_params.num_teams,
-                self.fixed_env_params.map_height + 2 * vision_power_map_padding,
-                self.fixed_env_params.map_width + 2 * vision_power_map_padding,
-            ),
-            dtype=jnp.int16,
-        )
-
-        # Update sensor mask based on the sensor range
-        def update_vision_power_map(unit_pos, vision_power_map):
-            x, y = unit_pos
-            existing_vision_power = jax.lax.dynamic_slice(
-                vision_power_map,
-                start_indices=(
-                    x - max_sensor_range + vision_power_map_padding,
-                    y - max_sensor_range + vision_power_map_padding,
-                ),
-                slice_sizes=(
-                    max_sensor_range * 2 + 1,
-                    max_sensor_range * 2 + 1,
-                ),
+                self.fixed_env_params.map_width,
+                self.fixed_env_params.map_height,
             )
-            update = jnp.zeros_like(existing_vision_power)
-            for i in range(max_sensor_range + 1):
-                val = jnp.where(i > max_sensor_range - params.unit_sensor_range - 1, i + 1 - (max_sensor_range - params.unit_sensor_range), 0).astype(jnp.int16)
-                update = update.at[
-                    i : max_sensor_range * 2 + 1 - i,
-                    i : max_sensor_range * 2 + 1 - i,
-                ].set(val)
-            vision_power_map = jax.lax.dynamic_update_slice(
-                vision_power_map,
-                update=update + existing_vision_power,
-                start_indices=(
-                    x - max_sensor_range + vision_power_map_padding,
-                    y - max_sensor_range + vision_power_map_padding,
-                ),
+            return state.replace(
+                sensor_mask=jnp.ones(map_shape, dtype=jnp.bool),
+                vision_power_map=jnp.zeros(map_shape, dtype=jnp.int16),
             )
-            return vision_power_map
 
-        # Apply the sensor mask update for all units of both teams
-        def update_unit_vision_power_map(unit_pos, unit_mask, vision_power_map):
-            return jax.lax.cond(
-                unit_mask,
-                lambda: update_vision_power_map(unit_pos, vision_power_map),
-                lambda: vision_power_map,
+        max_sensor_range = env_params_ranges["unit_sensor_range"][-1]
+        map_width = self.fixed_env_params.map_width
+        map_height = self.fixed_env_params.map_height
+
+        # A unit gives unit_sensor_range + 1 - d vision power to tiles at chebyshev distance d <= unit_sensor_range.
+        # This equals the number of squares of radius r in [0, unit_sensor_range] around the unit that contain the tile,
+        # so the vision power map is a sum of box sums over the unit counts map, each computed from 2D prefix sums.
+        unit_counts_map = self.compute_unit_counts_map(state, params).astype(jnp.int32)
+        # pad so that every box lies inside the prefix sum table, with an extra leading row and column of zeros
+        prefix_sums = jnp.pad(
+            unit_counts_map,
+            (
+                (0, 0),
+                (max_sensor_range + 1, max_sensor_range),
+                (max_sensor_range + 1, max_sensor_range),
+            ),
+        )
+        prefix_sums = prefix_sums.cumsum(axis=1).cumsum(axis=2)
+        vision_power_map = jnp.zeros_like(unit_counts_map)
+        for r in range(max_sensor_range + 1):
+            lo = max_sensor_range - r
+            hi = max_sensor_range + r + 1
+            box_sums = (
+                prefix_sums[:, hi : hi + map_width, hi : hi + map_height]
+                - prefix_sums[:, lo : lo + map_width, hi : hi + map_height]
+                - prefix_sums[:, hi : hi + map_width, lo : lo + map_height]
+                + prefix_sums[:, lo : lo + map_width, lo : lo + map_height]
             )
-
-        def update_team_vision_power_map(team_units, unit_mask, vision_power_map):
-            def body_fun(carry, i):
-                vision_power_map = carry
-                return (
-                    update_unit_vision_power_map(
-                        team_units.position[i], unit_mask[i], vision_power_map
-                    ),
-                    None,
-                )
-
-            vision_power_map, _ = jax.lax.scan(
-                body_fun, vision_power_map, jnp.arange(self.fixed_env_params.max_units)
+            vision_power_map = vision_power_map + jnp.where(
+                r <= params.unit_sensor_range, box_sums, 0
             )
-            return vision_power_map
-
-        vision_power_map = jax.vmap(update_team_vision_power_map)(
-            state.units, state.units_mask, vision_power_map
-        )
-        vision_power_map = vision_power_map[
-            :,
-            vision_power_map_padding:-vision_power_map_padding,
-            vision_power_map_padding:-vision_power_map_padding,
-        ]
+        vision_power_map = vision_power_map.astype(jnp.int16)
         # handle nebula tiles
         vision_power_map = (
             vision_power_map
@@ -203,10 +367,38 @@ class LuxAIS3Env(environment.Environment):
         action: Union[int, float, chex.Array],
         params: EnvParams,
     ) -> Tuple[EnvObs, EnvState, jnp.ndarray, jnp.ndarray, jnp.ndarray, Dict[Any, Any]]:
+        state, reward, terminated, truncated, info = self.step_env_state(
+            key, state, action, params
+        )
+        return (
+            lax.stop_gradient(self.get_obs(state, params, key=key)),
+            state,
+            reward,
+            terminated,
+            truncated,
+            info,
+        )
 
+    def step_env_state(
+        self,
+        key: chex.PRNGKey,
+        state: EnvState,
+        action: Union[int, float, chex.Array],
+        params: EnvParams,
+    ) -> Tuple[EnvState, jnp.ndarray, jnp.ndarray, jnp.ndarray, Dict[Any, Any]]:
+        """Environment-specific step transition without building observations"""
+
+        # the energy field only changes when the energy nodes drifted at the end of the previous step, but it is recomputed
+        # every step: under jax.vmap a lax.cond on the drift condition lowers to a select that computes it anyway. Slicing
+        # the precomputed distance table keeps the recomputation cheap
         state = self.compute_energy_features(state, params)
 
-        action = jnp.stack([action["player_0"], action["player_1"]])
+        if isinstance(action, dict):
+            action = jnp.stack(
+                [action[f"player_{t}"] for t in range(self.fixed_env_params.num_teams)]
+            )
+        if self.egocentric:
+            action = action.at[1].set(egocentric_action(action[1], 1))
 
         # remove all units if the match ended in the previous step indicated by a reset of match_steps to 0
         state = state.replace(
@@ -279,179 +471,16 @@ class LuxAIS3Env(environment.Environment):
         """original amount of energy of all units"""
 
         """apply sap actions"""
-        sap_action_mask = action[..., 0] == 5
-        sap_action_deltas = action[..., 1:]
-
-        def sap_unit(
-            current_energy: jnp.ndarray,
-            all_units: UnitState,
-            sap_action_mask,
-            sap_action_deltas,
-            units_mask,
-        ):
-            # TODO (stao): clean up this code. It is probably slower than it needs be and could be vmapped perhaps.
-            for t in range(self.fixed_env_params.num_teams):
-                other_team_ids = jnp.array(
-                    [t2 for t2 in range(self.fixed_env_params.num_teams) if t2 != t]
-                )
-                team_sap_action_deltas = sap_action_deltas[t]  # (max_units, 2)
-                team_sap_action_mask = sap_action_mask[t]
-                other_team_unit_mask = units_mask[
-                    other_team_ids
-                ]  # (other_teams, max_units)
-                team_sapped_positions = (
-                    all_units.position[t] + team_sap_action_deltas
-                )  # (max_units, 2)
-                # whether the unit is really sapping or not (needs to exist, have enough energy, and a valid sap action)
-                team_unit_sapped = (
-                    units_mask[t]
-                    & team_sap_action_mask
-                    & (current_energy[t, :, 0] >= params.unit_sap_cost)
-                    & (
-                        jnp.max(jnp.abs(team_sap_action_deltas), axis=-1)
-                        <= params.unit_sap_range
-                    )
-                )  # (max_units)
-                team_unit_sapped = (
-                    team_unit_sapped
-                    & (team_sapped_positions >= 0).all(-1)
-                    & (team_sapped_positions[:, 0] < self.fixed_env_params.map_width)
-                    & (team_sapped_positions[:, 1] < self.fixed_env_params.map_height)
-                )
-                # the number of times other units are sapped
-                other_units_sapped_count = jnp.sum(
-                    jnp.all(
-                        all_units.position[other_team_ids][:, :, None]
-                        == team_sapped_positions[None],
-                        axis=-1,
-                    ),
-                    axis=-1,
-                    dtype=jnp.int16,
-                )  # (len(other_team_ids), max_units)
-                # remove unit_sap_cost energy from opposition units that were in the middle of a sap action.
-                all_units = all_units.replace(
-                    energy=all_units.energy.at[other_team_ids].set(
-                        jnp.where(
-                            team_unit_sapped[None, :, None]
-                            & other_team_unit_mask[:, :, None]
-                            & (other_units_sapped_count[:, :, None] > 0),
-                            all_units.energy[other_team_ids]
-                            - params.unit_sap_cost
-                            * other_units_sapped_count[:, :, None],
-                            all_units.energy[other_team_ids],
-                        )
-                    )
-                )
-
-                # remove unit_sap_cost * unit_sap_dropoff_factor energy from opposition units that were on tiles adjacent to the center of a sap action.
-                adjacent_offsets = jnp.array(
-                    [
-                        [-1, -1],
-                        [-1, 0],
-                        [-1, 1],
-                        [0, -1],
-                        [0, 1],
-                        [1, -1],
-                        [1, 0],
-                        [1, 1],
-                    ], dtype=jnp.int16
-                )
-                team_sapped_adjacent_positions = (
-                    team_sapped_positions[:, None, :] + adjacent_offsets
-                )  # (max_units, len(adjacent_offsets), 2)
-                other_units_adjacent_sapped_count = jnp.sum(
-                    jnp.all(
-                        all_units.position[other_team_ids][:, :, None]
-                        == team_sapped_adjacent_positions[None],
-                        axis=-1,
-                    ),
-                    axis=-1,
-                    dtype=jnp.int16,
-                )  # (len(other_team_ids), max_units)
-                all_units = all_units.replace(
-                    energy=all_units.energy.at[other_team_ids].set(
-                        jnp.where(
-                            team_unit_sapped[None, :, None]
-                            & other_team_unit_mask[:, :, None]
-                            & (other_units_adjacent_sapped_count[:, :, None] > 0),
-                            all_units.energy[other_team_ids]
-                            - jnp.array(
-                                params.unit_sap_cost.astype(jnp.float32)
-                                * params.unit_sap_dropoff_factor
-                                * other_units_adjacent_sapped_count[:, :, None].astype(jnp.float32),
-                                dtype=jnp.int16,
-                            ),
-                            all_units.energy[other_team_ids],
-                        )
-                    )
-                )
-
-                # remove unit_sap_cost energy from units that tried to sap some position within the unit's range
-                all_units = all_units.replace(
-                    energy=all_units.energy.at[t].set(
-                        jnp.where(
-                            team_unit_sapped[:, None],
-                            all_units.energy[t] - params.unit_sap_cost,
-                            all_units.energy[t],
-                        )
-                    )
-                )
-            return all_units
-
-        state = state.replace(
-            units=sap_unit(
-                original_unit_energy,
-                state.units,
-                sap_action_mask,
-                sap_action_deltas,
-                state.units_mask,
-            )
-        )
+        state = self.apply_sap_actions(state, action, params)
 
         """resolve collisions and energy void fields"""
 
         # compute energy void fields for all teams and the energy + unit counts
-        unit_aggregate_energy_void_map = jnp.zeros(
-            shape=(self.fixed_env_params.num_teams, self.fixed_env_params.map_width, self.fixed_env_params.map_height),
-            dtype=jnp.int16,
-        )
-        unit_counts_map = self.compute_unit_counts_map(state, params)
-        unit_aggregate_energy_map = jnp.zeros(
-            shape=(self.fixed_env_params.num_teams, self.fixed_env_params.map_width, self.fixed_env_params.map_height),
-            dtype=jnp.int16,
-        )
-        for t in range(self.fixed_env_params.num_teams):
-
-            def scan_body(carry, x):
-                agg_energy_void_map, agg_energy_map = carry
-                unit_energy, unit_position, unit_mask = x
-                agg_energy_map = agg_energy_map.at[
-                    unit_position[0], unit_position[1]
-                ].add(unit_energy[0] * unit_mask.astype(jnp.int16))
-                for deltas in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    new_pos = unit_position + jnp.array(deltas, dtype=jnp.int16)
-                    in_map = (
-                        (new_pos[0] >= 0)
-                        & (new_pos[0] < self.fixed_env_params.map_width)
-                        & (new_pos[1] >= 0)
-                        & (new_pos[1] < self.fixed_env_params.map_height)
-                    )
-                    agg_energy_void_map = agg_energy_void_map.at[
-                        new_pos[0], new_pos[1]
-                    ].add(unit_energy[0] * unit_mask.astype(jnp.int16) * in_map.astype(jnp.int16))
-                return (agg_energy_void_map, agg_energy_map), None
-
-            agg_energy_void_map, agg_energy_map = jax.lax.scan(
-                scan_body,
-                (unit_aggregate_energy_void_map[t], unit_aggregate_energy_map[t]),
-                (original_unit_energy[t], state.units.position[t], state.units_mask[t]),
-            )[0]
-            unit_aggregate_energy_void_map = unit_aggregate_energy_void_map.at[t].add(
-                agg_energy_void_map
-            )
-            unit_aggregate_energy_map = unit_aggregate_energy_map.at[t].add(
-                agg_energy_map
-            )
+        (
+            unit_counts_map,
+            unit_aggregate_energy_map,
+            unit_aggregate_energy_void_map,
+        ) = self.compute_unit_aggregates(state, original_unit_energy)
 
         # resolve collisions and keep only the surviving units
         for t in range(self.fixed_env_params.num_teams):
@@ -683,9 +712,8 @@ class LuxAIS3Env(environment.Environment):
             return jnp.sum(scores, dtype=jnp.int32)
 
         # note we need to recompue unit counts since units can get removed due to collisions
-        team_scores = jax.vmap(team_relic_score)(
-            self.compute_unit_counts_map(state, params)
-        )
+        unit_counts_map, _, _ = self.compute_unit_aggregates(state, state.units.energy)
+        team_scores = jax.vmap(team_relic_score)(unit_counts_map)
         # Update team points
         state = state.replace(team_points=state.team_points + team_scores)
 
@@ -735,7 +763,6 @@ class LuxAIS3Env(environment.Environment):
             reward[f"player_{k}"] = state.team_wins[k]
         terminated = self.is_terminal(state, params)
         return (
-            lax.stop_gradient(self.get_obs(state, params, key=key)),
             lax.stop_gradient(state),
             reward,
             terminated,
@@ -747,8 +774,17 @@ class LuxAIS3Env(environment.Environment):
         self, key: chex.PRNGKey, params: EnvParams
     ) -> Tuple[EnvObs, EnvState]:
         """Reset environment state by sampling initial position."""
+        state = self.reset_env_state(key, params)
+        return self.get_obs(state, params=params, key=key), state
 
-        state = gen_state(
+    def reset_env_state(self, key: chex.PRNGKey, params: EnvParams) -> EnvState:
+        """Reset environment state by sampling initial position without building observations."""
+        state = self.gen_map_state(key, params)
+        return self.init_map_state(state, params)
+
+    def gen_map_state(self, key: chex.PRNGKey, params: EnvParams) -> EnvState:
+        """Generate a new map. The returned state does not have the energy field and sensor masks computed yet, see init_map_state."""
+        return gen_state(
             key=key,
             env_params=params,
             max_units=self.fixed_env_params.max_units,
@@ -759,11 +795,23 @@ class LuxAIS3Env(environment.Environment):
             max_energy_nodes=self.fixed_env_params.max_energy_nodes,
             max_relic_nodes=self.fixed_env_params.max_relic_nodes,
             relic_config_size=self.fixed_env_params.relic_config_size,
+            exploit_map_symmetry=self.fixed_env_params.exploit_map_symmetry,
         )
-        state = self.compute_energy_features(state, params)
+
+    def init_map_state(self, state: EnvState, params: EnvParams) -> EnvState:
+        """Compute the parts of an initial state generated by gen_map_state that depend on the env params"""
+        state = self.compute_energy_features(state, params, nodes_symmetric=True)
         state = self.compute_sensor_masks(state, params)
+        return state
 
-        return self.get_obs(state, params=params, key=key), state
+    def reset_env_state_from_pool(
+        self, key: chex.PRNGKey, reset_pool: EnvState, params: EnvParams
+    ) -> EnvState:
+        """Reset environment state by picking a random map from a batch of maps generated by gen_map_state, see ResetPool."""
+        pool_size = jax.tree.leaves(reset_pool)[0].shape[0]
+        index = jax.random.randint(key, shape=(), minval=0, maxval=pool_size)
+        state = jax.tree.map(lambda x: x[index], reset_pool)
+        return self.init_map_state(state, params)
 
     @functools.partial(jax.jit, static_argnums=(0,))
     def step(
@@ -772,8 +820,13 @@ class LuxAIS3Env(environment.Environment):
         state: EnvState,
         action: Union[int, float, chex.Array],
         params: Optional[EnvParams] = None,
+        reset_pool: Optional[EnvState] = None,
     ) -> Tuple[EnvObs, EnvState, jnp.ndarray, jnp.ndarray, Dict[Any, Any]]:
-        """Performs step transitions in the environment."""
+        """Performs step transitions in the environment.
+
+        If auto_reset is enabled and a reset_pool of pre-generated maps is given (see ResetPool), finished episodes restart on
+        a map drawn from the pool instead of generating a new map.
+        """
         # Use default env parameters if no others specified
         if params is None:
             params = self.default_params
@@ -786,7 +839,11 @@ class LuxAIS3Env(environment.Environment):
         done = terminated | truncated
         
         if self.auto_reset:
-            obs_re, state_re = self.reset_env(key_reset, params)
+            if reset_pool is None:
+                obs_re, state_re = self.reset_env(key_reset, params)
+            else:
+                state_re = self.reset_env_state_from_pool(key_reset, reset_pool, params)
+                obs_re = self.get_obs(state_re, params=params, key=key_reset)
             # Use lax.cond to efficiently choose between obs_re and obs_st
             obs = jax.lax.cond(
                 done,
@@ -811,6 +868,100 @@ class LuxAIS3Env(environment.Environment):
             info[f"player_{k}"] = dict()
         return obs, state, reward, terminated_dict, truncated_dict, info
 
+    @functools.partial(jax.jit, static_argnums=(0,))
+    def step_state(
+        self,
+        key: chex.PRNGKey,
+        state: EnvState,
+        action: Union[int, float, chex.Array],
+        params: Optional[EnvParams] = None,
+        reset_pool: Optional[EnvState] = None,
+    ) -> Tuple[EnvState, Dict[str, jnp.ndarray], Dict[str, jnp.ndarray], Dict[str, jnp.ndarray]]:
+        """Performs step transitions in the environment without building observations.
+
+        Produces the same next state, rewards, terminations and truncations as step given the same key but skips
+        get_obs and the info dict (which duplicates the final state and observation). This is meant for search and
+        rollouts that only need states and rewards, so scans over it only carry and stack the state. reset_pool is used
+        like in step.
+        """
+        if params is None:
+            params = self.default_params
+        key, key_reset = jax.random.split(key)
+        state_st, reward, terminated, truncated, _ = self.step_env_state(
+            key, state, action, params
+        )
+        done = terminated | truncated
+
+        if self.auto_reset:
+            if reset_pool is None:
+                state_re = self.reset_env_state(key_reset, params)
+            else:
+                state_re = self.reset_env_state_from_pool(key_reset, reset_pool, params)
+            state = jax.lax.cond(
+                done,
+                lambda: state_re,
+                lambda: state_st
+            )
+        else:
+            state = state_st
+
+        terminated_dict = dict()
+        truncated_dict = dict()
+        for k in range(self.fixed_env_params.num_teams):
+            terminated_dict[f"player_{k}"] = terminated
+            truncated_dict[f"player_{k}"] = truncated
+        return state, reward, terminated_dict, truncated_dict
+
+    @functools.partial(jax.jit, static_argnums=(0,), donate_argnums=(2,))
+    def step_donated(
+        self,
+        key: chex.PRNGKey,
+        state: EnvState,
+        constants: EnvConstants,
+        action: Union[int, float, chex.Array],
+        params: Optional[EnvParams] = None,
+        reset_pool: Optional[EnvState] = None,
+    ) -> Tuple[EnvObs, EnvState, EnvConstants, Dict[str, jnp.ndarray], Dict[str, jnp.ndarray], Dict[str, jnp.ndarray]]:
+        """Performs step transitions in the environment in place, for large batches of states.
+
+        state and constants are a state split with split_env_state. Only state, the part that changes every step, is donated:
+        its buffers are reused for the returned state instead of allocating new ones and can not be used after the call.
+        The constants are only read and stay valid. Pass the returned constants to the next call, they are the given ones
+        unless auto_reset is enabled and an episode ended, in which case they are the constants of the new episode.
+        jax.vmap(env.step_donated) donates the batched state as well.
+
+        Produces the same observations, rewards, terminations and truncations as step given the same key, but no info dict
+        (which duplicates the final state and observation). reset_pool is used like in step.
+        """
+        if params is None:
+            params = self.default_params
+        state = merge_env_state(state, constants)
+        key, key_reset = jax.random.split(key)
+        obs, state, reward, terminated, truncated, _ = self.step_env(
+            key, state, action, params
+        )
+        done = terminated | truncated
+
+        if self.auto_reset:
+            if reset_pool is None:
+                obs_re, state_re = self.reset_env(key_reset, params)
+            else:
+                state_re = self.reset_env_state_from_pool(key_reset, reset_pool, params)
+                obs_re = self.get_obs(state_re, params=params, key=key_reset)
+            obs, state = jax.lax.cond(
+                done,
+                lambda: (obs_re, state_re),
+                lambda: (obs, state)
+            )
+        state, constants = split_env_state(state)
+
+        terminated_dict = dict()
+        truncated_dict = dict()
+        for k in range(self.fixed_env_params.num_teams):
+            terminated_dict[f"player_{k}"] = terminated
+            truncated_dict[f"player_{k}"] = truncated
+        return obs, state, constants, reward, terminated_dict, truncated_dict
+
     @functools.partial(jax.jit, static_argnums=(0,))
     def reset(
         self, key: chex.PRNGKey, params: Optional[EnvParams] = None
@@ -823,40 +974,190 @@ class LuxAIS3Env(environment.Environment):
         obs, state = self.reset_env(key, params)
         return obs, state
 
-    # @functools.partial(jax.jit, static_argnums=(0, 2))
-    def get_obs(self, state: EnvState, params=None, key=None) -> EnvObs:
-        """Return observation from raw state, handling partial observability."""
-        obs = dict()
+    @functools.partial(jax.jit, static_argnums=(0,))
+    def reset_from_bank(
+        self, key: chex.PRNGKey, map_state: EnvState, params: Optional[EnvParams] = None
+    ) -> Tuple[chex.Array, EnvState]:
+        """Performs resetting of environment on a map loaded from a MapBank instead of generating a new map.
 
-        def update_unit_mask(unit_position, unit_mask, sensor_mask):
-            return unit_mask & sensor_mask[unit_position[0], unit_position[1]]
+        map_state is a state generated by gen_map_state, e.g. MapBank.get(seed). Resetting with the key the map was generated
+        from gives the same observation and state as reset.
+        """
+        if params is None:
+            params = self.default_params
 
-        def update_team_unit_mask(unit_position, unit_mask, sensor_mask):
-            return jax.vmap(update_unit_mask, in_axes=(0, 0, None))(
-                unit_position, unit_mask, sensor_mask
-            )
+        state = self.init_map_state(map_state, params)
+        return self.get_obs(state, params=params, key=key), state
 
-        def update_relic_nodes_mask(relic_nodes_mask, relic_nodes, sensor_mask):
-            return jax.vmap(
-                lambda r_mask, r, s_mask: r_mask & s_mask[r[0], r[1]],
-                in_axes=(0, 0, None),
-            )(relic_nodes_mask, relic_nodes, sensor_mask)
+    def rollout(
+        self,
+        key: chex.PRNGKey,
+        state: EnvState,
+        params: EnvParams,
+        policy_fn: Callable[[chex.PRNGKey, EnvObs], Any],
+        num_steps: int,
+        outputs: Tuple[str, ...] = ("reward", "terminated", "truncated"),
+        start_step: int = 0,
+    ) -> Tuple[EnvObs, EnvState, Dict[str, Any]]:
+        """Roll out policy_fn(key, obs) -> action for num_steps steps starting from state.
+
+        Episodes always last (max_steps_in_match + 1) * match_count_per_episode steps of fixed_env_params, so instead of
+        auto resetting (which evaluates reset_env every step) the rollout is split into lax.scan chunks that end exactly at
+        episode boundaries, and the env is only reset between chunks. start_step is the number of steps already taken in
+        the episode of the given state, from 0 up to the episode length. If the rollout ends at an episode boundary the
+        final state is not reset.
+
+        Episodes are truncated by the max_steps_in_match and match_count_per_episode of params, so these must equal the
+        ones of fixed_env_params. This is checked unless params are traced, e.g. when calling rollout under jax.vmap.
+
+        outputs selects which of "obs", "state", "compact_state", "action", "reward", "terminated" and "truncated" are stacked
+        over time. "compact_state" stacks the states packed with pack_env_state, which take several times less memory. States
+        are packed under jit where pack_env_state can not check them, so params are checked with check_packable_params
+        instead, again unless they are traced.
+        Returns the final observation, the final state and a dict of the selected outputs with a leading num_steps axis.
+        """
+        for name in outputs:
+            if name not in ["obs", "state", "compact_state", "action", "reward", "terminated", "truncated"]:
+                raise ValueError(f"{name} is not a valid rollout output")
+        episode_length = (
+            self.fixed_env_params.max_steps_in_match + 1
+        ) * self.fixed_env_params.match_count_per_episode
+        if not 0 <= start_step <= episode_length:
+            raise ValueError(f"start_step must be between 0 and the episode length {episode_length}, got {start_step}")
+        for name in ["max_steps_in_match", "match_count_per_episode"]:
+            value = getattr(params, name)
+            if not isinstance(value, jax.core.Tracer) and int(value) != getattr(self.fixed_env_params, name):
+                raise ValueError(
+                    f"params.{name} is {int(value)} but rollout splits episodes by fixed_env_params.{name}, which is "
+                    f"{getattr(self.fixed_env_params, name)}"
+                )
+        if "compact_state" in outputs:
+            check_packable_params(params, self.fixed_env_params)
+        return self._rollout(key, state, params, policy_fn, num_steps, tuple(outputs), start_step)
 
-        for t in range(self.fixed_env_params.num_teams):
-            other_team_ids = jnp.array(
-                [t2 for t2 in range(self.fixed_env_params.num_teams) if t2 != t]
+    @functools.partial(jax.jit, static_argnums=(0, 4, 5, 6, 7))
+    def _rollout(
+        self,
+        key: chex.PRNGKey,
+        state: EnvState,
+        params: EnvParams,
+        policy_fn: Callable[[chex.PRNGKey, EnvObs], Any],
+        num_steps: int,
+        outputs: Tuple[str, ...],
+        start_step: int,
+    ) -> Tuple[EnvObs, EnvState, Dict[str, Any]]:
+        episode_length = (
+            self.fixed_env_params.max_steps_in_match + 1
+        ) * self.fixed_env_params.match_count_per_episode
+
+        def take_step(carry, _):
+            key, obs, state = carry
+            key, policy_key, step_key = jax.random.split(key, 3)
+            action = policy_fn(policy_key, obs)
+            obs, state, reward, terminated, truncated, _ = self.step_env(
+                step_key, state, action, params
             )
-            new_unit_masks = jax.vmap(update_team_unit_mask, in_axes=(0, 0, None))(
-                state.units.position[other_team_ids],
-                state.units_mask[other_team_ids],
-                state.sensor_mask[t],
+            step_outputs = dict(
+                obs=obs,
+                state=state,
+                compact_state=pack_env_state(state, self.fixed_env_params),
+                action=action,
+                reward=reward,
+                terminated=terminated,
+                truncated=truncated,
             )
-            new_unit_masks = state.units_mask.at[other_team_ids].set(new_unit_masks)
+            return (key, obs, state), {name: step_outputs[name] for name in outputs}
 
-            new_relic_nodes_mask = update_relic_nodes_mask(
-                state.relic_nodes_mask, state.relic_nodes, state.sensor_mask[t]
+        def run_chunk(key, obs, state, length):
+            (key, obs, state), chunk_outputs = jax.lax.scan(
+                take_step, (key, obs, state), length=length
             )
-            team_obs = EnvObs(
+            return key, obs, state, chunk_outputs
+
+        def reset_and_run_episode(carry, _):
+            key, _, _ = carry
+            key, reset_key = jax.random.split(key)
+            obs, state = self.reset_env(reset_key, params)
+            key, obs, state, episode_outputs = run_chunk(key, obs, state, episode_length)
+            return (key, obs, state), episode_outputs
+
+        # the first chunk finishes the current episode, then come full episodes and a final partial episode
+        first_chunk_length = min(num_steps, episode_length - start_step)
+        num_full_episodes = (num_steps - first_chunk_length) // episode_length
+        last_chunk_length = num_steps - first_chunk_length - num_full_episodes * episode_length
+
+        all_outputs = []
+        obs = self.get_obs(state, params=params, key=key)
+        key, obs, state, chunk_outputs = run_chunk(key, obs, state, first_chunk_length)
+        all_outputs.append(chunk_outputs)
+        if num_full_episodes > 0:
+            (key, obs, state), episode_outputs = jax.lax.scan(
+                reset_and_run_episode, (key, obs, state), length=num_full_episodes
+            )
+            all_outputs.append(
+                jax.tree.map(
+                    lambda x: x.reshape((num_full_episodes * episode_length,) + x.shape[2:]),
+                    episode_outputs,
+                )
+            )
+        if last_chunk_length > 0:
+            key, reset_key = jax.random.split(key)
+            obs, state = self.reset_env(reset_key, params)
+            key, obs, state, chunk_outputs = run_chunk(key, obs, state, last_chunk_length)
+            all_outputs.append(chunk_outputs)
+        all_outputs = jax.tree.map(
+            lambda *xs: jnp.concatenate(xs, axis=0), *all_outputs
+        )
+        return obs, state, all_outputs
+
+    # @functools.partial(jax.jit, static_argnums=(0, 2))
+    def get_obs(self, state: EnvState, params=None, key=None) -> EnvObs:
+        """Return observation from raw state, handling partial observability.
+
+        By default this is a dict mapping player_k to the observation of team k. If the env was created with stacked_obs=True
+        this returns the observations of all teams stacked along a leading team axis instead, see get_stacked_obs. If the
+        env was created with egocentric=True, the observation of player_1 is in its egocentric frame.
+        """
+        stacked_obs = self.get_stacked_obs(state, params=params, key=key)
+        if self.stacked_obs and not self.egocentric:
+            return stacked_obs
+        obs = dict()
+        for t in range(self.fixed_env_params.num_teams):
+            obs[f"player_{t}"] = jax.tree.map(lambda x: x[t], stacked_obs)
+            if self.egocentric:
+                obs[f"player_{t}"] = egocentric_obs(obs[f"player_{t}"], t, self.fixed_env_params)
+        if self.stacked_obs:
+            return jax.tree.map(lambda *x: jnp.stack(x), *obs.values())
+        return obs
+
+    def get_stacked_obs(self, state: EnvState, params=None, key=None) -> EnvObs:
+        """Return the observations of all teams as one EnvObs where every array has a leading team axis of size num_teams.
+
+        The observations are computed with one vmap over the team axis. Without fog of war every team observes all units, relic
+        nodes and tiles, and nothing is masked by the sensor masks.
+        """
+        num_teams = self.fixed_env_params.num_teams
+        fog_of_war = self.fixed_env_params.fog_of_war
+
+        def get_team_obs(team_id, sensor_mask):
+            new_unit_masks = state.units_mask
+            new_relic_nodes_mask = state.relic_nodes_mask
+            map_features = state.map_features
+            if fog_of_war:
+                # units of other teams are only visible if they are on a tile the team can sense
+                new_unit_masks = new_unit_masks & (
+                    sensor_mask[state.units.position[..., 0], state.units.position[..., 1]]
+                    | (jnp.arange(num_teams) == team_id)[:, None]
+                )
+                new_relic_nodes_mask = (
+                    new_relic_nodes_mask
+                    & sensor_mask[state.relic_nodes[:, 0], state.relic_nodes[:, 1]]
+                )
+                map_features = MapTile(
+                    energy=jnp.where(sensor_mask, map_features.energy, -1),
+                    tile_type=jnp.where(sensor_mask, map_features.tile_type, -1),
+                )
+            return EnvObs(
                 units=UnitState(
                     position=jnp.where(
                         new_unit_masks[..., None], state.units.position, -1
@@ -866,15 +1167,8 @@ class LuxAIS3Env(environment.Environment):
                     ],
                 ),
                 units_mask=new_unit_masks,
-                sensor_mask=state.sensor_mask[t],
-                map_features=MapTile(
-                    energy=jnp.where(
-                        state.sensor_mask[t], state.map_features.energy, -1
-                    ),
-                    tile_type=jnp.where(
-                        state.sensor_mask[t], state.map_features.tile_type, -1
-                    ),
-                ),
+                sensor_mask=sensor_mask,
+                map_features=map_features,
                 team_points=state.team_points,
                 team_wins=state.team_wins,
                 steps=state.steps,
@@ -884,8 +1178,8 @@ class LuxAIS3Env(environment.Environment):
                 ),
                 relic_nodes_mask=new_relic_nodes_mask,
             )
-            obs[f"player_{t}"] = team_obs
-        return obs
+
+        return jax.vmap(get_team_obs)(jnp.arange(num_teams), state.sensor_mask)
 
     @functools.partial(jax.jit, static_argnums=(0, ))
     def is_terminal(self, state: EnvState, params: EnvParams) -> jnp.ndarray:
@@ -920,3 +1214,56 @@ class LuxAIS3Env(environment.Environment):
         return spaces.Discrete(10)
 
 
+
+
+class ResetPool:
+    """Device resident pool of pre-generated maps for cheap auto resets.
+
+    With auto_reset=True, LuxAIS3Env.step normally generates a new map with reset_env every step and discards it unless
+    the episode ended. Passing reset_pool=pool.get() to step or step_state instead draws a random map from this pool with
+    a gather and only computes the parts of the initial state that depend on the env params.
+
+    All auto resets draw from the same size maps until the pool is refilled, so with few maps episodes repeat maps.
+    refill generates a new batch of maps. If refill_every is given, get refills the pool itself every refill_every calls,
+    e.g. every refill_every steps when called once per step. JAX dispatches the generation asynchronously, so refilling
+    returns immediately and only steps that use the new pool wait for it to be ready.
+    """
+
+    def __init__(
+        self,
+        env: LuxAIS3Env,
+        size: int,
+        key: chex.PRNGKey,
+        params: Optional[EnvParams] = None,
+        refill_every: Optional[int] = None,
+    ):
+        self.env = env
+        self.size = size
+        self.key = key
+        self.params = params if params is not None else env.default_params
+        self.refill_every = refill_every
+        """number of calls to get after which the pool is refilled, or None to only refill when refill is called"""
+        self._gen_map_states = jax.jit(
+            jax.vmap(env.gen_map_state, in_axes=(0, None))
+        )
+        self.states: EnvState = None
+        """batch of size maps generated by env.gen_map_state"""
+        self.map_keys: chex.PRNGKey = None
+        """keys the maps were generated from. reset_env_state with map_keys[i] gives the initial state of map i"""
+        self.uses = 0
+        """number of calls to get since the last refill"""
+        self.refill()
+
+    def get(self) -> EnvState:
+        """Returns the maps to pass as reset_pool, refilling the pool first if it was used refill_every times"""
+        if self.refill_every is not None and self.uses >= self.refill_every:
+            self.refill()
+        self.uses += 1
+        return self.states
+
+    def refill(self):
+        """Replace the pool with a newly generated batch of maps"""
+        self.key, subkey = jax.random.split(self.key)
+        self.map_keys = jax.random.split(subkey, self.size)
+        self.states = self._gen_map_states(self.map_keys, self.params)
+        self.uses = 0
@@ -0,0 +1,158 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Iterable
+
+import flax.serialization
+import flax.traverse_util
+import jax
+import jax.numpy as jnp
+import numpy as np
+import tyro
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams
+from luxai_s3.state import EnvState
+
+MAP_BANK_FIXED_PARAMS = [
+    "max_units",
+    "num_teams",
+    "map_type",
+    "map_width",
+    "map_height",
+    "max_energy_nodes",
+    "max_relic_nodes",
+    "relic_config_size",
+]
+"""fixed env params that generated maps depend on. Maps generated with the same seed and these params are identical"""
+
+
+def map_bank_key(fixed_env_params: EnvParams) -> str:
+    """Name of the directory in a map bank holding maps generated with the given fixed env params"""
+    return "_".join(f"{k}={getattr(fixed_env_params, k)}" for k in MAP_BANK_FIXED_PARAMS)
+
+
+def map_key_from_seed(seed) -> jax.Array:
+    """The key a map is generated from for a given seed. This matches the map LuxAIS3GymEnv.reset(seed=seed) generates"""
+    return jax.random.split(jax.random.key(seed))[1]
+
+
+class MapBank:
+    """On-disk store of generated maps keyed by seed and fixed env params.
+
+    Maps are the initial states generated by LuxAIS3Env.gen_map_state. They only depend on the seed and the fixed env
+    params, the parts depending on the other env params are computed when resetting with LuxAIS3Env.reset_from_bank.
+
+    Each field of the generated EnvState is stored as one .npy file batched over seeds and memory-mapped on load, so
+    looking up a map only reads that map from disk.
+    """
+
+    def __init__(self, path: str, fixed_env_params: EnvParams = EnvParams()):
+        self.fixed_env_params = fixed_env_params
+        self.path = os.path.join(path, map_bank_key(fixed_env_params))
+        self._env = LuxAIS3Env(auto_reset=False, fixed_env_params=fixed_env_params)
+        self._template: EnvState = jax.eval_shape(
+            self._env.gen_map_state, jax.random.key(0), fixed_env_params
+        )
+        self._gen_map_states = jax.jit(
+            jax.vmap(
+                lambda seed: self._env.gen_map_state(
+                    map_key_from_seed(seed), fixed_env_params
+                )
+            )
+        )
+        self.seeds: np.ndarray = np.zeros((0,), dtype=np.int64)
+        """seeds of all maps in the bank, in the order they are stored"""
+        self._seed_index: dict[int, int] = dict()
+        self._arrays: dict[str, np.ndarray] = dict()
+        self._load()
+
+    def _load(self):
+        seeds_path = os.path.join(self.path, "seeds.npy")
+        if not os.path.isfile(seeds_path):
+            return
+        self.seeds = np.load(seeds_path)
+        self._seed_index = {int(seed): i for i, seed in enumerate(self.seeds)}
+        self._arrays = {
+            name: np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+            for name in self._field_names()
+        }
+
+    def _field_names(self) -> list[str]:
+        return list(
+            flax.traverse_util.flatten_dict(
+                flax.serialization.to_state_dict(self._template), sep="."
+            ).keys()
+        )
+
+    def __len__(self) -> int:
+        return len(self.seeds)
+
+    def __contains__(self, seed: int) -> bool:
+        return int(seed) in self._seed_index
+
+    def get(self, seed: int) -> EnvState:
+        """Returns the map generated with the given seed as an EnvState of numpy arrays. Raises a KeyError if the bank does
+        not have the seed"""
+        index = self._seed_index[int(seed)]
+        fields = {name: np.asarray(array[index]) for name, array in self._arrays.items()}
+        return flax.serialization.from_state_dict(
+            self._template, flax.traverse_util.unflatten_dict(fields, sep=".")
+        )
+
+    def add(self, seeds: Iterable[int], batch_size: int = 1024):
+        """Generate the maps of the given seeds that are not in the bank yet and save them to disk"""
+        new_seeds = []
+        for seed in seeds:
+            if int(seed) not in self._seed_index and int(seed) not in new_seeds:
+                new_seeds.append(int(seed))
+        if len(new_seeds) == 0:
+            return
+        batches = []
+        for i in range(0, len(new_seeds), batch_size):
+            batch = self._gen_map_states(jnp.array(new_seeds[i : i + batch_size]))
+            batches.append(
+                flax.traverse_util.flatten_dict(
+                    flax.serialization.to_state_dict(jax.device_get(batch)), sep="."
+                )
+            )
+
+        os.makedirs(self.path, exist_ok=True)
+        for name in self._field_names():
+            values = [np.asarray(batch[name]) for batch in batches]
+            if name in self._arrays:
+                values = [np.asarray(self._arrays[name])] + values
+            self._save(name, np.concatenate(values, axis=0))
+        with open(os.path.join(self.path, "fixed_env_params.json"), "w") as f:
+            json.dump(
+                {k: getattr(self.fixed_env_params, k) for k in MAP_BANK_FIXED_PARAMS}, f
+            )
+        # seeds are written last so an interrupted add leaves the previous bank readable
+        self._save("seeds", np.concatenate([self.seeds, np.array(new_seeds, dtype=np.int64)]))
+        self._load()
+
+    def _save(self, name: str, array: np.ndarray):
+        tmp_path = os.path.join(self.path, f"{name}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(self.path, f"{name}.npy"))
+
+
+@dataclass
+class Args:
+    path: tyro.conf.Positional[str]
+    """Directory of the map bank"""
+    num_seeds: int = 1000
+    """Number of maps to generate"""
+    start_seed: int = 0
+    """Maps are generated for the seeds start_seed, start_seed + 1, ..., start_seed + num_seeds - 1"""
+    batch_size: int = 1024
+
+
+if __name__ == "__main__":
+    args = tyro.cli(Args)
+    bank = MapBank(args.path)
+    bank.add(
+        range(args.start_seed, args.start_seed + args.num_seeds),
+        batch_size=args.batch_size,
+    )
+    print(f"Map bank at {bank.path} has {len(bank)} maps")
@@ -0,0 +1,675 @@
+import dataclasses
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from luxai_s3.egocentric import egocentric_action, egocentric_obs
+from luxai_s3.params import MAP_TYPES, EnvParams, check_fog_of_war, env_params_ranges
+from luxai_s3.pygame_render import LuxAIPygameRenderer
+from luxai_s3.state import (
+    ASTEROID_TILE,
+    NEBULA_TILE,
+    EnvObs,
+    EnvState,
+    MapTile,
+    UnitState,
+)
+
+NUMPY_ENV_PARAMS_DTYPES = {int: np.int16, float: np.float32, bool: np.bool_}
+"""numpy dtype of the dynamic EnvParams fields of each annotated type, matching luxai_s3.params.ENV_PARAMS_DTYPES"""
+
+ENERGY_NODE_FNS = [
+    lambda d, x, y, z: np.sin(d * x + y) * z,
+    lambda d, x, y, z: (x / (d + 1) + y) * z,
+]
+"""numpy versions of luxai_s3.state.ENERGY_NODE_FNS"""
+
+DIRECTIONS = np.array([[0, 0], [0, -1], [1, 0], [0, 1], [-1, 0]], dtype=np.int16)
+"""movement of the move actions 0 to 4, see LuxAIS3Env.step_env_state"""
+
+
+def to_numpy_env_params(params: EnvParams) -> EnvParams:
+    """Returns params with every dynamic field converted to a numpy scalar of the dtype canonicalize_env_params gives it.
+
+    NumpyLuxAIS3Env does all arithmetic with params of these dtypes so it rounds and overflows exactly like LuxAIS3Env with
+    canonicalized params. Params may hold python scalars, numpy values or jax arrays.
+    """
+    return params.replace(
+        **{
+            field.name: NUMPY_ENV_PARAMS_DTYPES[field.type](np.asarray(getattr(params, field.name)))
+            for field in dataclasses.fields(params)
+            if field.metadata.get("pytree_node", True)
+        }
+    )
+
+
+def sample_numpy_env_params(
+    rng: np.random.Generator,
+    ranges: Dict[str, list] = env_params_ranges,
+    params: EnvParams = EnvParams(),
+) -> EnvParams:
+    """Sample randomized env params with a numpy generator, drawing every field in ranges uniformly from its list of values
+    like sample_env_params. Returns params converted with to_numpy_env_params"""
+    return to_numpy_env_params(
+        params.replace(**{name: values[rng.integers(len(values))] for name, values in ranges.items()})
+    )
+
+
+def generate_perlin_noise_2d(rng: np.random.Generator, shape, res, interpolant=lambda t: t * t * t * (t * (t * 6 - 15) + 10)):
+    """numpy version of luxai_s3.state.generate_perlin_noise_2d"""
+    delta = (res[0] / shape[0], res[1] / shape[1])
+    d = (shape[0] // res[0], shape[1] // res[1])
+    grid = np.mgrid[0 : res[0] : delta[0], 0 : res[1] : delta[1]].transpose(1, 2, 0) % 1
+    angles = 2 * np.pi * rng.uniform(size=(res[0] + 1, res[1] + 1))
+    gradients = np.dstack((np.cos(angles), np.sin(angles)))
+    gradients = gradients.repeat(d[0], 0).repeat(d[1], 1)
+    g00 = gradients[: -d[0], : -d[1]]
+    g10 = gradients[d[0] :, : -d[1]]
+    g01 = gradients[: -d[0], d[1] :]
+    g11 = gradients[d[0] :, d[1] :]
+    n00 = np.sum(np.dstack((grid[:, :, 0], grid[:, :, 1])) * g00, 2)
+    n10 = np.sum(np.dstack((grid[:, :, 0] - 1, grid[:, :, 1])) * g10, 2)
+    n01 = np.sum(np.dstack((grid[:, :, 0], grid[:, :, 1] - 1)) * g01, 2)
+    n11 = np.sum(np.dstack((grid[:, :, 0] - 1, grid[:, :, 1] - 1)) * g11, 2)
+    t = interpolant(grid)
+    n0 = n00 * (1 - t[:, :, 0]) + t[:, :, 0] * n10
+    n1 = n01 * (1 - t[:, :, 0]) + t[:, :, 0] * n11
+    return np.sqrt(2) * ((1 - t[:, :, 1]) * n0 + t[:, :, 1] * n1)
+
+
+class StepNoise(NamedTuple):
+    """The random values consumed by one step"""
+
+    energy_node_deltas: np.ndarray
+    """drift of the first max_energy_nodes // 2 energy nodes, shape (max_energy_nodes // 2, 2). The other half drifts
+    symmetrically"""
+    tie_break_winner: int
+    """team that wins a match ending with equal points and equal unit energy"""
+
+
+class NumpyLuxAIS3Env:
+    """Experimental pure numpy implementation of the rules of LuxAIS3Env for stepping a single game with low latency.
+    LuxAIS3Env remains the reference implementation of the rules.
+
+    States and observations are the same EnvState and EnvObs structures holding numpy arrays of the same shapes and dtypes
+    as LuxAIS3Env with canonicalized params. Nothing is traced or compiled and no jax arrays are created, so there is no
+    startup cost, and a step is about two hundred small numpy operations on arrays of at most num_teams * max_units units
+    instead of a device dispatch plus host transfers. Its latency is bound by the fixed cost of each numpy call rather than
+    by the work done, on a machine where a small numpy call costs 1-2us a step takes about 0.4ms, see
+    tests/benchmark_numpy_env.py.
+
+    Given the same state, actions and StepNoise, step gives exactly the same next state and observations as LuxAIS3Env.step
+    (see tests/test_numpy_env.py). reset and step draw randomness from a numpy Generator, so they play different games
+    than LuxAIS3Env from the same seed. LuxAIS3GymEnv with the numpy engine instead draws the params, map and StepNoise of
+    each step from the same jax keys as the jax engine, so the same seed plays the same game with both engines.
+    """
+
+    def __init__(self, fixed_env_params: EnvParams = EnvParams(), egocentric: bool = False):
+        self.renderer = LuxAIPygameRenderer()
+        self.fixed_env_params = fixed_env_params
+        self.egocentric = egocentric
+        """whether player_1 observes and acts in its egocentric frame, see LuxAIS3Env.egocentric"""
+        num_teams = fixed_env_params.num_teams
+        max_units = fixed_env_params.max_units
+        map_width = fixed_env_params.map_width
+        map_height = fixed_env_params.map_height
+        dx, dy = np.meshgrid(
+            np.arange(-map_width, map_width + 1),
+            np.arange(-map_height, map_height + 1),
+            indexing="ij",
+        )
+        self.energy_node_distances = np.sqrt((dx**2 + dy**2).astype(np.float32))
+        """same distance table as LuxAIS3Env.energy_node_distances"""
+        # units of all teams are handled as one flat axis of num_teams * max_units units
+        unit_team = np.repeat(np.arange(num_teams), max_units)
+        self._own_team = unit_team[:, None] == np.arange(num_teams)
+        """whether unit u is on team t, shape (num_teams * max_units, num_teams)"""
+        self._own_team_f32 = self._own_team.astype(np.float32)
+        self._earlier_teammate = (unit_team[:, None] == unit_team[None, :]) & np.tri(
+            len(unit_team), k=-1, dtype=np.bool_
+        )
+        """whether unit v is a teammate of unit u with a lower index, shape (num_teams * max_units, num_teams * max_units)"""
+        self._max_position = np.array([map_width - 1, map_height - 1], dtype=np.int16)
+        self._spawn_positions = np.array([[0, 0], [map_width - 1, map_height - 1]], dtype=np.int16)
+        """tile new units of each team spawn on, the corners LuxAIS3Env spawns team 0 and team 1 on"""
+        if num_teams != len(self._spawn_positions):
+            raise ValueError(f"num_teams is {num_teams} but spawn positions are only defined for {len(self._spawn_positions)} teams")
+        sensor_ranges = np.arange(env_params_ranges["unit_sensor_range"][-1] + 1)[:, None]
+        xs = np.arange(map_width)
+        ys = np.arange(map_height)
+        self._sensor_square_rows = (np.abs(xs - xs[:, None, None]) <= sensor_ranges).astype(np.float32)
+        """whether row x2 is in the square of radius r around row x, indexed by [x, r, x2]"""
+        self._sensor_square_cols = (np.abs(ys - ys[:, None, None]) <= sensor_ranges).astype(np.float32)
+        """whether column y2 is in the square of radius r around column y, indexed by [y, r, y2]"""
+
+    @property
+    def default_params(self) -> EnvParams:
+        return to_numpy_env_params(self.fixed_env_params)
+
+    def compute_energy_features(self, state: EnvState, params: EnvParams) -> EnvState:
+        map_width = self.fixed_env_params.map_width
+        map_height = self.fixed_env_params.map_height
+        energy_field = np.zeros(
+            (len(state.energy_nodes), map_width, map_height), dtype=np.float32
+        )
+        for i, (pos, (fn_i, x, y, z), mask) in enumerate(
+            zip(state.energy_nodes, state.energy_node_fns, state.energy_nodes_mask)
+        ):
+            if mask:
+                distances_to_node = self.energy_node_distances[
+                    map_width - pos[0] : 2 * map_width - pos[0],
+                    map_height - pos[1] : 2 * map_height - pos[1],
+                ]
+                energy_field[i] = ENERGY_NODE_FNS[int(fn_i)](distances_to_node, x, y, z)
+        mean = energy_field.mean(dtype=np.float32)
+        if mean < 0.25:
+            energy_field = energy_field + (np.float32(0.25) - mean)
+        energy_field = np.round(energy_field.sum(0)).astype(np.int16)
+        energy_field = np.clip(
+            energy_field, params.min_energy_per_tile, params.max_energy_per_tile
+        )
+        return state.replace(
+            map_features=state.map_features.replace(energy=energy_field)
+        )
+
+    def vision_power_map(
+        self, x: np.ndarray, y: np.ndarray, units_mask: np.ndarray, tile_type: np.ndarray, params: EnvParams
+    ) -> np.ndarray:
+        """Vision power map of each team, shape (num_teams, map_width, map_height), given the flat positions and mask of all
+        units.
+
+        A unit gives unit_sensor_range + 1 - d vision power to tiles at chebyshev distance d <= unit_sensor_range, which is
+        the number of squares of radius r <= unit_sensor_range around the unit containing the tile. Each square is the outer
+        product of its rows and columns, so the map of a team is one matrix product of the row and column indicators of the
+        squares of all its units.
+        """
+        num_teams = self.fixed_env_params.num_teams
+        map_width = self.fixed_env_params.map_width
+        map_height = self.fixed_env_params.map_height
+        num_squares = params.unit_sensor_range + 1
+        in_rows = self._sensor_square_rows[x, :num_squares] * units_mask[:, None, None]  # (units, squares, map_width)
+        in_cols = self._sensor_square_cols[y, :num_squares]  # (units, squares, map_height)
+        vision_power_map = np.matmul(
+            in_rows.reshape(num_teams, -1, map_width).transpose(0, 2, 1),
+            in_cols.reshape(num_teams, -1, map_height),
+        ).astype(np.int16)
+        return (
+            vision_power_map
+            - (tile_type == NEBULA_TILE).astype(np.int16) * params.nebula_tile_vision_reduction
+        )
+
+    def compute_sensor_masks(self, state: EnvState, params: EnvParams) -> EnvState:
+        """Compute the vision power and sensor mask for both teams, see LuxAIS3Env.compute_sensor_masks"""
+        check_fog_of_war(params, self.fixed_env_params)
+        if not self.fixed_env_params.fog_of_war:
+            map_shape = state.vision_power_map.shape
+            return state.replace(
+                sensor_mask=np.ones(map_shape, dtype=np.bool_), vision_power_map=np.zeros(map_shape, dtype=np.int16)
+            )
+        position = state.units.position.reshape(-1, 2)
+        vision_power_map = self.vision_power_map(
+            position[:, 0],
+            position[:, 1],
+            state.units_mask.reshape(-1),
+            state.map_features.tile_type,
+            params,
+        )
+        return state.replace(
+            sensor_mask=vision_power_map > 0, vision_power_map=vision_power_map
+        )
+
+    def sample_step_noise(self, rng: np.random.Generator, params: EnvParams) -> StepNoise:
+        """Draw all random values of one step at once"""
+        return StepNoise(
+            energy_node_deltas=self._sample_energy_node_deltas(rng, params),
+            tie_break_winner=int(rng.integers(params.num_teams)),
+        )
+
+    def _sample_energy_node_deltas(self, rng: np.random.Generator, params: EnvParams) -> np.ndarray:
+        magnitude = params.energy_node_drift_magnitude
+        return np.round(
+            rng.uniform(-magnitude, magnitude, size=(self.fixed_env_params.max_energy_nodes // 2, 2))
+        ).astype(np.int16)
+
+    def step_env_state(
+        self,
+        rng: np.random.Generator,
+        state: EnvState,
+        action: Any,
+        params: EnvParams,
+        noise: Optional[StepNoise] = None,
+    ) -> Tuple[EnvState, Dict[str, np.ndarray], np.ndarray, np.ndarray, Dict[Any, Any]]:
+        """Environment-specific step transition without building observations, see LuxAIS3Env.step_env_state.
+
+        Random values are drawn from rng only when the step needs them, unless noise is given.
+
+        With at most a few dozen units, everything units do to each other is computed from pairwise comparisons of their
+        positions instead of per tile maps. Arithmetic on unit energies is done in int16 like in LuxAIS3Env.
+        """
+        check_fog_of_war(params, self.fixed_env_params)
+        num_teams = self.fixed_env_params.num_teams
+        max_units = self.fixed_env_params.max_units
+        map_width = self.fixed_env_params.map_width
+        map_height = self.fixed_env_params.map_height
+        steps = int(state.steps)
+        match_steps = int(state.match_steps)
+        map_energy = state.map_features.energy
+        tile_type = state.map_features.tile_type
+        own_team = self._own_team
+
+        # the energy field only changes when the energy nodes drifted at the end of the previous step
+        if np.float32(steps - 1) * params.energy_node_drift_speed % np.float32(1) == 0:
+            map_energy = self.compute_energy_features(state, params).map_features.energy
+
+        if isinstance(action, dict):
+            action = np.stack([action[f"player_{t}"] for t in range(num_teams)])
+        action = np.asarray(action, dtype=np.int32).reshape(num_teams, max_units, 3)
+        if self.egocentric:
+            action = np.concatenate([action[:1], egocentric_action(action[1:2], 1, xp=np), action[2:]])
+        action = action.reshape(-1, 3)
+
+        # remove all units if the match ended in the previous step, and units that have less than 0 energy
+        energy = state.units.energy.reshape(-1)
+        if match_steps == 0:
+            units_mask = np.zeros(num_teams * max_units, dtype=np.bool_)
+        else:
+            units_mask = (energy >= 0) & state.units_mask.reshape(-1)
+
+        """ process unit movement """
+        position = state.units.position.reshape(-1, 2)
+        move_actions = action[:, 0]
+        new_position = position + DIRECTIONS[np.minimum(np.maximum(move_actions, 0), 4)]
+        # the tile moved onto is looked up before clipping to the map, with jax's indexing that wraps -1 around and clamps
+        # indices beyond the map edge
+        is_blocked = (
+            tile_type[
+                np.minimum(new_position[:, 0], map_width - 1),
+                np.minimum(new_position[:, 1], map_height - 1),
+            ]
+            == ASTEROID_TILE
+        )
+        unit_moved = (
+            units_mask
+            & ~is_blocked
+            & (energy >= params.unit_move_cost)
+            & (move_actions < 5)
+            & (move_actions > 0)
+        )
+        position = np.where(
+            unit_moved[:, None], np.minimum(np.maximum(new_position, 0), self._max_position), position
+        )
+        x = position[:, 0]
+        y = position[:, 1]
+        energy = energy - unit_moved * params.unit_move_cost
+        original_unit_energy = energy
+
+        """apply sap actions"""
+        sapped_x = x + action[:, 1]
+        sapped_y = y + action[:, 2]
+        team_unit_sapped = (
+            units_mask
+            & (move_actions == 5)
+            & (energy >= params.unit_sap_cost)
+            & (np.maximum(np.abs(action[:, 1]), np.abs(action[:, 2])) <= params.unit_sap_range)
+            & (sapped_x >= 0)
+            & (sapped_y >= 0)
+            & (sapped_x < map_width)
+            & (sapped_y < map_height)
+        )
+        if team_unit_sapped.any():
+            # unit j of a team is hit by the sap targets of every unit of another team, valid or not, and by the 8 tiles
+            # around the sap target of unit j of that team, but only when unit j of the sapping team saps validly.
+            # Columns are the sapping teams, rows the units
+            paired_sapped = np.tile(team_unit_sapped.reshape(num_teams, max_units).T, (num_teams, 1))
+            paired_sapped_x = np.tile(sapped_x.reshape(num_teams, max_units).T, (num_teams, 1))
+            paired_sapped_y = np.tile(sapped_y.reshape(num_teams, max_units).T, (num_teams, 1))
+            # number of sap targets of each team on each unit, shape (units, num_teams)
+            units_sapped_count = np.matmul(
+                ((sapped_x == x[:, None]) & (sapped_y == y[:, None])).astype(np.float32), self._own_team_f32
+            ).astype(np.int16)
+            units_adjacent_sapped = (
+                np.maximum(np.abs(paired_sapped_x - x[:, None]), np.abs(paired_sapped_y - y[:, None])) == 1
+            )
+            # only opposition units are sapped
+            units_sap_applied = units_mask[:, None] & ~own_team & paired_sapped
+            sap_damage = np.sum(
+                (params.unit_sap_cost * units_sapped_count) * units_sap_applied,
+                axis=1,
+                dtype=np.int16,
+            )
+            sap_damage = sap_damage + np.sum(
+                np.int16(np.float32(params.unit_sap_cost) * params.unit_sap_dropoff_factor)
+                * (units_sap_applied & units_adjacent_sapped),
+                axis=1,
+                dtype=np.int16,
+            )
+            sap_damage = sap_damage + team_unit_sapped * params.unit_sap_cost
+            energy = energy - sap_damage
+
+        """resolve collisions and energy void fields"""
+        dx = x - x[:, None]
+        dy = y - y[:, None]
+        same_tile = (dx == 0) & (dy == 0)
+        adjacent_tile = (np.abs(dx) + np.abs(dy)) == 1
+        team_units = self._own_team_f32 * units_mask[:, None]
+        # per team unit counts and energy on the tile of each unit, and energy on the 4 tiles adjacent to it
+        aggregates = np.matmul(
+            np.concatenate([same_tile, adjacent_tile]).astype(np.float32),
+            np.concatenate([team_units, team_units * original_unit_energy[:, None]], axis=1),
+        )
+        unit_counts = aggregates[: len(x), :num_teams]
+        unit_aggregate_energy = aggregates[: len(x), num_teams:]
+        unit_aggregate_energy_void = aggregates[len(x) :, num_teams:]
+        team_unit_counts = unit_counts[own_team]
+        surviving_unit_mask = (unit_counts.sum(1) == team_unit_counts) | (
+            np.where(own_team, -np.inf, unit_aggregate_energy).max(1)
+            < unit_aggregate_energy[own_team]
+        )
+        opposition_energy_void = unit_aggregate_energy_void.sum(1) - unit_aggregate_energy_void[own_team]
+        # a unit loses unit_energy_void_factor * void_energy / number of units stacked with it. Units that are not in the
+        # game may be on a tile without units of their team, there jax divides by 0 and converts inf to 32767 and nan to 0
+        energy_void = params.unit_energy_void_factor * opposition_energy_void
+        energy_void = np.where(
+            team_unit_counts > 0,
+            np.floor(energy_void / np.maximum(team_unit_counts, 1)),
+            (energy_void > 0) * np.float32(32767),
+        )
+        energy = energy - energy_void.astype(np.int16)
+        units_mask = units_mask & surviving_unit_mask
+
+        """apply energy field to the units"""
+        energy_gain = (
+            map_energy[x, y]
+            - (tile_type[x, y] == NEBULA_TILE).astype(np.int16)
+            * params.nebula_tile_energy_reduction
+        )
+        new_energy = energy + energy_gain
+        energy = np.where(
+            units_mask & ~((energy < 0) & (new_energy < 0)),
+            np.minimum(np.maximum(new_energy, params.min_unit_energy), params.max_unit_energy),
+            energy,
+        )
+
+        """spawn new units in"""
+        if match_steps % params.spawn_rate == 0:
+            for t in range(num_teams):
+                team_units_mask = units_mask[t * max_units : (t + 1) * max_units]
+                if team_units_mask.sum() < max_units:
+                    new_unit_id = t * max_units + team_units_mask.argmin()
+                    position[new_unit_id] = self._spawn_positions[t]
+                    energy[new_unit_id] = params.init_unit_energy
+                    units_mask[new_unit_id] = True
+
+        if self.fixed_env_params.fog_of_war:
+            vision_power_map = self.vision_power_map(x, y, units_mask, tile_type, params)
+            sensor_mask = vision_power_map > 0
+        else:
+            # sensor masks and vision power without fog of war never change, see compute_sensor_masks
+            vision_power_map = state.vision_power_map
+            sensor_mask = state.sensor_mask
+
+        # Shift objects around in space
+        if np.float32(steps) * params.nebula_tile_drift_speed % np.float32(1) == 0:
+            drift = int(np.sign(params.nebula_tile_drift_speed))
+            tile_type = np.roll(tile_type, shift=(drift, -drift), axis=(0, 1))
+        energy_nodes = state.energy_nodes
+        if np.float32(steps) * params.energy_node_drift_speed % np.float32(1) == 0:
+            if noise is None:
+                energy_node_deltas = self._sample_energy_node_deltas(rng, params)
+            else:
+                energy_node_deltas = noise.energy_node_deltas
+            energy_node_deltas = np.concatenate(
+                (
+                    energy_node_deltas,
+                    np.stack([-energy_node_deltas[:, 1], -energy_node_deltas[:, 0]], axis=-1),
+                )
+            )
+            energy_nodes = np.clip(
+                energy_nodes + energy_node_deltas,
+                np.array([0, 0], dtype=np.int16),
+                np.array([map_width, map_height], dtype=np.int16),
+            )
+
+        # Compute relic scores, each tile with units of a team on it scores once for that team
+        first_on_tile = ~(
+            (x == x[:, None]) & (y == y[:, None]) & self._earlier_teammate & units_mask
+        ).any(1)
+        scoring_units = units_mask & first_on_tile & (state.relic_nodes_map_weights[x, y] > 0)
+        team_points = state.team_points + scoring_units.reshape(num_teams, -1).sum(1, dtype=np.int32)
+        team_wins = state.team_wins
+
+        # if match ended, then remove all units, update team wins, reset team points
+        if match_steps >= params.max_steps_in_match:
+            winner_by_energy = np.sum(
+                (energy * units_mask).reshape(num_teams, -1), axis=1, dtype=np.int32
+            )
+            if team_points.max() > team_points.min():
+                winner = team_points.argmax()
+            elif winner_by_energy.max() > winner_by_energy.min():
+                winner = winner_by_energy.argmax()
+            else:
+                winner = rng.integers(num_teams) if noise is None else noise.tie_break_winner
+            match_steps = -1
+            team_points = np.zeros_like(team_points)
+            team_wins = team_wins.copy()
+            team_wins[winner] += 1
+
+        state = EnvState(
+            units=UnitState(
+                position=position.reshape(num_teams, max_units, 2),
+                energy=energy.reshape(num_teams, max_units, 1),
+            ),
+            units_mask=units_mask.reshape(num_teams, max_units),
+            energy_nodes=energy_nodes,
+            energy_node_fns=state.energy_node_fns,
+            energy_nodes_mask=state.energy_nodes_mask,
+            relic_nodes=state.relic_nodes,
+            relic_node_configs=state.relic_node_configs,
+            relic_nodes_mask=state.relic_nodes_mask,
+            relic_nodes_map_weights=state.relic_nodes_map_weights,
+            map_features=MapTile(energy=map_energy, tile_type=tile_type),
+            sensor_mask=sensor_mask,
+            vision_power_map=vision_power_map,
+            team_points=team_points,
+            team_wins=team_wins,
+            steps=np.array(steps + 1, dtype=np.int32),
+            match_steps=np.array(match_steps + 1, dtype=np.int32),
+        )
+        truncated = np.array(
+            steps + 1 >= (params.max_steps_in_match + 1) * params.match_count_per_episode
+        )
+        reward = dict()
+        for k in range(num_teams):
+            reward[f"player_{k}"] = team_wins[k]
+        return state, reward, np.array(False), truncated, {"discount": np.float32(1.0)}
+
+    def step(
+        self,
+        rng: np.random.Generator,
+        state: EnvState,
+        action: Any,
+        params: Optional[EnvParams] = None,
+        noise: Optional[StepNoise] = None,
+    ) -> Tuple[Dict[str, EnvObs], EnvState, Dict[str, np.ndarray], Dict[str, np.ndarray], Dict[str, np.ndarray], Dict[Any, Any]]:
+        """Performs step transitions in the environment, returning the same outputs as LuxAIS3Env.step without auto reset.
+
+        The random values of the step are drawn from rng unless noise is given, rng may be None if it is.
+        """
+        if params is None:
+            params = self.default_params
+        state, reward, terminated, truncated, info = self.step_env_state(
+            rng, state, action, params, noise
+        )
+        obs = self.get_obs(state, params)
+        info["final_state"] = state
+        info["final_observation"] = obs
+        terminated_dict = dict()
+        truncated_dict = dict()
+        for k in range(self.fixed_env_params.num_teams):
+            terminated_dict[f"player_{k}"] = terminated
+            truncated_dict[f"player_{k}"] = truncated
+            info[f"player_{k}"] = dict()
+        return obs, state, reward, terminated_dict, truncated_dict, info
+
+    def gen_map_state(self, rng: np.random.Generator, params: EnvParams) -> EnvState:
+        """Generate a new map with the same algorithm as LuxAIS3Env.gen_map_state. The returned state does not have the
+        energy field and sensor masks computed yet, see init_map_state"""
+        fixed = self.fixed_env_params
+        num_teams = fixed.num_teams
+        map_width = fixed.map_width
+        map_height = fixed.map_height
+        max_energy_nodes = fixed.max_energy_nodes
+        max_relic_nodes = fixed.max_relic_nodes
+        relic_config_size = fixed.relic_config_size
+        if MAP_TYPES[fixed.map_type] != "random":
+            raise ValueError(f"Map type {MAP_TYPES[fixed.map_type]} is not supported")
+
+        nebula_noise, asteroid_noise, relic_noise, energy_noise = [
+            generate_perlin_noise_2d(rng, (map_height, map_width), res)
+            for res in [(4, 4), (8, 8), (4, 4), (4, 4)]
+        ]
+        nebula = (nebula_noise > 0.5) | (nebula_noise > 0.5).T
+        asteroids = (asteroid_noise < -0.5) | (asteroid_noise < -0.5).T
+        tile_type = np.where(nebula[::-1], NEBULA_TILE, 0).astype(np.int32)
+        tile_type[asteroids[::-1]] = ASTEROID_TILE
+
+        def highest_noise_positions(noise, k):
+            flat_indices = np.argsort(noise.ravel(), kind="stable")[-k:]
+            return np.column_stack(np.unravel_index(flat_indices, noise.shape)).astype(np.int16)
+
+        def mirror(positions):
+            return np.stack(
+                [map_width - positions[:, 1] - 1, map_height - positions[:, 0] - 1], axis=-1
+            ).astype(np.int16)
+
+        highest_positions = highest_noise_positions(relic_noise, max_relic_nodes // 2)
+        relic_nodes = np.concatenate([highest_positions, mirror(highest_positions)])
+        relic_node_configs = (
+            rng.integers(0, 10, size=(max_relic_nodes, relic_config_size, relic_config_size)) >= 7.5
+        )
+        relic_node_configs[max_relic_nodes // 2 :] = relic_node_configs[: max_relic_nodes // 2].transpose(0, 2, 1)[:, ::-1, ::-1]
+        relic_nodes_mask_half = rng.integers(0, 2, size=max_relic_nodes // 2).astype(np.bool_)
+        relic_nodes_mask_half[0] = True
+        relic_nodes_mask = np.concatenate([relic_nodes_mask_half, relic_nodes_mask_half])
+
+        highest_positions = highest_noise_positions(energy_noise, max_energy_nodes // 2)
+        energy_nodes = np.concatenate([highest_positions, mirror(highest_positions)])
+        energy_nodes_mask_half = rng.integers(0, 2, size=max_energy_nodes // 2).astype(np.bool_)
+        energy_nodes_mask_half[0] = True
+        energy_nodes_mask = np.concatenate([energy_nodes_mask_half, energy_nodes_mask_half])
+        # the first energy node of each half has the sine function of LuxAIS3Env, the others give no energy
+        energy_node_fns = np.zeros((max_energy_nodes, 4), dtype=np.float32)
+        energy_node_fns[[0, max_energy_nodes // 2]] = [0, 1.2, 1, 4]
+
+        # add the configs of all relic nodes onto the map, dropping config tiles beyond the map edges
+        relic_nodes_map_weights = np.zeros((map_width, map_height), dtype=np.int16)
+        config_offsets = np.arange(relic_config_size) - relic_config_size // 2
+        for pos, config, mask in zip(relic_nodes, relic_node_configs, relic_nodes_mask):
+            if not mask:
+                continue
+            xs = (pos[0] + config_offsets)[:, None]
+            ys = (pos[1] + config_offsets)[None, :]
+            valid_pos = (xs >= 0) & (ys >= 0) & (xs < map_width) & (ys < map_height)
+            xs, ys = np.broadcast_arrays(xs, ys)
+            np.add.at(
+                relic_nodes_map_weights, (xs[valid_pos], ys[valid_pos]), config[valid_pos].astype(np.int16)
+            )
+
+        return EnvState(
+            units=UnitState(
+                position=np.zeros((num_teams, fixed.max_units, 2), dtype=np.int16),
+                energy=np.zeros((num_teams, fixed.max_units, 1), dtype=np.int16),
+            ),
+            units_mask=np.zeros((num_teams, fixed.max_units), dtype=np.bool_),
+            energy_nodes=energy_nodes,
+            energy_node_fns=energy_node_fns,
+            energy_nodes_mask=energy_nodes_mask,
+            relic_nodes=relic_nodes,
+            relic_node_configs=relic_node_configs,
+            relic_nodes_mask=relic_nodes_mask,
+            relic_nodes_map_weights=relic_nodes_map_weights,
+            map_features=MapTile(
+                energy=np.zeros((map_width, map_height), dtype=np.int16), tile_type=tile_type
+            ),
+            sensor_mask=np.zeros((num_teams, map_width, map_height), dtype=np.bool_),
+            vision_power_map=np.zeros((num_teams, map_width, map_height), dtype=np.int16),
+            team_points=np.zeros(num_teams, dtype=np.int32),
+            team_wins=np.zeros(num_teams, dtype=np.int32),
+            steps=np.array(0, dtype=np.int32),
+            match_steps=np.array(0, dtype=np.int32),
+        )
+
+    def init_map_state(self, state: EnvState, params: EnvParams) -> EnvState:
+        """Compute the parts of an initial state generated by gen_map_state that depend on the env params"""
+        state = self.compute_energy_features(state, params)
+        state = self.compute_sensor_masks(state, params)
+        return state
+
+    def reset(
+        self, rng: np.random.Generator, params: Optional[EnvParams] = None
+    ) -> Tuple[Dict[str, EnvObs], EnvState]:
+        """Performs resetting of environment on a newly generated map"""
+        if params is None:
+            params = self.default_params
+        state = self.init_map_state(self.gen_map_state(rng, params), params)
+        return self.get_obs(state, params), state
+
+    def reset_from_bank(
+        self, map_state: EnvState, params: Optional[EnvParams] = None
+    ) -> Tuple[Dict[str, EnvObs], EnvState]:
+        """Performs resetting of environment on a map loaded from a MapBank. This gives the same observation and state as
+        LuxAIS3Env.reset_from_bank"""
+        if params is None:
+            params = self.default_params
+        state = self.init_map_state(map_state, params)
+        return self.get_obs(state, params), state
+
+    def get_obs(self, state: EnvState, params=None) -> Dict[str, EnvObs]:
+        """Return the observation of each team as a dict mapping player_k to the observation of team k, see
+        LuxAIS3Env.get_stacked_obs. The observations of all teams are computed together along a leading team axis"""
+        num_teams = self.fixed_env_params.num_teams
+        sensor_mask = state.sensor_mask
+        if self.fixed_env_params.fog_of_war:
+            # units of other teams are only visible if they are on a tile the team can sense
+            new_unit_masks = state.units_mask & (
+                sensor_mask[:, state.units.position[..., 0], state.units.position[..., 1]]
+                | self._own_team.T.reshape(num_teams, num_teams, -1)
+            )
+            new_relic_nodes_mask = (
+                state.relic_nodes_mask & sensor_mask[:, state.relic_nodes[:, 0], state.relic_nodes[:, 1]]
+            )
+            map_energy = np.where(sensor_mask, state.map_features.energy, np.int16(-1))
+            tile_type = np.where(sensor_mask, state.map_features.tile_type, np.int32(-1))
+        else:
+            new_unit_masks = np.broadcast_to(state.units_mask, (num_teams,) + state.units_mask.shape)
+            new_relic_nodes_mask = np.broadcast_to(state.relic_nodes_mask, (num_teams,) + state.relic_nodes_mask.shape)
+            map_energy = np.broadcast_to(state.map_features.energy, sensor_mask.shape)
+            tile_type = np.broadcast_to(state.map_features.tile_type, sensor_mask.shape)
+        position = np.where(new_unit_masks[..., None], state.units.position, np.int16(-1))
+        energy = np.where(new_unit_masks, state.units.energy[..., 0], np.int16(-1))
+        relic_nodes = np.where(new_relic_nodes_mask[..., None], state.relic_nodes, np.int16(-1))
+        obs = dict()
+        for t in range(num_teams):
+            obs[f"player_{t}"] = EnvObs(
+                units=UnitState(position=position[t], energy=energy[t]),
+                units_mask=new_unit_masks[t],
+                sensor_mask=sensor_mask[t],
+                map_features=MapTile(energy=map_energy[t], tile_type=tile_type[t]),
+                team_points=state.team_points,
+                team_wins=state.team_wins,
+                steps=state.steps,
+                match_steps=state.match_steps,
+                relic_nodes=relic_nodes[t],
+                relic_nodes_mask=new_relic_nodes_mask[t],
+            )
+            if self.egocentric:
+                obs[f"player_{t}"] = egocentric_obs(obs[f"player_{t}"], t, self.fixed_env_params, xp=np)
+        return obs
+
+    @property
+    def name(self) -> str:
+        """Environment name."""
+        return "Lux AI Season 3"
+
+    def render(self, state: EnvState, params: EnvParams):
+        self.renderer.render(state, params)
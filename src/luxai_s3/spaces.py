@@ -1,9 +1,18 @@
+from typing import Union
+
 import chex
 import jax
 import jax.numpy as jnp
 import numpy as np
+from flax import struct
 from gymnax.environments.spaces import Space
 
+from luxai_s3.params import EnvParams, env_params_ranges
+from luxai_s3.state import ASTEROID_TILE, EnvObs, EnvState
+
+MOVE_DIRECTIONS = np.array([[0, 0], [0, -1], [1, 0], [0, 1], [-1, 0]], dtype=np.int16)
+"""movement of the move actions 0 to 4, see LuxAIS3Env.step_env_state"""
+
 
 class MultiDiscrete(Space):
     """Minimal jittable class for multi discrete gymnax spaces."""
@@ -25,6 +34,65 @@ class MultiDiscrete(Space):
     def contains(self, x) -> jnp.ndarray:
         """Check whether specific object is within space."""
         # type_cond = isinstance(x, self.dtype)
-        # shape_cond = (x.shape == self.shape)
-        range_cond = jnp.logical_and(x >= 0, x < self.n)
-        return range_cond
+        x = jnp.asarray(x)
+        if x.shape != self.shape:
+            return jnp.array(False)
+        range_cond = jnp.logical_and(x >= self.low.astype(x.dtype), x <= self.high.astype(x.dtype))
+        return jnp.all(range_cond)
+
+
+@struct.dataclass
+class LegalActionMask:
+    """Which actions each unit can take, see legal_action_mask"""
+    action: chex.Array
+    """whether each unit can take action 0 (do nothing), 1 to 4 (move up, right, down, left) and 5 (sap), shape
+    (num_teams, max_units, 6)"""
+    sap_target: chex.Array
+    """whether each unit can sap the tile at offset (dx, dy) from it, indexed by [team, unit, dx + R, dy + R] where R is the
+    largest unit_sap_range of env_params_ranges, shape (num_teams, max_units, 2 * R + 1, 2 * R + 1)"""
+
+
+def legal_action_mask(state_or_obs: Union[EnvState, EnvObs], params: EnvParams) -> LegalActionMask:
+    """Compute which actions every unit in a state or observation can take this step. Jittable, use jax.vmap to compute
+    the masks of a batch of envs.
+
+    A unit can move if it exists, has at least unit_move_cost energy and the target tile is on the map and not an asteroid.
+    Tiles an observation has not sensed (tile type -1) are assumed not to be asteroids. A unit can sap a tile if it exists,
+    has at least unit_sap_cost energy and the tile is on the map within unit_sap_range, and can take the sap action if it
+    can sap any tile. Doing nothing is always legal, so units that do not exist or are not visible have exactly one legal
+    action.
+    """
+    tile_type = state_or_obs.map_features.tile_type
+    map_width, map_height = tile_type.shape
+    units_mask = state_or_obs.units_mask
+    # units of states have energy of shape (num_teams, max_units, 1), of observations (num_teams, max_units)
+    energy = state_or_obs.units.energy.reshape(units_mask.shape)
+    position = state_or_obs.units.position
+
+    move_targets = position[..., None, :] + MOVE_DIRECTIONS[1:]  # (num_teams, max_units, 4, 2)
+    in_map = (
+        (move_targets >= 0).all(-1)
+        & (move_targets[..., 0] < map_width)
+        & (move_targets[..., 1] < map_height)
+    )
+    is_asteroid = (
+        tile_type[
+            jnp.clip(move_targets[..., 0], 0, map_width - 1),
+            jnp.clip(move_targets[..., 1], 0, map_height - 1),
+        ]
+        == ASTEROID_TILE
+    )
+    can_move = (units_mask & (energy >= params.unit_move_cost))[..., None] & in_map & ~is_asteroid
+
+    max_sap_range = env_params_ranges["unit_sap_range"][-1]
+    sap_offsets = jnp.arange(-max_sap_range, max_sap_range + 1, dtype=jnp.int16)
+    sap_x = position[..., 0, None, None] + sap_offsets[:, None]
+    sap_y = position[..., 1, None, None] + sap_offsets[None, :]
+    in_range = jnp.maximum(jnp.abs(sap_offsets)[:, None], jnp.abs(sap_offsets)[None, :]) <= params.unit_sap_range
+    can_sap = (units_mask & (energy >= params.unit_sap_cost))[..., None, None]
+    sap_target = can_sap & in_range & (sap_x >= 0) & (sap_x < map_width) & (sap_y >= 0) & (sap_y < map_height)
+
+    action = jnp.concatenate(
+        [jnp.ones_like(can_move[..., :1]), can_move, sap_target.any(axis=(-2, -1))[..., None]], axis=-1
+    )
+    return LegalActionMask(action=action, sap_target=sap_target)
@@ -1,12 +1,14 @@
 import functools
+from typing import Optional
 import chex
 import flax
+import flax.traverse_util
 import jax
 import jax.numpy as jnp
 import numpy as np
 from flax import struct
 
-from luxai_s3.params import MAP_TYPES, EnvParams
+from luxai_s3.params import MAP_TYPES, EnvParams, env_params_ranges
 from luxai_s3.utils import to_numpy
 EMPTY_TILE = 0
 NEBULA_TILE = 1
@@ -119,6 +121,29 @@ class EnvObs:
     
     
 
+@struct.dataclass
+class EnvConstants:
+    """Parts of an EnvState that do not change during an episode, see split_env_state"""
+    energy_node_fns: chex.Array
+    energy_nodes_mask: chex.Array
+    relic_nodes: chex.Array
+    relic_node_configs: chex.Array
+    relic_nodes_mask: chex.Array
+    relic_nodes_map_weights: chex.Array
+
+
+def split_env_state(state: EnvState) -> tuple[EnvState, EnvConstants]:
+    """Split a state into the parts that change every step and the per episode constants. The fields of the constants are
+    None in the returned state, so they are not leaves of it and are not copied or stacked with it"""
+    constants = EnvConstants(**{field: getattr(state, field) for field in EnvConstants.__dataclass_fields__})
+    return state.replace(**{field: None for field in EnvConstants.__dataclass_fields__}), constants
+
+
+def merge_env_state(state: EnvState, constants: EnvConstants) -> EnvState:
+    """Inverse of split_env_state"""
+    return state.replace(**{field: getattr(constants, field) for field in EnvConstants.__dataclass_fields__})
+
+
 def serialize_env_states(env_states: list[EnvState]):
     def serialize_array(root: EnvState, arr, key_path: str = ""):
         if key_path in ["sensor_mask", "relic_nodes_mask", "energy_nodes_mask", "energy_node_fns", "relic_nodes_map_weights"]:
@@ -129,7 +154,7 @@ def serialize_env_states(env_states: list[EnvState]):
             return root.relic_node_configs[root.relic_nodes_mask].tolist()
         if key_path == "energy_nodes":
             return root.energy_nodes[root.energy_nodes_mask].tolist()
-        if isinstance(arr, jnp.ndarray):
+        if isinstance(arr, (np.ndarray, jnp.ndarray)):
             return arr.tolist()
         elif isinstance(arr, dict):
             ret = dict()
@@ -170,48 +195,412 @@ def serialize_env_actions(env_actions: list):
 
     return steps
 
-def state_to_flat_obs(state: EnvState) -> chex.Array:
-    pass
+@struct.dataclass
+class FlatObs:
+    """Fixed layout tensor encoding of an EnvObs or EnvState, see obs_to_flat_obs and state_to_flat_obs"""
+    spatial: chex.Array
+    """float32 feature planes with shape (C, W, H) for C channels, W width and H height, see flat_obs_channels"""
+    vector: chex.Array
+    """float32 global features with shape (D, ), see flat_obs_vector_fields"""
+
+
+def _flat_obs_layout(fixed_env_params: EnvParams, state: bool):
+    """The fields stored as spatial channels and in the global vector of the flat encoding of an EnvObs (or EnvState if
+    state is True), as lists of (field, shape, dtype)"""
+    num_teams = fixed_env_params.num_teams
+    max_units = fixed_env_params.max_units
+    map_shape = (fixed_env_params.map_width, fixed_env_params.map_height)
+    spatial = [
+        ("map_features.tile_type", map_shape, jnp.int32),
+        ("map_features.energy", map_shape, jnp.int16),
+    ]
+    if state:
+        spatial += [
+            ("sensor_mask", (num_teams,) + map_shape, jnp.bool),
+            ("vision_power_map", (num_teams,) + map_shape, jnp.int16),
+            ("relic_nodes_map_weights", map_shape, jnp.int16),
+        ]
+    else:
+        spatial += [("sensor_mask", map_shape, jnp.bool)]
+    vector = [
+        ("team_points", (num_teams,), jnp.int32),
+        ("team_wins", (num_teams,), jnp.int32),
+        ("steps", (), jnp.int32),
+        ("match_steps", (), jnp.int32),
+        ("units.position", (num_teams, max_units, 2), jnp.int16),
+        ("units.energy", (num_teams, max_units, 1) if state else (num_teams, max_units), jnp.int16),
+        ("units_mask", (num_teams, max_units), jnp.bool),
+        ("relic_nodes", (fixed_env_params.max_relic_nodes, 2), jnp.int16),
+        ("relic_nodes_mask", (fixed_env_params.max_relic_nodes,), jnp.bool),
+    ]
+    if state:
+        vector += [
+            ("energy_nodes", (fixed_env_params.max_energy_nodes, 2), jnp.int16),
+            ("energy_node_fns", (fixed_env_params.max_energy_nodes, 4), jnp.float32),
+            ("energy_nodes_mask", (fixed_env_params.max_energy_nodes,), jnp.bool),
+            (
+                "relic_node_configs",
+                (fixed_env_params.max_relic_nodes, fixed_env_params.relic_config_size, fixed_env_params.relic_config_size),
+                jnp.bool,
+            ),
+        ]
+    return spatial, vector
+
+
+def flat_obs_channels(fixed_env_params: EnvParams = EnvParams(), state: bool = False) -> list[str]:
+    """Names of the spatial channels of the flat encoding of an EnvObs (or EnvState if state is True), in order.
+
+    Fields with a team axis get one channel per team named field/team_id. After the fields come the derived unit_counts and
+    unit_energy channels of each team (number and total energy of the units on a tile) and relic_nodes (number of relic
+    nodes on a tile), which the inverse does not need.
+    """
+    spatial, _ = _flat_obs_layout(fixed_env_params, state)
+    channels = []
+    for name, shape, _ in spatial:
+        if len(shape) == 3:
+            channels += [f"{name}/{t}" for t in range(shape[0])]
+        else:
+            channels.append(name)
+    channels += [f"unit_counts/{t}" for t in range(fixed_env_params.num_teams)]
+    channels += [f"unit_energy/{t}" for t in range(fixed_env_params.num_teams)]
+    channels.append("relic_nodes")
+    return channels
+
+
+def flat_obs_vector_fields(fixed_env_params: EnvParams = EnvParams(), state: bool = False) -> list[tuple[str, int]]:
+    """The fields stored in the global vector of the flat encoding of an EnvObs (or EnvState if state is True) in order, as
+    (field, size) pairs. Each field is stored flattened"""
+    _, vector = _flat_obs_layout(fixed_env_params, state)
+    return [(name, int(np.prod(shape))) for name, shape, _ in vector]
+
+
+def _to_flat_obs(x, state: bool) -> FlatObs:
+    num_teams, max_units = x.units_mask.shape
+    map_width, map_height = x.map_features.tile_type.shape
+    fixed_env_params = dict(
+        num_teams=num_teams,
+        max_units=max_units,
+        map_width=map_width,
+        map_height=map_height,
+        max_relic_nodes=x.relic_nodes.shape[0],
+    )
+    if state:
+        fixed_env_params.update(
+            max_energy_nodes=x.energy_nodes.shape[0], relic_config_size=x.relic_node_configs.shape[-1]
+        )
+    fixed_env_params = EnvParams(**fixed_env_params)
+    spatial_layout, vector_layout = _flat_obs_layout(fixed_env_params, state)
+    fields = flax.traverse_util.flatten_dict(flax.serialization.to_state_dict(x), sep=".")
+    spatial = [fields[name].reshape((-1, map_width, map_height)).astype(jnp.float32) for name, _, _ in spatial_layout]
+
+    # per team unit counts and energy on each tile. Units that are not in the game or not visible are dropped, as are relic
+    # nodes that are not visible
+    unit_energy = x.units.energy.reshape((num_teams, max_units))
+    unit_x = jnp.where(x.units_mask, x.units.position[..., 0], map_width)
+    unit_y = jnp.where(x.units_mask, x.units.position[..., 1], map_height)
+    team_ids = jnp.broadcast_to(jnp.arange(num_teams)[:, None], (num_teams, max_units))
+    unit_planes = jnp.zeros((2, num_teams, map_width, map_height), dtype=jnp.float32).at[
+        :, team_ids, unit_x, unit_y
+    ].add(jnp.stack([jnp.ones_like(unit_energy), unit_energy]).astype(jnp.float32), mode="drop")
+    relic_x = jnp.where(x.relic_nodes_mask, x.relic_nodes[:, 0], map_width)
+    relic_y = jnp.where(x.relic_nodes_mask, x.relic_nodes[:, 1], map_height)
+    relic_plane = jnp.zeros((1, map_width, map_height), dtype=jnp.float32).at[0, relic_x, relic_y].add(1, mode="drop")
+    spatial += [unit_planes.reshape((-1, map_width, map_height)), relic_plane]
+    return FlatObs(
+        spatial=jnp.concatenate(spatial, axis=0),
+        vector=jnp.concatenate([fields[name].ravel().astype(jnp.float32) for name, _, _ in vector_layout]),
+    )
+
 
+def _from_flat_obs(flat_obs: FlatObs, fixed_env_params: EnvParams, state: bool):
+    spatial_layout, vector_layout = _flat_obs_layout(fixed_env_params, state)
+    fields = dict()
+    batch_shape = flat_obs.vector.shape[:-1]
+    channel = 0
+    for name, shape, dtype in spatial_layout:
+        num_channels = shape[0] if len(shape) == 3 else 1
+        fields[name] = flat_obs.spatial[..., channel : channel + num_channels, :, :].reshape(batch_shape + shape).astype(dtype)
+        channel += num_channels
+    offset = 0
+    for name, shape, dtype in vector_layout:
+        size = int(np.prod(shape))
+        fields[name] = flat_obs.vector[..., offset : offset + size].reshape(batch_shape + shape).astype(dtype)
+        offset += size
+    units = UnitState(position=fields.pop("units.position"), energy=fields.pop("units.energy"))
+    map_features = MapTile(energy=fields.pop("map_features.energy"), tile_type=fields.pop("map_features.tile_type"))
+    return (EnvState if state else EnvObs)(units=units, map_features=map_features, **fields)
 
-def flat_obs_to_state(flat_obs: chex.Array) -> EnvState:
-    pass
 
-@functools.partial(jax.jit, static_argnums=(2, 3, 4, 5, 6, 7, 8, 9))
-def gen_state(key: chex.PRNGKey, env_params: EnvParams, max_units: int, num_teams: int, map_type: int, map_width: int, map_height: int, max_energy_nodes: int, max_relic_nodes: int, relic_config_size: int) -> EnvState:
-    generated = gen_map(key, env_params, map_type, map_width, map_height, max_energy_nodes, max_relic_nodes, relic_config_size)
-    relic_nodes_map_weights = jnp.zeros(
+def obs_to_flat_obs(obs: EnvObs) -> FlatObs:
+    """Encode an observation as fixed layout float32 tensors: spatial feature planes for CNN policies (see
+    flat_obs_channels) and a vector of global features (see flat_obs_vector_fields). Jittable and vmappable, e.g.
+    jax.vmap(obs_to_flat_obs) encodes a batch of observations on device. flat_obs_to_obs inverts it exactly"""
+    return _to_flat_obs(obs, state=False)
+
+
+def flat_obs_to_obs(flat_obs: FlatObs, fixed_env_params: EnvParams = EnvParams()) -> EnvObs:
+    """Decode an observation encoded with obs_to_flat_obs. Works on batched FlatObs as well, giving batched observations"""
+    return _from_flat_obs(flat_obs, fixed_env_params, state=False)
+
+
+def state_to_flat_obs(state: EnvState) -> FlatObs:
+    """Encode a full state like obs_to_flat_obs encodes an observation. The spatial channels additionally hold the sensor
+    mask and vision power of every team and the relic node weights, the vector additionally holds the energy and relic
+    nodes. flat_obs_to_state inverts it exactly"""
+    return _to_flat_obs(state, state=True)
+
+
+def flat_obs_to_state(flat_obs: FlatObs, fixed_env_params: EnvParams = EnvParams()) -> EnvState:
+    """Decode a state encoded with state_to_flat_obs. Works on batched FlatObs as well, giving batched states"""
+    return _from_flat_obs(flat_obs, fixed_env_params, state=True)
+
+@struct.dataclass
+class CompactEnvState:
+    """Compact layout of an EnvState for recorded trajectories and replay buffers, see pack_env_state.
+
+    Positions, tile types, map energy and vision power are stored in 8 bit integers with the default fixed env params
+    (wider ones when their bounds need it), masks as packed bits and unit energy without its trailing axis. sensor_mask (vision_power_map > 0, or all True without fog of war) and relic_nodes_map_weights
+    (the relic node configs added onto the map) are not stored and are recomputed by unpack_env_state.
+    """
+    units_position: chex.Array
+    """unit positions with shape (T, N, 2), int8 unless the map is larger than 127 tiles"""
+    units_energy: chex.Array
+    """int16 unit energy with shape (T, N)"""
+    units_mask: chex.Array
+    """packed bits of the (T, N) units mask"""
+    energy_nodes: chex.Array
+    """energy node positions with shape (E, 2), int8 unless the map is larger than 127 tiles"""
+    energy_node_fns: chex.Array
+    energy_nodes_mask: chex.Array
+    """packed bits of the (E, ) energy nodes mask"""
+    relic_nodes: chex.Array
+    """relic node positions with shape (R, 2), int8 unless the map is larger than 127 tiles"""
+    relic_node_configs: chex.Array
+    """packed bits of the (R, K, K) relic node configs"""
+    relic_nodes_mask: chex.Array
+    """packed bits of the (R, ) relic nodes mask"""
+    map_energy: chex.Array
+    """energy of each tile with shape (W, H), int8 with the default tile energy bounds"""
+    tile_type: chex.Array
+    """uint8 type of each tile with shape (W, H)"""
+    vision_power_map: chex.Array
+    """vision power of each team with shape (T, W, H), int8 unless max_units is above 25"""
+    team_points: chex.Array
+    team_wins: chex.Array
+    """int16 team wins with shape (T, )"""
+    steps: chex.Array
+    """int16 steps taken in the environment"""
+    match_steps: chex.Array
+    """int16 steps taken in the current match"""
+
+
+def compute_relic_nodes_map_weights(
+    relic_nodes: chex.Array, relic_node_configs: chex.Array, relic_nodes_mask: chex.Array, map_width: int, map_height: int
+) -> chex.Array:
+    """Add the configs of all relic nodes onto the map with a single scatter add. Config tiles beyond the map edges and
+    configs of masked out relic nodes are dropped"""
+    relic_config_size = relic_node_configs.shape[-1]
+    config_offsets = jnp.arange(relic_config_size, dtype=jnp.int16) - relic_config_size // 2
+    xs = relic_nodes[:, 0, None, None] + config_offsets[None, :, None]  # (max_relic_nodes, relic_config_size, 1)
+    ys = relic_nodes[:, 1, None, None] + config_offsets[None, None, :]  # (max_relic_nodes, 1, relic_config_size)
+    valid_pos = (
+        (xs >= 0) & (ys >= 0) & (xs < map_width) & (ys < map_height)
+        & relic_nodes_mask[:, None, None]
+    )
+    return jnp.zeros(
         shape=(map_width, map_height), dtype=jnp.int16
+    ).at[
+        jnp.where(valid_pos, xs, map_width), jnp.where(valid_pos, ys, map_height)
+    ].add(relic_node_configs.astype(jnp.int16), mode="drop")
+
+
+def nodes_are_symmetric(nodes: chex.Array, map_width: int, map_height: int, *node_features: chex.Array) -> chex.Array:
+    """Whether the second half of the nodes is the first half mirrored about the anti-diagonal with the same features.
+    Features are compared as given, so mirror the first half of features that change under mirroring. False unless the
+    map is square and the number of nodes even, as only then can half of the nodes be mirrored onto the other half"""
+    if map_width != map_height or nodes.shape[0] % 2 != 0:
+        return jnp.array(False)
+    half = nodes.shape[0] // 2
+    mirrored_nodes = jnp.stack(
+        [map_width - 1 - nodes[:half, 1], map_height - 1 - nodes[:half, 0]], axis=-1
+    ).astype(nodes.dtype)
+    symmetric = (nodes[half:] == mirrored_nodes).all()
+    for features in node_features:
+        symmetric &= (features[half:] == features[:half]).all()
+    return symmetric
+
+
+def compute_mirrored_relic_nodes_map_weights(
+    relic_nodes: chex.Array, relic_node_configs: chex.Array, relic_nodes_mask: chex.Array, map_width: int, map_height: int
+) -> chex.Array:
+    """compute_relic_nodes_map_weights that only adds the configs of the first half of the relic nodes and mirrors the
+    result about the anti-diagonal. Only equal to it for symmetric relic nodes (see nodes_are_symmetric), like the ones
+    gen_map places"""
+    half = relic_nodes.shape[0] // 2
+    weights = compute_relic_nodes_map_weights(
+        relic_nodes[:half], relic_node_configs[:half], relic_nodes_mask[:half], map_width, map_height
+    )
+    return weights + weights[::-1, ::-1].T
+
+
+def _int_dtype(low: int, high: int):
+    """Narrowest of int8, int16 and int32 holding every value in [low, high]"""
+    for dtype in [jnp.int8, jnp.int16]:
+        if jnp.iinfo(dtype).min <= low and high <= jnp.iinfo(dtype).max:
+            return dtype
+    return jnp.int32
+
+
+def _checked_astype(x: chex.Array, dtype, name: str) -> chex.Array:
+    """x cast to dtype, raising a ValueError if x is concrete and holds values dtype can not represent. Traced values
+    can not be checked and are cast as is"""
+    if not isinstance(x, jax.core.Tracer) and x.size > 0:
+        low, high = int(x.min()), int(x.max())
+        if low < jnp.iinfo(dtype).min or high > jnp.iinfo(dtype).max:
+            raise ValueError(
+                f"{name} has values in [{low}, {high}] which do not fit in {jnp.dtype(dtype).name}, pass the fixed env "
+                "params the state was generated with to pack_env_state"
+            )
+    return x.astype(dtype)
+
+
+def _worst_case_param(fixed_env_params: EnvParams, name: str, bound) -> int:
+    """bound (min or max) of the value of param name in fixed_env_params and its values in env_params_ranges"""
+    return bound([getattr(fixed_env_params, name), *env_params_ranges.get(name, [])])
+
+
+def _packed_value_bounds(fixed_env_params: EnvParams, max_units: int, params: Optional[EnvParams] = None) -> dict:
+    """Range of values of the fields pack_env_state narrows to the dtype of their bounds. The bounds hold for states of envs
+    with the given params, or with the worst case of fixed_env_params and env_params_ranges if params is None"""
+    if params is None:
+        min_energy_per_tile = _worst_case_param(fixed_env_params, "min_energy_per_tile", min)
+        max_energy_per_tile = _worst_case_param(fixed_env_params, "max_energy_per_tile", max)
+        unit_sensor_range = _worst_case_param(fixed_env_params, "unit_sensor_range", max)
+        nebula_tile_vision_reduction = _worst_case_param(fixed_env_params, "nebula_tile_vision_reduction", max)
+    else:
+        min_energy_per_tile = int(np.min(params.min_energy_per_tile))
+        max_energy_per_tile = int(np.max(params.max_energy_per_tile))
+        unit_sensor_range = int(np.max(params.unit_sensor_range))
+        nebula_tile_vision_reduction = int(np.max(params.nebula_tile_vision_reduction))
+    return {
+        "map_features.energy": (min_energy_per_tile, max_energy_per_tile),
+        "vision_power_map": (-nebula_tile_vision_reduction, max_units * (unit_sensor_range + 1)),
+    }
+
+
+def check_packable_params(params: EnvParams, fixed_env_params: EnvParams = EnvParams()):
+    """Raise a ValueError if states of envs with params may hold values pack_env_state can not store. pack_env_state only
+    checks concrete states, call this before packing states under jit. Traced params can not be checked"""
+    if any(isinstance(x, jax.core.Tracer) for x in jax.tree.leaves(params)):
+        return
+    worst_case = _packed_value_bounds(fixed_env_params, fixed_env_params.max_units)
+    for name, (low, high) in _packed_value_bounds(fixed_env_params, fixed_env_params.max_units, params).items():
+        dtype = _int_dtype(*worst_case[name])
+        if low < jnp.iinfo(dtype).min or high > jnp.iinfo(dtype).max:
+            raise ValueError(
+                f"{name} of envs with these params takes values in [{low}, {high}] which do not fit in the "
+                f"{jnp.dtype(dtype).name} pack_env_state stores it in for these fixed env params, pass fixed env params "
+                "with the params' min_energy_per_tile, max_energy_per_tile, unit_sensor_range and "
+                "nebula_tile_vision_reduction"
+            )
+
+
+def pack_env_state(state: EnvState, fixed_env_params: EnvParams = EnvParams()) -> CompactEnvState:
+    """Convert a state to the compact layout, about 3.3 times smaller with the default fixed env params. Jittable, use
+    jax.vmap to pack batches of states or stacked trajectories.
+
+    Positions, tile energy and vision power are stored in the narrowest integer dtype holding every value they can take,
+    which is int8 with the default fixed env params. Position bounds follow from the map size. Tile energy and vision power
+    bounds follow from the worst case of min_energy_per_tile, max_energy_per_tile, unit_sensor_range and
+    nebula_tile_vision_reduction over fixed_env_params and env_params_ranges.
+
+    States of envs with params beyond these bounds can not be packed. Outside of jit this raises a ValueError. Under jit
+    values are not checked and would wrap around, use check_packable_params on the params first.
+    """
+    map_width, map_height = state.map_features.tile_type.shape[-2:]
+    max_units = state.units_mask.shape[-1]
+    # energy nodes drift up to map_width and map_height inclusive
+    position_dtype = _int_dtype(0, max(map_width, map_height))
+    bounds = _packed_value_bounds(fixed_env_params, max_units)
+    map_energy_dtype = _int_dtype(*bounds["map_features.energy"])
+    vision_power_dtype = _int_dtype(*bounds["vision_power_map"])
+    return CompactEnvState(
+        units_position=state.units.position.astype(position_dtype),
+        units_energy=state.units.energy[..., 0],
+        units_mask=jnp.packbits(state.units_mask.reshape(-1)),
+        energy_nodes=state.energy_nodes.astype(position_dtype),
+        energy_node_fns=state.energy_node_fns,
+        energy_nodes_mask=jnp.packbits(state.energy_nodes_mask),
+        relic_nodes=state.relic_nodes.astype(position_dtype),
+        relic_node_configs=jnp.packbits(state.relic_node_configs.reshape(-1)),
+        relic_nodes_mask=jnp.packbits(state.relic_nodes_mask),
+        map_energy=_checked_astype(state.map_features.energy, map_energy_dtype, "map_features.energy"),
+        tile_type=state.map_features.tile_type.astype(jnp.uint8),
+        vision_power_map=_checked_astype(state.vision_power_map, vision_power_dtype, "vision_power_map"),
+        team_points=state.team_points,
+        team_wins=state.team_wins.astype(jnp.int16),
+        steps=jnp.asarray(state.steps, dtype=jnp.int16),
+        match_steps=jnp.asarray(state.match_steps, dtype=jnp.int16),
     )
 
-    # TODO (this could be optimized better)
-    def update_relic_node(relic_nodes_map_weights, relic_data):
-        relic_node, relic_node_config, mask = relic_data
-        start_y = relic_node[1] - relic_config_size // 2
-        start_x = relic_node[0] - relic_config_size // 2
-        for dy in range(relic_config_size):
-            for dx in range(relic_config_size):
-                y, x = start_y + dy, start_x + dx
-                valid_pos = jnp.logical_and(
-                    jnp.logical_and(y >= 0, x >= 0),
-                    jnp.logical_and(y < map_height, x < map_width),
-                )
-                relic_nodes_map_weights = jnp.where(
-                    valid_pos & mask,
-                    relic_nodes_map_weights.at[x, y].add(relic_node_config[dx, dy].astype(jnp.int16)),
-                    relic_nodes_map_weights,
-                )
-        return relic_nodes_map_weights, None
-
-    # this is really slow...
-    relic_nodes_map_weights, _ = jax.lax.scan(
-        update_relic_node,
-        relic_nodes_map_weights,
-        (
-            generated["relic_nodes"],
-            generated["relic_node_configs"],
-            generated["relic_nodes_mask"],
+
+def unpack_env_state(compact: CompactEnvState, fixed_env_params: EnvParams = EnvParams()) -> EnvState:
+    """Inverse of pack_env_state, giving back exactly the packed state of an env with the given fixed env params. Jittable,
+    use jax.vmap for batches"""
+    num_teams, max_units = compact.units_energy.shape
+    relic_config_size = fixed_env_params.relic_config_size
+
+    def unpack_bits(packed, shape):
+        return jnp.unpackbits(packed, count=int(np.prod(shape))).reshape(shape).astype(jnp.bool)
+
+    relic_nodes = compact.relic_nodes.astype(jnp.int16)
+    relic_nodes_mask = unpack_bits(compact.relic_nodes_mask, compact.relic_nodes.shape[:1])
+    relic_node_configs = unpack_bits(
+        compact.relic_node_configs, compact.relic_nodes.shape[:1] + (relic_config_size, relic_config_size)
+    )
+    vision_power_map = compact.vision_power_map.astype(jnp.int16)
+    return EnvState(
+        units=UnitState(
+            position=compact.units_position.astype(jnp.int16),
+            energy=compact.units_energy[..., None],
         ),
+        units_mask=unpack_bits(compact.units_mask, (num_teams, max_units)),
+        energy_nodes=compact.energy_nodes.astype(jnp.int16),
+        energy_node_fns=compact.energy_node_fns,
+        energy_nodes_mask=unpack_bits(compact.energy_nodes_mask, compact.energy_nodes.shape[:1]),
+        relic_nodes=relic_nodes,
+        relic_node_configs=relic_node_configs,
+        relic_nodes_mask=relic_nodes_mask,
+        relic_nodes_map_weights=compute_relic_nodes_map_weights(
+            relic_nodes, relic_node_configs, relic_nodes_mask, *compact.tile_type.shape
+        ),
+        map_features=MapTile(
+            energy=compact.map_energy.astype(jnp.int16),
+            tile_type=compact.tile_type.astype(jnp.int32),
+        ),
+        # without fog of war every tile is sensed, see LuxAIS3Env.compute_sensor_masks
+        sensor_mask=vision_power_map > 0 if fixed_env_params.fog_of_war else jnp.ones_like(vision_power_map, jnp.bool),
+        vision_power_map=vision_power_map,
+        team_points=compact.team_points,
+        team_wins=compact.team_wins.astype(jnp.int32),
+        steps=compact.steps.astype(jnp.int32),
+        match_steps=compact.match_steps.astype(jnp.int32),
+    )
+
+
+@functools.partial(jax.jit, static_argnums=(2, 3, 4, 5, 6, 7, 8, 9, 10))
+def gen_state(key: chex.PRNGKey, env_params: EnvParams, max_units: int, num_teams: int, map_type: int, map_width: int, map_height: int, max_energy_nodes: int, max_relic_nodes: int, relic_config_size: int, exploit_map_symmetry: bool = False) -> EnvState:
+    generated = gen_map(key, env_params, map_type, map_width, map_height, max_energy_nodes, max_relic_nodes, relic_config_size)
+    # gen_map mirrors the second half of the relic nodes from the first half on square maps, so there is nothing to check
+    mirror_relic_nodes = exploit_map_symmetry and map_width == map_height and max_relic_nodes % 2 == 0
+    relic_nodes_map_weights = (
+        compute_mirrored_relic_nodes_map_weights if mirror_relic_nodes else compute_relic_nodes_map_weights
+    )(
+        generated["relic_nodes"],
+        generated["relic_node_configs"],
+        generated["relic_nodes_mask"],
+        map_width,
+        map_height,
     )
     state = EnvState(
         units=UnitState(position=jnp.zeros(shape=(num_teams, max_units, 2), dtype=jnp.int16), energy=jnp.zeros(shape=(num_teams, max_units, 1), dtype=jnp.int16)),
@@ -250,36 +639,45 @@ def gen_map(key: chex.PRNGKey, params: EnvParams, map_type: int, map_height: int
     relic_nodes_mask = jnp.zeros(shape=(max_relic_nodes), dtype=jnp.bool)
     
     if MAP_TYPES[map_type] == "random":
-        
+        # derive every key up front following the same split chain as generating each feature one after the other
+        key, nebula_key = jax.random.split(key)
+        key, asteroid_key = jax.random.split(key)
+        key, relic_noise_key = jax.random.split(key)
+        relic_config_key = key
+        key, _ = jax.random.split(key)
+        relic_mask_key = key
+        key, energy_noise_key = jax.random.split(key)
+        key, _ = jax.random.split(key)
+        energy_mask_key = key
+
+        # generate all noise layers of the same resolution in one batched call
+        nebula_noise, relic_noise, energy_noise = jax.vmap(
+            generate_perlin_noise_2d, in_axes=(0, None, None)
+        )(jnp.stack([nebula_key, relic_noise_key, energy_noise_key]), (map_height, map_width), (4, 4))
+        asteroid_noise = generate_perlin_noise_2d(asteroid_key, (map_height, map_width), (8, 8))
+
         ### Generate nebula tiles ###
-        key, subkey = jax.random.split(key)
-        perlin_noise = generate_perlin_noise_2d(subkey, (map_height, map_width), (4, 4))
-        noise = jnp.where(perlin_noise > 0.5, 1, 0)
+        noise = jnp.where(nebula_noise > 0.5, 1, 0)
         # mirror along diagonal
         noise = noise | noise.T
         noise = noise[::-1, ::1]
         map_features = map_features.replace(tile_type=jnp.where(noise, NEBULA_TILE, 0))
         
         ### Generate asteroid tiles ###
-        key, subkey = jax.random.split(key)
-        perlin_noise = generate_perlin_noise_2d(subkey, (map_height, map_width), (8, 8))
-        noise = jnp.where(perlin_noise < -0.5, 1, 0)
+        noise = jnp.where(asteroid_noise < -0.5, 1, 0)
         # mirror along diagonal
         noise = noise | noise.T
         noise = noise[::-1, ::1]
         map_features = map_features.replace(tile_type=jnp.place(map_features.tile_type, noise, ASTEROID_TILE, inplace=False))
         
         ### Generate relic nodes ###
-        key, subkey = jax.random.split(key)
-        noise = generate_perlin_noise_2d(subkey, (map_height, map_width), (4, 4))
         # Find the positions of the  highest noise values
-        flat_indices = jnp.argsort(noise.ravel())[-max_relic_nodes // 2:]  # Get indices of two highest values
-        highest_positions = jnp.column_stack(jnp.unravel_index(flat_indices, noise.shape))
+        highest_positions = highest_noise_positions(relic_noise, max_relic_nodes // 2)
 
         # relic nodes have a fixed density of 25% nearby tiles can yield points
         relic_node_configs = (
             jax.random.randint(
-                key,
+                relic_config_key,
                 shape=(
                     max_relic_nodes,
                     relic_config_size,
@@ -290,30 +688,23 @@ def gen_map(key: chex.PRNGKey, params: EnvParams, map_type: int, map_height: int
             ).astype(jnp.float32)
             >= 7.5
         )
-        highest_positions = highest_positions.astype(jnp.int16)
         relic_nodes_mask = relic_nodes_mask.at[0].set(True)
         relic_nodes_mask = relic_nodes_mask.at[1].set(True)
         mirrored_positions = jnp.stack([map_width - highest_positions[:, 1] - 1, map_height - highest_positions[:, 0] - 1], dtype=jnp.int16, axis=-1)
         relic_nodes = jnp.concat([highest_positions, mirrored_positions], axis=0)
         
-        key, subkey = jax.random.split(key)
-        relic_nodes_mask_half = jax.random.randint(key, (max_relic_nodes // 2, ), minval=0, maxval=2).astype(jnp.bool)
+        relic_nodes_mask_half = jax.random.randint(relic_mask_key, (max_relic_nodes // 2, ), minval=0, maxval=2).astype(jnp.bool)
         relic_nodes_mask_half = relic_nodes_mask_half.at[0].set(True)
         relic_nodes_mask = relic_nodes_mask.at[:max_relic_nodes // 2].set(relic_nodes_mask_half)
         relic_nodes_mask = relic_nodes_mask.at[max_relic_nodes // 2:].set(relic_nodes_mask_half)
-        # import ipdb;ipdb.set_trace()
         relic_node_configs = relic_node_configs.at[max_relic_nodes // 2:].set(relic_node_configs[:max_relic_nodes // 2].transpose(0, 2, 1)[:, ::-1, ::-1])
         
         ### Generate energy nodes ###
-        key, subkey = jax.random.split(key)
-        noise = generate_perlin_noise_2d(subkey, (map_height, map_width), (4, 4))
         # Find the positions of the  highest noise values
-        flat_indices = jnp.argsort(noise.ravel())[-max_energy_nodes // 2:]  # Get indices of highest values
-        highest_positions = jnp.column_stack(jnp.unravel_index(flat_indices, noise.shape)).astype(jnp.int16)
+        highest_positions = highest_noise_positions(energy_noise, max_energy_nodes // 2)
         mirrored_positions = jnp.stack([map_width - highest_positions[:, 1] - 1, map_height - highest_positions[:, 0] - 1], dtype=jnp.int16, axis=-1)
         energy_nodes = jnp.concat([highest_positions, mirrored_positions], axis=0)
-        key, subkey = jax.random.split(key)
-        energy_nodes_mask_half = jax.random.randint(key, (max_energy_nodes // 2, ), minval=0, maxval=2).astype(jnp.bool)
+        energy_nodes_mask_half = jax.random.randint(energy_mask_key, (max_energy_nodes // 2, ), minval=0, maxval=2).astype(jnp.bool)
         energy_nodes_mask_half = energy_nodes_mask_half.at[0].set(True)
         energy_nodes_mask = energy_nodes_mask.at[:max_energy_nodes // 2].set(energy_nodes_mask_half)
         energy_nodes_mask = energy_nodes_mask.at[max_energy_nodes // 2:].set(energy_nodes_mask_half)
@@ -344,6 +735,19 @@ def gen_map(key: chex.PRNGKey, params: EnvParams, map_type: int, map_height: int
         relic_nodes_mask=relic_nodes_mask,
         relic_node_configs=relic_node_configs,
     )
+
+@functools.partial(jax.jit, static_argnums=(2, 3, 4, 5, 6, 7))
+def gen_maps(keys: chex.PRNGKey, params: EnvParams, map_type: int, map_height: int, map_width: int, max_energy_nodes: int, max_relic_nodes: int, relic_config_size: int) -> dict:
+    """Generates a batch of maps, one per key in keys, in a single compiled call. The maps are the same as calling gen_map with each key"""
+    return jax.vmap(gen_map, in_axes=(0, None, None, None, None, None, None, None))(
+        keys, params, map_type, map_height, map_width, max_energy_nodes, max_relic_nodes, relic_config_size
+    )
+
+def highest_noise_positions(noise: chex.Array, k: int) -> chex.Array:
+    """Returns the (x, y) positions of the k highest noise values, ordered from lowest to highest value like the last k entries of an argsort"""
+    _, flat_indices = jax.lax.top_k(noise.ravel(), k)
+    return jnp.column_stack(jnp.unravel_index(flat_indices[::-1], noise.shape)).astype(jnp.int16)
+
 def interpolant(t):
     return t*t*t*(t*(t*6 - 15) + 10)
 
@@ -1,45 +1,151 @@
 # TODO (stao): Add lux ai s3 env to gymnax api wrapper, which is the old gym api
+import functools
 import json
 import os
-from typing import Any, SupportsFloat
+from typing import Any, Optional, SupportsFloat
 import flax
 import flax.serialization
 import gymnasium as gym
 import gymnax
 import gymnax.environments.spaces
 import jax
+import jax.numpy as jnp
 import numpy as np
 import dataclasses
-from luxai_s3.env import LuxAIS3Env
-from luxai_s3.params import EnvParams, env_params_ranges
-from luxai_s3.state import serialize_env_actions, serialize_env_states
+from luxai_s3.aot import try_load_exported_env
+from luxai_s3.env import LuxAIS3Env, ResetPool
+from luxai_s3.map_bank import MapBank, map_bank_key
+from luxai_s3.numpy_env import NumpyLuxAIS3Env, StepNoise, to_numpy_env_params
+from luxai_s3.params import EnvParams, canonicalize_env_params, sample_env_params
+from luxai_s3.state import EnvState, serialize_env_actions, serialize_env_states
 from luxai_s3.utils import to_numpy
 
 
+_sample_env_params = jax.jit(sample_env_params)
+_compiled_jax_envs: dict[tuple[EnvParams, bool, bool], LuxAIS3Env] = dict()
+
+NUMPY_ENGINE_NOISE_CHUNK_SIZE = 128
+"""number of steps the numpy engine of LuxAIS3GymEnv draws the random values of at once"""
+
+
+@functools.lru_cache(maxsize=None)
+def _get_map_generator(fixed_env_params: EnvParams):
+    """Jitted LuxAIS3Env.gen_map_state for the given fixed env params, shared by all gym envs with the numpy engine"""
+    return jax.jit(LuxAIS3Env(auto_reset=False, fixed_env_params=fixed_env_params).gen_map_state)
+
+
+@functools.partial(jax.jit, static_argnums=(2, 3, 4))
+def _step_noise_chunk(rng_key, energy_node_drift_magnitude, max_energy_nodes: int, num_teams: int, num_steps: int):
+    """The random values LuxAIS3Env.step_env_state draws in the next num_steps steps of LuxAIS3GymEnv with the jax engine,
+    given the gym env's rng_key. Returns the gym env's rng_key after each step, the energy node deltas and the tie break
+    winners, each with a leading axis of num_steps"""
+
+    def next_step(rng_key, _):
+        rng_key, step_key = jax.random.split(rng_key)
+        # LuxAIS3Env.step splits off the key for auto resets and passes the other one to step_env_state
+        key, _ = jax.random.split(step_key)
+        energy_node_deltas = jnp.round(
+            jax.random.uniform(
+                key=key,
+                shape=(max_energy_nodes // 2, 2),
+                minval=-energy_node_drift_magnitude,
+                maxval=energy_node_drift_magnitude,
+            )
+        ).astype(jnp.int16)
+        tie_break_winner = jax.random.randint(key, shape=(), minval=0, maxval=num_teams)
+        return rng_key, (rng_key, energy_node_deltas, tie_break_winner)
+
+    return jax.lax.scan(next_step, rng_key, length=num_steps)[1]
+
+
+def get_compiled_jax_env(
+    fixed_env_params: EnvParams = EnvParams(), use_exported: bool = False, egocentric: bool = False
+) -> LuxAIS3Env:
+    """Returns the LuxAIS3Env shared by all gym envs in this process that use the given fixed env params.
+
+    reset and step are jitted with the env as a static argument, so every new LuxAIS3Env traces and compiles them again.
+    The first call for some fixed env params creates the env and compiles it by running a reset and a few steps, later
+    calls return the same env with reset and step already compiled.
+
+    If use_exported is True, reset and step are loaded from ahead-of-time exported executables (see luxai_s3.aot) instead
+    of being traced, exporting them to ~/.cache/luxai_s3 on first use. This writes to disk, so it is off by default and
+    turned on by the luxai-s3 CLI. egocentric is passed on to LuxAIS3Env.
+    """
+    if (fixed_env_params, use_exported, egocentric) in _compiled_jax_envs:
+        return _compiled_jax_envs[(fixed_env_params, use_exported, egocentric)]
+    jax_env = LuxAIS3Env(auto_reset=False, fixed_env_params=fixed_env_params, egocentric=egocentric)
+    if use_exported:
+        jax_env = try_load_exported_env(jax_env)
+    key = jax.random.key(0)
+    # Reset the environment
+    # warm up with the fixed env params, params with other static fields would compile a different program
+    dummy_env_params = jax_env.default_params
+    key, reset_key = jax.random.split(key)
+    obs, state = jax_env.reset(reset_key, params=dummy_env_params)
+    # Take a random action
+    key, subkey = jax.random.split(key)
+    action = jax_env.action_space(dummy_env_params).sample(subkey)
+    # Step the environment and compile. Not sure why 2 steps? are needed
+    for _ in range(2):
+        key, subkey = jax.random.split(key)
+        obs, state, reward, terminated, truncated, info = jax_env.step(
+            subkey, state, action, params=dummy_env_params
+        )
+    jax.block_until_ready(state)
+    _compiled_jax_envs[(fixed_env_params, use_exported, egocentric)] = jax_env
+    return jax_env
+
+
+def _to_python_scalar(value: Any) -> Any:
+    """Converts a numpy scalar to a python scalar. float32 params are converted through their shortest decimal repr so
+    that e.g. 0.01 is not given to agents and saved in replays as 0.009999999776482582"""
+    if not isinstance(value, (np.ndarray, np.generic)):
+        return value
+    if np.issubdtype(value.dtype, np.floating):
+        # numpy prints the shortest repr that round trips in the scalar's own precision
+        return float(str(np.asarray(value)[()]))
+    return value.item()
+
+
 class LuxAIS3GymEnv(gym.Env):
-    def __init__(self, numpy_output: bool = False):
+    def __init__(
+        self,
+        numpy_output: bool = False,
+        map_bank: Optional[MapBank] = None,
+        engine: str = "jax",
+        egocentric: bool = False,
+        use_exported: bool = False,
+    ):
+        """engine is "jax" to run games with LuxAIS3Env or "numpy" to run them with the experimental NumpyLuxAIS3Env. LuxAIS3Env
+        is the reference implementation of the rules. The numpy engine steps a single game faster and plays the same game
+        from the same seed: params, maps and the random values of each step are drawn from the same jax keys as the jax
+        engine. Observations and states of the numpy engine are always numpy arrays.
+
+        If egocentric is True, player_1 observes the game and gives its actions in its egocentric frame, so both players can
+        be played by the same policy (see luxai_s3.egocentric). States are always in the real frame
+
+        use_exported is passed on to get_compiled_jax_env and has no effect with the numpy engine"""
+        if engine not in ["jax", "numpy"]:
+            raise ValueError(f"{engine} is not a valid engine, must be jax or numpy")
         self.numpy_output = numpy_output
+        self.engine = engine
         self.rng_key = jax.random.key(0)
-        self.jax_env = LuxAIS3Env(auto_reset=False)
+        if engine == "numpy":
+            self.jax_env = None
+            self.numpy_env = NumpyLuxAIS3Env(egocentric=egocentric)
+            fixed_env_params = self.numpy_env.fixed_env_params
+            self._step_noise = None
+            """rng keys, energy node deltas and tie break winners of the next steps, see _step_noise_chunk"""
+            self._step_noise_index = 0
+        else:
+            # the jax env is shared with all other gym envs in this process so it is only compiled once
+            self.jax_env = get_compiled_jax_env(use_exported=use_exported, egocentric=egocentric)
+            fixed_env_params = self.jax_env.fixed_env_params
+        self.map_bank = map_bank
+        """optional bank of pre-generated maps. Resets with a seed in the bank load its map instead of generating it"""
+        if map_bank is not None and map_bank_key(map_bank.fixed_env_params) != map_bank_key(fixed_env_params):
+            raise ValueError("map_bank was generated with different fixed env params than this env uses")
         self.env_params: EnvParams = EnvParams()
-
-        # auto run compiling steps here:
-        # print("Running compilation steps")
-        key = jax.random.key(0)
-        # Reset the environment
-        dummy_env_params = EnvParams(map_type=1)
-        key, reset_key = jax.random.split(key)
-        obs, state = self.jax_env.reset(reset_key, params=dummy_env_params)
-        # Take a random action
-        key, subkey = jax.random.split(key)
-        action = self.jax_env.action_space(dummy_env_params).sample(subkey)
-        # Step the environment and compile. Not sure why 2 steps? are needed
-        for _ in range(2):
-            key, subkey = jax.random.split(key)
-            obs, state, reward, terminated, truncated, info = self.jax_env.step(
-                subkey, state, action, params=dummy_env_params
-            )
-        # print("Finish compilation steps")
         low = np.zeros((self.env_params.max_units, 3))
         low[:, 1:] = -self.env_params.unit_sap_range
         high = np.ones((self.env_params.max_units, 3)) * 6
@@ -52,33 +158,25 @@ class LuxAIS3GymEnv(gym.Env):
         )
 
     def render(self):
-        self.jax_env.render(self.state, self.env_params)
+        if self.engine == "numpy":
+            self.numpy_env.render(self.state, self.env_params)
+        else:
+            self.jax_env.render(self.state, self.env_params)
 
     def reset(
         self, *, seed: int | None = None, options: dict[str, Any] | None = None
     ) -> tuple[Any, dict[str, Any]]:
-        if seed is not None:
-            self.rng_key = jax.random.key(seed)
-        self.rng_key, reset_key = jax.random.split(self.rng_key)
-        # generate random game parameters
-        # TODO (stao): check why this keeps recompiling when marking structs as static args
-        randomized_game_params = dict()
-        for k, v in env_params_ranges.items():
-            self.rng_key, subkey = jax.random.split(self.rng_key)
-            randomized_game_params[k] = jax.random.choice(
-                subkey, jax.numpy.array(v)
-            ).item()
-        params = EnvParams(**randomized_game_params)
-        if options is not None and "params" in options:
-            params = options["params"]
-
-        self.env_params = params
-        obs, self.state = self.jax_env.reset(reset_key, params=params)
+        if self.engine == "numpy":
+            obs, params = self._reset_numpy(seed, options)
+        else:
+            obs, params = self._reset_jax(seed, options)
         if self.numpy_output:
             obs = to_numpy(flax.serialization.to_state_dict(obs))
 
         # only keep the following game parameters available to the agent
-        params_dict = dataclasses.asdict(params)
+        params_dict = {
+            k: _to_python_scalar(v) for k, v in jax.device_get(dataclasses.asdict(params)).items()
+        }
         params_dict_kept = dict()
         for k in [
             "max_units",
@@ -97,13 +195,82 @@ class LuxAIS3GymEnv(gym.Env):
             params=params_dict_kept, full_params=params_dict, state=self.state
         )
 
+    def _reset_numpy(self, seed: int | None, options: dict[str, Any] | None):
+        # keys are split exactly like _reset_jax and step with the jax engine, so the same seed plays the same game
+        if seed is not None:
+            self.rng_key = jax.random.key(seed)
+        elif self._step_noise is not None and self._step_noise_index > 0:
+            self.rng_key = self._step_noise[0][self._step_noise_index - 1]
+        self._step_noise = None
+        self.rng_key, reset_key = jax.random.split(self.rng_key)
+        self.rng_key, params_key = jax.random.split(self.rng_key)
+        params = _sample_env_params(params_key)
+        if options is not None and "params" in options:
+            params = options["params"]
+        self.env_params = to_numpy_env_params(params)
+        if self.map_bank is not None and seed is not None and seed in self.map_bank:
+            map_state = self.map_bank.get(seed)
+        else:
+            map_state = jax.device_get(
+                _get_map_generator(self.numpy_env.fixed_env_params)(reset_key, self.numpy_env.fixed_env_params)
+            )
+        obs, self.state = self.numpy_env.reset_from_bank(map_state, params=self.env_params)
+        return obs, params
+
+    def _next_step_noise(self) -> StepNoise:
+        """The random values of the next step with the numpy engine, drawn in chunks of steps to save device calls"""
+        if self._step_noise is None or self._step_noise_index == NUMPY_ENGINE_NOISE_CHUNK_SIZE:
+            if self._step_noise is not None:
+                self.rng_key = self._step_noise[0][-1]
+            rng_keys, energy_node_deltas, tie_break_winners = _step_noise_chunk(
+                self.rng_key,
+                self.env_params.energy_node_drift_magnitude,
+                self.numpy_env.fixed_env_params.max_energy_nodes,
+                self.numpy_env.fixed_env_params.num_teams,
+                NUMPY_ENGINE_NOISE_CHUNK_SIZE,
+            )
+            self._step_noise = (rng_keys, *jax.device_get((energy_node_deltas, tie_break_winners)))
+            self._step_noise_index = 0
+        _, energy_node_deltas, tie_break_winners = self._step_noise
+        noise = StepNoise(
+            energy_node_deltas=energy_node_deltas[self._step_noise_index],
+            tie_break_winner=int(tie_break_winners[self._step_noise_index]),
+        )
+        self._step_noise_index += 1
+        return noise
+
+    def _reset_jax(self, seed: int | None, options: dict[str, Any] | None):
+        if seed is not None:
+            self.rng_key = jax.random.key(seed)
+        self.rng_key, reset_key = jax.random.split(self.rng_key)
+        # generate random game parameters
+        self.rng_key, params_key = jax.random.split(self.rng_key)
+        params = _sample_env_params(params_key)
+        if options is not None and "params" in options:
+            params = options["params"]
+
+        # canonical params have the same dtypes whatever the sampled values are, so resets never trigger a recompile
+        self.env_params = canonicalize_env_params(params)
+        if self.map_bank is not None and seed is not None and seed in self.map_bank:
+            obs, self.state = self.jax_env.reset_from_bank(
+                reset_key, self.map_bank.get(seed), params=self.env_params
+            )
+        else:
+            obs, self.state = self.jax_env.reset(reset_key, params=self.env_params)
+        return obs, params
+
     def step(
         self, action: Any
     ) -> tuple[Any, SupportsFloat, bool, bool, dict[str, Any]]:
-        self.rng_key, step_key = jax.random.split(self.rng_key)
-        obs, self.state, reward, terminated, truncated, info = self.jax_env.step(
-            step_key, self.state, action, self.env_params
-        )
+        if self.engine == "numpy":
+            obs, self.state, reward, terminated, truncated, info = self.numpy_env.step(
+                None, self.state, action, self.env_params, noise=self._next_step_noise()
+            )
+        else:
+            self.rng_key, step_key = jax.random.split(self.rng_key)
+            obs, self.state, reward, terminated, truncated, info = self.jax_env.step(
+                step_key, self.state, action, self.env_params
+            )
         if self.numpy_output:
             obs = to_numpy(flax.serialization.to_state_dict(obs))
             reward = to_numpy(reward)
@@ -113,7 +280,157 @@ class LuxAIS3GymEnv(gym.Env):
         return obs, reward, terminated, truncated, info
 
 
-# TODO: vectorized gym wrapper
+class LuxAIS3VectorEnv(gym.vector.VectorEnv):
+    """Vectorized gymnasium env running num_envs games on device.
+
+    All env states are kept on device and stepped with one jitted call of the vmapped jax env. Each env samples its own
+    randomized EnvParams on reset. Observations, rewards, terminations and truncations are returned as numpy arrays with a
+    leading num_envs axis, fetched with one device to host transfer per step.
+
+    Envs that finished an episode are reset on the next call to step (gymnasium's next step autoreset mode). For those envs
+    step returns the initial observation of the new episode and rewards, terminations and truncations of 0.
+
+    Auto resets draw their map from a ResetPool of reset_pool_size maps (num_envs by default) instead of generating new
+    maps, so a step that resets some envs only costs about one more step rather than generating a map for every env. The
+    pool is generated on reset and refilled after every reset_pool_size steps with auto resets, see ResetPool for how
+    maps repeat between refills.
+    """
+
+    metadata = {"autoreset_mode": gym.vector.AutoresetMode.NEXT_STEP}
+
+    def __init__(
+        self, num_envs: int, fixed_env_params: EnvParams = EnvParams(), reset_pool_size: Optional[int] = None
+    ):
+        self.num_envs = num_envs
+        self.reset_pool_size = reset_pool_size if reset_pool_size is not None else num_envs
+        self.reset_pool: ResetPool = None
+        """maps auto resets draw from, generated on reset"""
+        self.rng_key = jax.random.key(0)
+        self.jax_env = LuxAIS3Env(auto_reset=False, fixed_env_params=fixed_env_params)
+        self.env_params: EnvParams = None
+        """env params of all envs, batched along the first axis"""
+        self.state: EnvState = None
+        """env states of all envs, batched along the first axis"""
+        self._autoreset_envs = np.zeros(num_envs, dtype=bool)
+
+        def sample_params(key):
+            # fields that are not randomized, including all static ones, are those of the fixed env params
+            return sample_env_params(key, batch=num_envs, params=fixed_env_params)
+
+        def reset_envs(key):
+            key, params_key = jax.random.split(key)
+            params = sample_params(params_key)
+            obs, state = jax.vmap(self.jax_env.reset)(
+                jax.random.split(key, num_envs), params
+            )
+            return obs, state, params
+
+        def step_envs(key, state, action, params):
+            obs, state, reward, terminated, truncated, _ = jax.vmap(self.jax_env.step)(
+                jax.random.split(key, num_envs), state, action, params
+            )
+            return obs, state, reward, terminated, truncated
+
+        def step_and_reset_envs(key, state, action, params, autoreset_envs, reset_pool):
+            key, reset_key = jax.random.split(key)
+            obs, state, reward, terminated, truncated = step_envs(
+                key, state, action, params
+            )
+            reset_key, params_key = jax.random.split(reset_key)
+            reset_params = sample_params(params_key)
+            reset_state = jax.vmap(self.jax_env.reset_env_state_from_pool, in_axes=(0, None, 0))(
+                jax.random.split(reset_key, num_envs), reset_pool, reset_params
+            )
+            reset_obs = jax.vmap(lambda state, params: self.jax_env.get_obs(state, params=params))(
+                reset_state, reset_params
+            )
+
+            def select(reset_value, value):
+                return jnp.where(
+                    autoreset_envs.reshape((-1,) + (1,) * (value.ndim - 1)),
+                    reset_value,
+                    value,
+                )
+
+            obs, state, params = jax.tree.map(
+                select, (reset_obs, reset_state, reset_params), (obs, state, params)
+            )
+            reward, terminated, truncated = jax.tree.map(
+                lambda x: select(jnp.zeros_like(x), x), (reward, terminated, truncated)
+            )
+            return obs, state, params, reward, terminated, truncated
+
+        self._reset_envs = jax.jit(reset_envs)
+        # the batched state is donated, so stepping updates it in place instead of allocating a new copy every step
+        self._step_envs = jax.jit(step_envs, donate_argnums=(1,))
+        self._step_and_reset_envs = jax.jit(step_and_reset_envs, donate_argnums=(1,))
+
+        low = np.zeros((fixed_env_params.max_units, 3))
+        low[:, 1:] = -fixed_env_params.unit_sap_range
+        high = np.ones((fixed_env_params.max_units, 3)) * 6
+        high[:, 1:] = fixed_env_params.unit_sap_range
+        self.single_action_space = gym.spaces.Dict(
+            dict(
+                player_0=gym.spaces.Box(low=low, high=high, dtype=np.int16),
+                player_1=gym.spaces.Box(low=low, high=high, dtype=np.int16),
+            )
+        )
+        self.action_space = gym.vector.utils.batch_space(
+            self.single_action_space, num_envs
+        )
+
+    def reset(
+        self, *, seed: int | None = None, options: dict[str, Any] | None = None
+    ) -> tuple[Any, dict[str, Any]]:
+        if seed is not None:
+            self.rng_key = jax.random.key(seed)
+        self.rng_key, reset_key, pool_key = jax.random.split(self.rng_key, 3)
+        obs, self.state, self.env_params = self._reset_envs(reset_key)
+        self.reset_pool = ResetPool(
+            self.jax_env, self.reset_pool_size, pool_key, refill_every=self.reset_pool_size
+        )
+        self._autoreset_envs = np.zeros(self.num_envs, dtype=bool)
+        obs = jax.device_get(obs)
+        return flax.serialization.to_state_dict(obs), dict()
+
+    def step(
+        self, action: Any
+    ) -> tuple[Any, Any, Any, Any, dict[str, Any]]:
+        self.rng_key, step_key = jax.random.split(self.rng_key)
+        action = jax.tree.map(lambda x: jnp.asarray(x, dtype=jnp.int16), action)
+        if self._autoreset_envs.any():
+            (
+                obs,
+                self.state,
+                self.env_params,
+                reward,
+                terminated,
+                truncated,
+            ) = self._step_and_reset_envs(
+                step_key,
+                self.state,
+                action,
+                self.env_params,
+                jnp.asarray(self._autoreset_envs),
+                self.reset_pool.get(),
+            )
+        else:
+            obs, self.state, reward, terminated, truncated = self._step_envs(
+                step_key, self.state, action, self.env_params
+            )
+        obs, reward, terminated, truncated = jax.device_get(
+            (obs, reward, terminated, truncated)
+        )
+        self._autoreset_envs = np.logical_or.reduce(
+            [terminated[k] | truncated[k] for k in terminated]
+        )
+        return (
+            flax.serialization.to_state_dict(obs),
+            reward,
+            terminated,
+            truncated,
+            dict(),
+        )
 
 
 class RecordEpisode(gym.Wrapper):
@@ -0,0 +1,73 @@
+import time
+from dataclasses import dataclass
+from typing import Annotated
+
+import jax
+import tyro
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams, sample_env_params
+
+
+@dataclass
+class Args:
+    trials_per_benchmark: Annotated[int, tyro.conf.arg(aliases=["-t"])] = 5
+    num_envs: Annotated[int, tyro.conf.arg(aliases=["-n"])] = 1024
+    num_steps: int = 100
+    seed: int = 0
+
+
+if __name__ == "__main__":
+    """Cost of computing the energy field from the precomputed distance table, which step_env_state does every step,
+    compared to the whole step. Both for a single unbatched env and for num_envs envs under jax.vmap.
+
+    Skipping the computation on steps without energy node drift with a lax.cond only pays off for unbatched envs. Under
+    jax.vmap the drift condition is batched and the cond lowers to a select that computes the energy field anyway.
+    """
+    args = tyro.cli(Args)
+    env = LuxAIS3Env(auto_reset=False, fixed_env_params=EnvParams())
+    action_space = env.action_space()
+
+    def benchmark(name, fn, *fn_args, num_envs):
+        jax.block_until_ready(fn(*fn_args))
+        stime = time.time()
+        for _ in range(args.trials_per_benchmark):
+            jax.block_until_ready(fn(*fn_args))
+        dt = (time.time() - stime) / args.trials_per_benchmark / args.num_steps / num_envs
+        print(f"{name}: {dt * 1e6:0.3f} us per env step")
+
+    for num_envs in [1, args.num_envs]:
+        rng_key, params_key, reset_key = jax.random.split(jax.random.key(args.seed), 3)
+        params = sample_env_params(params_key, batch=num_envs)
+        _, state = jax.vmap(env.reset)(jax.random.split(reset_key, num_envs), params)
+        if num_envs == 1:
+            # run the single env unbatched, so conds inside the step are real branches
+            params, state = jax.tree.map(lambda x: x[0], (params, state))
+            step_env_state, compute_energy_features = env.step_env_state, env.compute_energy_features
+            sample_action = action_space.sample
+            name = "unbatched"
+        else:
+            step_env_state = jax.vmap(env.step_env_state)
+            compute_energy_features = jax.vmap(env.compute_energy_features)
+            sample_action = jax.vmap(action_space.sample)
+            name = f"vmap of {num_envs}"
+
+        def split(key):
+            return key if num_envs == 1 else jax.random.split(key, num_envs)
+
+        @jax.jit
+        def run_steps(rng_key, state):
+            def take_step(state, key):
+                action_key, step_key = jax.random.split(key)
+                return step_env_state(split(step_key), state, sample_action(split(action_key)), params)[0], None
+
+            return jax.lax.scan(take_step, state, jax.random.split(rng_key, args.num_steps))[0]
+
+        @jax.jit
+        def run_energy_features(state):
+            def take_step(state, _):
+                return compute_energy_features(state, params), None
+
+            return jax.lax.scan(take_step, state, length=args.num_steps)[0]
+
+        benchmark(f"step_env_state, {name}", run_steps, rng_key, state, num_envs=num_envs)
+        benchmark(f"compute_energy_features, {name}", run_energy_features, state, num_envs=num_envs)
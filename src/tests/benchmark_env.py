@@ -6,7 +6,7 @@ import jax.numpy as jnp
 import tyro
 from luxai_s3.params import EnvParams
 from luxai_s3.env import LuxAIS3Env
-from luxai_s3.params import env_params_ranges
+from luxai_s3.params import sample_env_params
 from luxai_s3.profiler import Profiler
 
 @dataclass
@@ -36,19 +36,8 @@ if __name__ == "__main__":
     step_fn = jax.vmap(env.step)
 
     # sample random params initially
-    def sample_params(rng_key):
-        randomized_game_params = dict()
-        for k, v in env_params_ranges.items():
-            rng_key, subkey = jax.random.split(rng_key)
-            if isinstance(v[0], int):
-                randomized_game_params[k] = jax.random.choice(subkey, jax.numpy.array(v, dtype=jnp.int16))
-            else:
-                randomized_game_params[k] = jax.random.choice(subkey, jax.numpy.array(v, dtype=jnp.float32))
-        params = EnvParams(**randomized_game_params)
-        return params
-
     rng_key, subkey = jax.random.split(rng_key)
-    env_params = jax.vmap(sample_params)(jax.random.split(subkey, num_envs))
+    env_params = sample_env_params(subkey, batch=num_envs)
     action_space = env.action_space() # note that this can generate sap actions beyond range atm
     sample_action = jax.vmap(action_space.sample)
     obs, state = reset_fn(jax.random.split(subkey, num_envs), env_params)
@@ -112,6 +101,36 @@ if __name__ == "__main__":
     profiler.profile(partial(benchmark_reset_jax_lax_scan_jax_step, rng_key), "reset + jax.lax.scan(jax.step)", total_steps=max_episode_steps, num_envs=num_envs, trials=args.trials_per_benchmark)
     profiler.log_stats("reset + jax.lax.scan(jax.step)")
 
+    step_state_fn = jax.vmap(env.step_state)
+    def run_episode_state_only(rng_key, state, env_params):
+        def take_step(carry, _):
+            rng_key, state = carry
+            rng_key, subkey = jax.random.split(rng_key)
+            state, reward, terminated_dict, truncated_dict = step_state_fn(
+                jax.random.split(subkey, num_envs), 
+                state, 
+                sample_action(jax.random.split(subkey, num_envs)), 
+                env_params
+            )
+            return (rng_key, state), (state, reward, terminated_dict, truncated_dict)
+        _, (state, reward, terminated_dict, truncated_dict) = jax.lax.scan(take_step, (rng_key, state), length=max_episode_steps, unroll=1)
+        return state, reward, terminated_dict, truncated_dict
+    # compile the scan
+    if args.verbose: print("Compiling run_episode_state_only")
+    run_episode_state_only = jax.jit(run_episode_state_only)
+    run_episode_state_only(subkey, state, env_params)
+    if args.verbose: print("Compiling run_episode_state_only done")
+
+    def benchmark_reset_jax_lax_scan_jax_step_state(rng_key):
+        rng_key, subkey = jax.random.split(rng_key)
+        obs, state = reset_fn(jax.random.split(subkey, num_envs), env_params)
+        rng_key, subkey = jax.random.split(rng_key)
+        # no observations are built or stacked, only states and rewards
+        state, reward, terminated_dict, truncated_dict = run_episode_state_only(subkey, state, env_params)
+        jax.block_until_ready(state)
+    profiler.profile(partial(benchmark_reset_jax_lax_scan_jax_step_state, rng_key), "reset + jax.lax.scan(jax.step_state)", total_steps=max_episode_steps, num_envs=num_envs, trials=args.trials_per_benchmark)
+    profiler.log_stats("reset + jax.lax.scan(jax.step_state)")
+
     def run_episode_and_reset(rng_key, env_params):
         rng_key, subkey = jax.random.split(rng_key)
         obs, state = reset_fn(jax.random.split(subkey, num_envs), env_params)
@@ -138,3 +157,19 @@ if __name__ == "__main__":
         jax.block_until_ready(state)
     profiler.profile(partial(benchmark_jit_reset_lax_scan_jax_step, rng_key), "jit(reset + jax.lax.scan(jax.step))", total_steps=max_episode_steps, num_envs=num_envs, trials=args.trials_per_benchmark)
     profiler.log_stats("jit(reset + jax.lax.scan(jax.step))")
+
+    # env.rollout scans in chunks that end at episode boundaries and only resets between them
+    rollout_fn = jax.jit(jax.vmap(
+        partial(env.rollout, policy_fn=lambda key, obs: action_space.sample(key), num_steps=max_episode_steps, outputs=("reward",)),
+    ))
+    if args.verbose: print("Compiling rollout")
+    jax.block_until_ready(rollout_fn(jax.random.split(subkey, num_envs), state, env_params))
+    if args.verbose: print("Compiling rollout done")
+    def benchmark_reset_rollout(rng_key):
+        rng_key, subkey = jax.random.split(rng_key)
+        obs, state = reset_fn(jax.random.split(subkey, num_envs), env_params)
+        rng_key, subkey = jax.random.split(rng_key)
+        obs, state, outputs = rollout_fn(jax.random.split(subkey, num_envs), state, env_params)
+        jax.block_until_ready(state)
+    profiler.profile(partial(benchmark_reset_rollout, rng_key), "reset + jax.rollout", total_steps=max_episode_steps, num_envs=num_envs, trials=args.trials_per_benchmark)
+    profiler.log_stats("reset + jax.rollout")
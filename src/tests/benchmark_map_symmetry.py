@@ -0,0 +1,56 @@
+import time
+from dataclasses import dataclass
+from typing import Annotated
+
+import jax
+import tyro
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams
+
+
+@dataclass
+class Args:
+    trials_per_benchmark: Annotated[int, tyro.conf.arg(aliases=["-t"])] = 20
+    map_size: int = 24
+    num_envs: int = 64
+    seed: int = 0
+
+
+if __name__ == "__main__":
+    """Compares computing the energy field and generating states with and without EnvParams.exploit_map_symmetry,
+    both for unbatched envs and for num_envs envs under jax.vmap.
+
+    Under jax.vmap the symmetry check lowers to a select that evaluates both the mirrored and the full computation, so
+    the saving is largest for unbatched envs. Resets mirror the freshly generated nodes without checking them.
+    """
+    args = tyro.cli(Args)
+
+    def benchmark(name, fn, *fn_args):
+        jax.block_until_ready(fn(*fn_args))
+        stime = time.time()
+        for _ in range(args.trials_per_benchmark):
+            jax.block_until_ready(fn(*fn_args))
+        dt = (time.time() - stime) / args.trials_per_benchmark / args.num_envs
+        print(f"{name}: {dt * 1e6:0.3f} us per env")
+
+    for exploit_map_symmetry in [False, True]:
+        fixed_env_params = EnvParams(
+            map_width=args.map_size, map_height=args.map_size, exploit_map_symmetry=exploit_map_symmetry
+        )
+        env = LuxAIS3Env(auto_reset=False, fixed_env_params=fixed_env_params)
+        env_params = env.default_params
+        keys = jax.random.split(jax.random.key(args.seed), args.num_envs)
+        _, states = jax.vmap(env.reset, in_axes=(0, None))(keys, env_params)
+
+        def energy_features(state):
+            return env.compute_energy_features(state, env_params).map_features.energy
+
+        def reset(key):
+            return env.reset_env(key, env_params)[1]
+
+        print(f"exploit_map_symmetry={exploit_map_symmetry}, {args.map_size}x{args.map_size} map")
+        # lax.map runs the envs one after the other like unbatched envs
+        benchmark("  compute_energy_features, unbatched", jax.jit(lambda s: jax.lax.map(energy_features, s)), states)
+        benchmark(f"  compute_energy_features, vmap of {args.num_envs}", jax.jit(jax.vmap(energy_features)), states)
+        benchmark("  reset, unbatched", jax.jit(lambda k: jax.lax.map(reset, k)), keys)
+        benchmark(f"  reset, vmap of {args.num_envs}", jax.jit(jax.vmap(reset)), keys)
@@ -0,0 +1,54 @@
+import time
+from dataclasses import dataclass
+from typing import Annotated
+
+import jax
+import numpy as np
+import tyro
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.numpy_env import NumpyLuxAIS3Env, sample_numpy_env_params, to_numpy_env_params
+
+
+@dataclass
+class Args:
+    num_steps: Annotated[int, tyro.conf.arg(aliases=["-n"])] = 505
+    seed: int = 0
+
+
+if __name__ == "__main__":
+    """Latency of stepping a single game with the numpy engine, compared to the jitted jax engine"""
+    args = tyro.cli(Args)
+    rng = np.random.default_rng(args.seed)
+    env = NumpyLuxAIS3Env()
+    params = to_numpy_env_params(sample_numpy_env_params(rng))
+    actions = []
+    for _ in range(args.num_steps):
+        action = np.zeros((2, env.fixed_env_params.max_units, 3), dtype=np.int16)
+        action[..., 0] = rng.integers(0, 6, size=action.shape[:2])
+        action[..., 1:] = rng.integers(-3, 4, size=(*action.shape[:2], 2))
+        actions.append(dict(player_0=action[0], player_1=action[1]))
+
+    def benchmark(name, step, state):
+        stime = time.perf_counter()
+        for action in actions:
+            state = step(state, action)
+        dt = (time.perf_counter() - stime) / args.num_steps
+        print(f"{name}: {dt * 1e6:0.1f} us per step")
+
+    _, state = env.reset(rng, params)
+    benchmark("numpy step", lambda state, action: env.step(rng, state, action, params)[1], state)
+    benchmark("numpy step_env_state", lambda state, action: env.step_env_state(rng, state, action, params)[0], state)
+
+    jax_env = LuxAIS3Env(auto_reset=False)
+    jax_params = jax_env.default_params
+    key = jax.random.key(args.seed)
+    _, jax_state = jax_env.reset(key, jax_params)
+    jax_env.step(key, jax_state, actions[0], jax_params)
+
+    def jax_step(state, action):
+        # an agent needs the observations on the host every step
+        obs, state, *_ = jax_env.step(key, state, action, jax_params)
+        jax.device_get(obs)
+        return state
+
+    benchmark("jax step", jax_step, jax_state)
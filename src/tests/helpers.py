@@ -0,0 +1,32 @@
+"""Helpers shared by the tests"""
+import jax
+import numpy as np
+
+from luxai_s3.params import EnvParams, sample_env_params
+
+
+def assert_trees_equal(expected, actual, name: str = "", check_dtypes: bool = True):
+    """Assert that two pytrees have the same structure and exactly equal leaves, of the same dtypes if check_dtypes. Leaves
+    may be jax or numpy arrays. name prefixes the path of a mismatching leaf in the error message"""
+    expected = jax.tree_util.tree_flatten_with_path(jax.device_get(expected))[0]
+    actual = jax.tree_util.tree_flatten_with_path(jax.device_get(actual))[0]
+    assert [path for path, _ in expected] == [path for path, _ in actual], name
+    for (path, x), (_, y) in zip(expected, actual):
+        where = f"{name}{jax.tree_util.keystr(path)}"
+        if check_dtypes:
+            assert np.asarray(x).dtype == np.asarray(y).dtype, where
+        np.testing.assert_array_equal(np.asarray(x), np.asarray(y), err_msg=where)
+
+
+def trees_equal(x, y) -> bool:
+    """Whether two pytrees have the same structure and exactly equal leaves"""
+    return jax.tree.structure(x) == jax.tree.structure(y) and all(
+        np.array_equal(np.asarray(a), np.asarray(b)) for a, b in zip(jax.tree.leaves(x), jax.tree.leaves(y))
+    )
+
+
+def sample_params_and_keys(seed: int = 0) -> tuple[jax.Array, EnvParams, jax.Array]:
+    """Randomized params and the keys to reset an env with them and step it afterwards. Returns the step key, the params
+    and the reset key"""
+    key, params_key, reset_key = jax.random.split(jax.random.key(seed), 3)
+    return key, sample_env_params(params_key), reset_key
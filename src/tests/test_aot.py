@@ -0,0 +1,82 @@
+import os
+import struct
+
+import flax.serialization
+import jax
+import numpy as np
+import pytest
+
+from luxai_s3 import aot
+from luxai_s3.aot import ExportedLuxAIS3Env, export_env, exported_env_path, load_exported_env, try_load_exported_env
+from luxai_s3.env import LuxAIS3Env
+
+from helpers import assert_trees_equal
+
+
+def test_exported_env_round_trip(tmp_path, monkeypatch):
+    """Exported reset and step saved to disk and loaded again give the same outputs as the jitted env, and calls the
+    exported executables do not fit fall back to the jitted env"""
+    cache_dir = str(tmp_path)
+    env = LuxAIS3Env(auto_reset=False)
+    params = env.default_params
+    export_env(env, cache_dir)
+    path = exported_env_path(env, cache_dir)
+    assert sorted(os.listdir(path)) == ["reset.bin", "step.bin"]
+    exported_env = load_exported_env(env, cache_dir)
+    assert isinstance(exported_env, ExportedLuxAIS3Env)
+
+    fallback_calls = []
+    for name in ["reset", "step"]:
+
+        def fallback(*args, _fn=getattr(env, name), _name=name):
+            fallback_calls.append(_name)
+            return _fn(*args)
+
+        monkeypatch.setattr(env, name, fallback)
+
+    key = jax.random.key(0)
+    expected_obs, expected_state = jax.jit(LuxAIS3Env.reset, static_argnums=0)(env, key, params)
+    obs, state = exported_env.reset(key, params)
+    assert_trees_equal((expected_obs, expected_state), (obs, state))
+
+    # int64 numpy actions are converted to the int16 actions the step was exported with
+    action = env.action_space(params).sample(jax.random.key(1))
+    numpy_action = {k: np.asarray(v, dtype=np.int64) for k, v in action.items()}
+    step_key = jax.random.key(2)
+    expected = jax.jit(LuxAIS3Env.step, static_argnums=0)(env, step_key, state, action, params)
+    assert_trees_equal(
+        flax.serialization.to_state_dict(expected),
+        flax.serialization.to_state_dict(exported_env.step(step_key, state, numpy_action, params)),
+    )
+    assert fallback_calls == []
+
+    # a raw uint32 key has a different shape and dtype than the exported typed key
+    obs, state = exported_env.reset(jax.random.PRNGKey(0), params)
+    assert fallback_calls == ["reset"]
+    assert_trees_equal((expected_obs, expected_state), (obs, state))
+
+
+def test_exported_env_cache_key(tmp_path, monkeypatch):
+    """Executables are saved per luxai_s3 version and source. Corrupted executables raise, while a cache directory that
+    can not be written falls back to the jitted env with a warning"""
+    cache_dir = str(tmp_path)
+    env = LuxAIS3Env(auto_reset=False)
+    path = exported_env_path(env, cache_dir)
+    monkeypatch.setattr(aot, "_luxai_s3_version", lambda: "0.0.0")
+    assert exported_env_path(env, cache_dir) != path
+    monkeypatch.undo()
+    monkeypatch.setattr(aot, "_source_hash", lambda: "edited")
+    assert exported_env_path(env, cache_dir) != path
+    monkeypatch.undo()
+
+    os.makedirs(path)
+    for name in ["reset.bin", "step.bin"]:
+        with open(os.path.join(path, name), "wb") as f:
+            f.write(b"corrupted")
+    with pytest.raises(struct.error):
+        try_load_exported_env(env, cache_dir)
+
+    not_a_dir = os.path.join(cache_dir, "not_a_dir")
+    open(not_a_dir, "w").close()
+    with pytest.warns(UserWarning, match="Could not load exported env"):
+        assert try_load_exported_env(env, not_a_dir) is env
@@ -0,0 +1,81 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams, canonicalize_env_params, sample_env_params
+from luxai_s3.state import check_packable_params, pack_env_state, unpack_env_state
+
+from helpers import sample_params_and_keys
+
+
+def nbytes(tree) -> int:
+    return sum(x.nbytes for x in jax.tree.leaves(tree))
+
+
+def test_compact_state_round_trip():
+    """Unpacking the compact states of a full episode gives back exactly the states, which are several times larger"""
+    env = LuxAIS3Env(auto_reset=False)
+    rollout_key, params, reset_key = sample_params_and_keys()
+    _, state = env.reset(reset_key, params)
+    action_space = env.action_space(params)
+    _, _, outputs = env.rollout(
+        rollout_key,
+        state,
+        params,
+        policy_fn=lambda key, obs: action_space.sample(key),
+        num_steps=505,
+        outputs=("state", "compact_state"),
+    )
+    states, compact_states = outputs["state"], outputs["compact_state"]
+    assert int(states.units_mask.sum()) > 0
+    unpacked = jax.jit(jax.vmap(unpack_env_state))(compact_states)
+    assert jax.tree.structure(states) == jax.tree.structure(unpacked)
+    for x, y in zip(jax.tree.leaves(states), jax.tree.leaves(unpacked)):
+        assert x.dtype == y.dtype
+        np.testing.assert_array_equal(np.asarray(x), np.asarray(y))
+    assert nbytes(states) > 3 * nbytes(compact_states)
+    # a single state packs the same way
+    compact = pack_env_state(jax.tree.map(lambda x: x[100], states))
+    jax.tree.map(np.testing.assert_array_equal, compact, jax.tree.map(lambda x: x[100], compact_states))
+
+
+def test_compact_state_bounds():
+    """Values that do not fit in int8 are packed in wider dtypes when the fixed env params allow them, and raise an error
+    otherwise instead of wrapping around"""
+    fixed_env_params = EnvParams(max_units=32, max_energy_per_tile=200)
+    env = LuxAIS3Env(auto_reset=False, fixed_env_params=fixed_env_params)
+    _, state = env.reset(jax.random.key(0), env.default_params)
+    state = state.replace(
+        map_features=state.map_features.replace(energy=state.map_features.energy.at[0, 0].set(200)),
+        vision_power_map=state.vision_power_map.at[0, 0, 0].set(32 * 5),
+        sensor_mask=state.sensor_mask.at[0, 0, 0].set(True),
+    )
+    compact = pack_env_state(state, fixed_env_params)
+    assert compact.map_energy.dtype == jnp.int16 and compact.vision_power_map.dtype == jnp.int16
+    assert compact.units_position.dtype == jnp.int8
+    unpacked = unpack_env_state(compact, fixed_env_params)
+    for x, y in zip(jax.tree.leaves(state), jax.tree.leaves(unpacked)):
+        np.testing.assert_array_equal(np.asarray(x), np.asarray(y))
+    with pytest.raises(ValueError, match="map_features.energy"):
+        pack_env_state(state, EnvParams(max_units=32))
+
+
+def test_compact_state_params_bounds():
+    """Rollouts that pack states under jit check up front that the params keep states within the packed dtypes, for every
+    sampled param value"""
+    env = LuxAIS3Env(auto_reset=False)
+    params = sample_env_params(jax.random.key(0), batch=64)
+    check_packable_params(params, env.fixed_env_params)
+    params = canonicalize_env_params(EnvParams(max_energy_per_tile=200))
+    _, state = env.reset(jax.random.key(0), params)
+    with pytest.raises(ValueError, match="map_features.energy"):
+        env.rollout(
+            jax.random.key(1),
+            state,
+            params,
+            policy_fn=lambda key, obs: env.action_space(params).sample(key),
+            num_steps=4,
+            outputs=("compact_state",),
+        )
@@ -0,0 +1,79 @@
+import jax
+import numpy as np
+
+from luxai_s3.egocentric import egocentric_obs, mirror_action, mirror_map, mirror_positions
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.numpy_env import NumpyLuxAIS3Env, StepNoise, to_numpy_env_params
+
+from helpers import assert_trees_equal, sample_params_and_keys
+
+
+def random_actions(rng: np.random.Generator):
+    action = np.zeros((16, 3), dtype=np.int16)
+    action[:, 0] = rng.integers(0, 6, size=16)
+    action[:, 1:] = rng.integers(-4, 5, size=(16, 2))
+    return action
+
+
+def test_mirror():
+    """Mirroring positions, maps and actions is its own inverse and maps the start corner of team 1 to that of team 0"""
+    rng = np.random.default_rng(0)
+    action = rng.integers(-4, 7, size=(16, 3)).astype(np.int16)
+    np.testing.assert_array_equal(mirror_action(mirror_action(action)), action)
+    np.testing.assert_array_equal(mirror_action(action, xp=np), mirror_action(action))
+    action = np.array([[1, 0, 0], [3, 0, 0], [5, 2, -1]], dtype=np.int16)
+    np.testing.assert_array_equal(mirror_action(action), [[2, 0, 0], [4, 0, 0], [5, 1, -2]])
+    position = np.array([[23, 23], [-1, -1], [3, 1]], dtype=np.int16)
+    np.testing.assert_array_equal(mirror_positions(position), [[0, 0], [-1, -1], [22, 20]])
+    x = rng.integers(0, 10, size=(3, 24, 24))
+    np.testing.assert_array_equal(mirror_map(mirror_map(x)), x)
+    np.testing.assert_array_equal(mirror_map(x)[1], x[1][::-1, ::-1].T)
+
+
+def test_egocentric_env_matches_env():
+    """An egocentric env given the mirrored actions of player_1 plays exactly the same game as a regular env, and gives
+    player_1 its observation of that game in its egocentric frame"""
+    env = LuxAIS3Env(auto_reset=False)
+    egocentric_env = LuxAIS3Env(auto_reset=False, egocentric=True)
+    stacked_egocentric_env = LuxAIS3Env(auto_reset=False, egocentric=True, stacked_obs=True)
+    rng = np.random.default_rng(0)
+    key, params, reset_key = sample_params_and_keys()
+    obs, state = env.reset(reset_key, params)
+    egocentric_obs_0, egocentric_state = egocentric_env.reset(reset_key, params)
+    assert_trees_equal(obs["player_0"], egocentric_obs_0["player_0"])
+    assert_trees_equal(egocentric_obs(obs["player_1"], 1), egocentric_obs_0["player_1"])
+    for _ in range(100):
+        key, step_key = jax.random.split(key)
+        action = dict(player_0=random_actions(rng), player_1=random_actions(rng))
+        obs, state, reward, _, _, _ = env.step(step_key, state, action, params)
+        egocentric_action = dict(player_0=action["player_0"], player_1=mirror_action(action["player_1"], xp=np))
+        outputs = egocentric_env.step(step_key, egocentric_state, egocentric_action, params)
+        assert_trees_equal(state, outputs[1])
+        assert_trees_equal(reward, outputs[2])
+        assert_trees_equal(obs["player_0"], outputs[0]["player_0"])
+        assert_trees_equal(egocentric_obs(obs["player_1"], 1), outputs[0]["player_1"])
+        egocentric_state = outputs[1]
+        # stacked egocentric observations can be fed to one policy for both players
+        stacked_obs = stacked_egocentric_env.get_obs(state)
+        assert_trees_equal(outputs[0]["player_1"], jax.tree.map(lambda x: x[1], stacked_obs))
+
+
+def test_numpy_env_egocentric():
+    """The numpy engine gives the same egocentric observations as the jax engine and maps player_1's actions back the same
+    way"""
+    egocentric_env = LuxAIS3Env(auto_reset=False, egocentric=True)
+    numpy_env = NumpyLuxAIS3Env()
+    egocentric_numpy_env = NumpyLuxAIS3Env(egocentric=True)
+    rng = np.random.default_rng(0)
+    params = to_numpy_env_params(egocentric_env.default_params)
+    _, state = egocentric_env.reset(jax.random.key(0), egocentric_env.default_params)
+    state = jax.device_get(state)
+    noise = StepNoise(energy_node_deltas=np.zeros((3, 2), dtype=np.int16), tie_break_winner=0)
+    for _ in range(30):
+        action = dict(player_0=random_actions(rng), player_1=random_actions(rng))
+        assert_trees_equal(egocentric_env.get_obs(state), egocentric_numpy_env.get_obs(state))
+        mirrored_action = dict(player_0=action["player_0"], player_1=mirror_action(action["player_1"], xp=np))
+        outputs = egocentric_numpy_env.step(None, state, action, params, noise=noise)
+        expected = numpy_env.step(None, state, mirrored_action, params, noise=noise)
+        assert_trees_equal(expected[1], outputs[1])
+        state = outputs[1]
@@ -0,0 +1,61 @@
+import jax
+import numpy as np
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams
+from luxai_s3.state import (
+    flat_obs_channels,
+    flat_obs_to_obs,
+    flat_obs_to_state,
+    flat_obs_vector_fields,
+    obs_to_flat_obs,
+    state_to_flat_obs,
+)
+
+from helpers import assert_trees_equal
+
+
+def batched_rollout(num_envs: int = 4, num_steps: int = 20):
+    """Observations and states of a batch of envs after num_steps random steps"""
+    env = LuxAIS3Env(auto_reset=False)
+    params = env.default_params
+    reset_keys = jax.random.split(jax.random.key(0), num_envs)
+    obs, state = jax.vmap(env.reset, in_axes=(0, None))(reset_keys, params)
+    step = jax.jit(jax.vmap(env.step, in_axes=(0, 0, 0, None)))
+    sample_action = jax.vmap(env.action_space(params).sample)
+    key = jax.random.key(1)
+    for _ in range(num_steps):
+        key, step_key, action_key = jax.random.split(key, 3)
+        action = sample_action(jax.random.split(action_key, num_envs))
+        obs, state, _, _, _, _ = step(jax.random.split(step_key, num_envs), state, action, params)
+    return obs, state
+
+
+def test_flat_obs_round_trip():
+    """Encoding observations and states as flat obs is exactly inverted by decoding them, under jit and vmap"""
+    fixed_env_params = EnvParams()
+    obs, state = batched_rollout()
+    flat_state = jax.jit(jax.vmap(state_to_flat_obs))(state)
+    assert flat_state.spatial.shape == (4, len(flat_obs_channels(state=True)), 24, 24)
+    assert flat_state.vector.shape == (4, sum(size for _, size in flat_obs_vector_fields(state=True)))
+    assert_trees_equal(state, jax.jit(jax.vmap(flat_obs_to_state))(flat_state))
+    # decoding also works on a batch directly
+    assert_trees_equal(state, flat_obs_to_state(flat_state))
+
+    channels = flat_obs_channels(fixed_env_params)
+    for team in range(fixed_env_params.num_teams):
+        team_obs = obs[f"player_{team}"]
+        flat_obs = jax.jit(jax.vmap(obs_to_flat_obs))(team_obs)
+        assert flat_obs.spatial.shape == (4, len(channels), 24, 24)
+        assert_trees_equal(team_obs, jax.jit(jax.vmap(flat_obs_to_obs))(flat_obs))
+        # unit planes count and sum the energy of the visible units of each team
+        for t in range(fixed_env_params.num_teams):
+            counts = flat_obs.spatial[:, channels.index(f"unit_counts/{t}")]
+            energy = flat_obs.spatial[:, channels.index(f"unit_energy/{t}")]
+            mask = team_obs.units_mask[:, t]
+            np.testing.assert_array_equal(counts.sum(axis=(1, 2)), mask.sum(axis=1))
+            np.testing.assert_array_equal(
+                energy.sum(axis=(1, 2)), (team_obs.units.energy[:, t] * mask).sum(axis=1)
+            )
+        relic_nodes = flat_obs.spatial[:, channels.index("relic_nodes")]
+        np.testing.assert_array_equal(relic_nodes.sum(axis=(1, 2)), team_obs.relic_nodes_mask.sum(axis=1))
@@ -0,0 +1,82 @@
+import jax
+import numpy as np
+import pytest
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.numpy_env import NumpyLuxAIS3Env, to_numpy_env_params
+from luxai_s3.params import EnvParams, canonicalize_env_params
+from luxai_s3.state import pack_env_state, unpack_env_state
+
+from helpers import assert_trees_equal, sample_params_and_keys
+
+
+def full_obs(state):
+    """The observation every team gets of a state without fog of war"""
+    units_mask = np.asarray(state.units_mask)
+    relic_nodes_mask = np.asarray(state.relic_nodes_mask)
+    return dict(
+        position=np.where(units_mask[..., None], state.units.position, -1),
+        energy=np.where(units_mask, state.units.energy[..., 0], -1),
+        map_energy=np.asarray(state.map_features.energy),
+        tile_type=np.asarray(state.map_features.tile_type),
+        relic_nodes=np.where(relic_nodes_mask[..., None], state.relic_nodes, -1),
+    )
+
+
+def test_no_fog_of_war():
+    """Without fog of war the game plays out the same, every team observes the whole state and the numpy engine agrees"""
+    env = LuxAIS3Env(auto_reset=False)
+    no_fog_env = LuxAIS3Env(auto_reset=False, fixed_env_params=EnvParams(fog_of_war=False))
+    numpy_env = NumpyLuxAIS3Env(fixed_env_params=EnvParams(fog_of_war=False))
+    rng = np.random.default_rng(0)
+    key, params, reset_key = sample_params_and_keys()
+    no_fog_params = params.replace(fog_of_war=False)
+    _, state = env.reset(reset_key, params)
+    obs, no_fog_state = no_fog_env.reset(reset_key, no_fog_params)
+    for _ in range(60):
+        key, step_key = jax.random.split(key)
+        action = dict(
+            player_0=rng.integers(0, 6, size=(16, 3)).astype(np.int16),
+            player_1=rng.integers(0, 6, size=(16, 3)).astype(np.int16),
+        )
+        _, state, reward, _, _, _ = env.step(step_key, state, action, params)
+        obs, no_fog_state, no_fog_reward, _, _, _ = no_fog_env.step(step_key, no_fog_state, action, no_fog_params)
+        assert_trees_equal(
+            state.replace(sensor_mask=None, vision_power_map=None),
+            no_fog_state.replace(sensor_mask=None, vision_power_map=None),
+        )
+        assert_trees_equal(reward, no_fog_reward)
+        assert no_fog_state.sensor_mask.all() and not no_fog_state.vision_power_map.any()
+        expected = full_obs(no_fog_state)
+        for player in ["player_0", "player_1"]:
+            np.testing.assert_array_equal(obs[player].units_mask, no_fog_state.units_mask)
+            np.testing.assert_array_equal(obs[player].relic_nodes_mask, no_fog_state.relic_nodes_mask)
+            np.testing.assert_array_equal(obs[player].units.position, expected["position"])
+            np.testing.assert_array_equal(obs[player].units.energy, expected["energy"])
+            np.testing.assert_array_equal(obs[player].map_features.energy, expected["map_energy"])
+            np.testing.assert_array_equal(obs[player].map_features.tile_type, expected["tile_type"])
+            np.testing.assert_array_equal(obs[player].relic_nodes, expected["relic_nodes"])
+            assert obs[player].sensor_mask.all()
+        assert_trees_equal(obs, numpy_env.get_obs(jax.device_get(no_fog_state)))
+    numpy_state = numpy_env.step_env_state(
+        np.random.default_rng(0), jax.device_get(no_fog_state), action, to_numpy_env_params(no_fog_params)
+    )[0]
+    assert numpy_state.sensor_mask.all() and not numpy_state.vision_power_map.any()
+    assert_trees_equal(no_fog_state, unpack_env_state(pack_env_state(no_fog_state), EnvParams(fog_of_war=False)))
+
+
+def test_fog_of_war_mismatch():
+    """Params for a different fog of war mode than the env's fixed env params raise an error instead of being ignored"""
+    no_fog_env = LuxAIS3Env(auto_reset=False, fixed_env_params=EnvParams(fog_of_war=False))
+    numpy_env = NumpyLuxAIS3Env(fixed_env_params=EnvParams(fog_of_war=False))
+    assert not no_fog_env.default_params.fog_of_war and not numpy_env.default_params.fog_of_war
+    obs, state = no_fog_env.reset(jax.random.key(0), no_fog_env.default_params)
+    with pytest.raises(ValueError, match="fog_of_war"):
+        no_fog_env.reset(jax.random.key(0), canonicalize_env_params(EnvParams()))
+    action = no_fog_env.action_space().sample(jax.random.key(1))
+    with pytest.raises(ValueError, match="fog_of_war"):
+        no_fog_env.step(jax.random.key(1), state, action, canonicalize_env_params(EnvParams()))
+    with pytest.raises(ValueError, match="fog_of_war"):
+        numpy_env.step(
+            np.random.default_rng(0), jax.device_get(state), action, numpy_env.default_params.replace(fog_of_war=True)
+        )
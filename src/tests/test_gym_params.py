@@ -0,0 +1,17 @@
+import json
+
+from luxai_s3.params import env_params_ranges
+from luxai_s3.wrappers import LuxAIS3GymEnv
+
+
+def test_full_params_keep_their_decimal_values():
+    """Sampled params are canonicalized to float32 on device, agents and replays still get the decimal values of
+    env_params_ranges instead of e.g. 0.009999999776482582 for 0.01"""
+    for engine in ["jax", "numpy"]:
+        env = LuxAIS3GymEnv(numpy_output=True, engine=engine)
+        for seed in range(8):
+            _, info = env.reset(seed=seed)
+            full_params = json.loads(json.dumps(info["full_params"]))
+            for k, values in env_params_ranges.items():
+                assert full_params[k] in values
+            assert isinstance(full_params["max_steps_in_match"], int)
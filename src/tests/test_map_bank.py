@@ -0,0 +1,31 @@
+import jax
+import numpy as np
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.map_bank import MapBank, map_key_from_seed
+from luxai_s3.wrappers import LuxAIS3GymEnv
+
+from helpers import assert_trees_equal
+
+
+def test_map_bank(tmp_path):
+    """Maps round trip through the memory-mapped bank, and resetting from the bank gives the same game as generating the
+    map from the seed"""
+    MapBank(str(tmp_path)).add([3, 7])
+    map_bank = MapBank(str(tmp_path))
+    assert len(map_bank) == 2 and 3 in map_bank and 5 not in map_bank
+    assert all(isinstance(array, np.memmap) for array in map_bank._arrays.values())
+    env = LuxAIS3Env(auto_reset=False)
+    for seed in [3, 7]:
+        assert_trees_equal(
+            jax.jit(env.gen_map_state)(map_key_from_seed(seed), env.fixed_env_params), map_bank.get(seed)
+        )
+
+    gym_env = LuxAIS3GymEnv(numpy_output=True)
+    bank_gym_env = LuxAIS3GymEnv(numpy_output=True, map_bank=map_bank)
+    for seed in [3, 7]:
+        obs, info = gym_env.reset(seed=seed)
+        bank_obs, bank_info = bank_gym_env.reset(seed=seed)
+        assert_trees_equal(obs, bank_obs)
+        assert_trees_equal(info["state"], bank_info["state"])
+        assert info["full_params"] == bank_info["full_params"]
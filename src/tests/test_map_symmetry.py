@@ -0,0 +1,49 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams, canonicalize_env_params
+from luxai_s3.state import nodes_are_symmetric
+
+
+def test_exploit_map_symmetry():
+    """Mirroring map features of half of the nodes gives the same states, also once drift clipped at the map edges made
+    the energy nodes asymmetric"""
+    num_envs = 4
+    env = LuxAIS3Env(auto_reset=False)
+    symmetric_env = LuxAIS3Env(auto_reset=False, fixed_env_params=EnvParams(exploit_map_symmetry=True))
+    # energy nodes drift far every step, so they soon reach the map edges
+    params = canonicalize_env_params(EnvParams(energy_node_drift_speed=1.0, energy_node_drift_magnitude=5))
+    reset_keys = jax.random.split(jax.random.key(0), num_envs)
+    _, state = jax.vmap(env.reset, in_axes=(0, None))(reset_keys, params)
+    _, symmetric_state = jax.jit(jax.vmap(symmetric_env.reset, in_axes=(0, None)))(reset_keys, params)
+    step = jax.jit(jax.vmap(env.step_env_state, in_axes=(0, 0, 0, None)))
+    symmetric_step = jax.jit(jax.vmap(symmetric_env.step_env_state, in_axes=(0, 0, 0, None)))
+    # unbatched, the symmetry check is a real branch
+    unbatched_symmetric_step = jax.jit(symmetric_env.step_env_state)
+    sample_action = jax.vmap(env.action_space(params).sample)
+    is_symmetric = jax.vmap(lambda s: nodes_are_symmetric(s.energy_nodes, 24, 24, s.energy_node_fns, s.energy_nodes_mask))
+    assert is_symmetric(state).all()
+    # resets mirror the generated nodes without checking them
+    assert jax.tree.structure(state) == jax.tree.structure(symmetric_state)
+    for x, y in zip(jax.tree.leaves(state), jax.tree.leaves(symmetric_state)):
+        np.testing.assert_array_equal(np.asarray(x), np.asarray(y))
+    symmetric_counts = []
+    key = jax.random.key(1)
+    for _ in range(40):
+        key, step_key, action_key = jax.random.split(key, 3)
+        step_keys = jax.random.split(step_key, num_envs)
+        action = sample_action(jax.random.split(action_key, num_envs))
+        action = jnp.stack([action["player_0"], action["player_1"]], axis=1)
+        unbatched_state = unbatched_symmetric_step(
+            step_keys[0], jax.tree.map(lambda x: x[0], symmetric_state), action[0], params
+        )[0]
+        state = step(step_keys, state, action, params)[0]
+        symmetric_state = symmetric_step(step_keys, symmetric_state, action, params)[0]
+        for expected, actual in [(state, symmetric_state), (jax.tree.map(lambda x: x[0], state), unbatched_state)]:
+            assert jax.tree.structure(expected) == jax.tree.structure(actual)
+            for x, y in zip(jax.tree.leaves(expected), jax.tree.leaves(actual)):
+                np.testing.assert_array_equal(np.asarray(x), np.asarray(y))
+        symmetric_counts.append(int(is_symmetric(state).sum()))
+    assert max(symmetric_counts) > 0 and min(symmetric_counts) < num_envs
@@ -0,0 +1,132 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.numpy_env import NumpyLuxAIS3Env, StepNoise, to_numpy_env_params
+from luxai_s3.params import EnvParams, sample_env_params
+from luxai_s3.wrappers import LuxAIS3GymEnv
+
+from helpers import assert_trees_equal
+
+
+def jax_step_noise(key, params: EnvParams, fixed_env_params: EnvParams = EnvParams()) -> StepNoise:
+    """The random values LuxAIS3Env.step draws from key"""
+    key, _ = jax.random.split(key)
+    energy_node_deltas = jnp.round(
+        jax.random.uniform(
+            key=key,
+            shape=(fixed_env_params.max_energy_nodes // 2, 2),
+            minval=-params.energy_node_drift_magnitude,
+            maxval=params.energy_node_drift_magnitude,
+        )
+    ).astype(jnp.int16)
+    tie_break_winner = jax.random.randint(key, shape=(), minval=0, maxval=params.num_teams)
+    return StepNoise(
+        energy_node_deltas=np.asarray(energy_node_deltas), tie_break_winner=int(tie_break_winner)
+    )
+
+
+def random_actions(rng: np.random.Generator, params: EnvParams, fixed_env_params: EnvParams = EnvParams()):
+    """Random moves and saps, with sap targets mostly in range"""
+    actions = dict()
+    for t in range(fixed_env_params.num_teams):
+        action = np.zeros((fixed_env_params.max_units, 3), dtype=np.int16)
+        action[:, 0] = rng.integers(0, 6, size=fixed_env_params.max_units)
+        action[:, 1:] = rng.integers(
+            -params.unit_sap_range - 1, params.unit_sap_range + 2, size=(fixed_env_params.max_units, 2)
+        )
+        actions[f"player_{t}"] = action
+    return actions
+
+
+def test_numpy_env_matches_jax_env():
+    """Differential test of NumpyLuxAIS3Env against LuxAIS3Env. Every step both engines start from the state of the jax
+    engine and get the same actions and random values, and must give exactly the same state, observations, rewards,
+    terminations and truncations"""
+    env = LuxAIS3Env(auto_reset=False)
+    numpy_env = NumpyLuxAIS3Env()
+    rng = np.random.default_rng(0)
+    key = jax.random.key(0)
+    for episode in range(3):
+        key, params_key, reset_key = jax.random.split(key, 3)
+        params = sample_env_params(params_key)
+        numpy_params = to_numpy_env_params(params)
+        obs, state = env.reset(reset_key, params)
+        numpy_obs, numpy_state = numpy_env.reset_from_bank(
+            jax.device_get(env.gen_map_state(reset_key, params)), numpy_params
+        )
+        assert_trees_equal(state, numpy_state, "reset state")
+        assert_trees_equal(obs, numpy_obs, "reset obs")
+        episode_length = (params.max_steps_in_match + 1) * params.match_count_per_episode
+        for i in range(episode_length):
+            key, step_key = jax.random.split(key)
+            action = random_actions(rng, numpy_params)
+            outputs = numpy_env.step(
+                None,
+                jax.device_get(state),
+                action,
+                numpy_params,
+                noise=jax_step_noise(step_key, params),
+            )
+            obs, state, reward, terminated, truncated, info = env.step(step_key, state, action, params)
+            assert_trees_equal(
+                (obs, state, reward, terminated, truncated),
+                outputs[:5],
+                f"episode {episode} step {i} ",
+            )
+        assert truncated["player_0"]
+
+
+def test_numpy_env_reset():
+    """Maps generated by the numpy engine have the same structure as maps of the jax engine"""
+    env = LuxAIS3Env(auto_reset=False)
+    numpy_env = NumpyLuxAIS3Env()
+    obs, state = env.reset(jax.random.key(0), env.default_params)
+    for seed in range(5):
+        numpy_obs, numpy_state = numpy_env.reset(np.random.default_rng(seed))
+        assert jax.tree.structure(numpy_state) == jax.tree.structure(state)
+        for x, y in zip(jax.tree.leaves(state), jax.tree.leaves(numpy_state)):
+            assert x.shape == y.shape and x.dtype == y.dtype
+        # maps are symmetric
+        tile_type = numpy_state.map_features.tile_type
+        np.testing.assert_array_equal(tile_type, tile_type[::-1, ::-1].T)
+        np.testing.assert_array_equal(
+            numpy_state.relic_nodes_map_weights, numpy_state.relic_nodes_map_weights[::-1, ::-1].T
+        )
+
+
+def test_numpy_env_fixed_env_params():
+    """Energy nodes and teams follow the fixed env params"""
+    numpy_env = NumpyLuxAIS3Env(EnvParams(max_energy_nodes=8))
+    _, state = numpy_env.reset(np.random.default_rng(0))
+    assert state.energy_node_fns.shape == (8, 4) and state.energy_nodes.shape == (8, 2)
+    np.testing.assert_array_equal(state.energy_node_fns[4], state.energy_node_fns[0])
+    with pytest.raises(ValueError, match="num_teams"):
+        NumpyLuxAIS3Env(EnvParams(num_teams=3))
+
+
+def test_gym_env_numpy_engine():
+    """LuxAIS3GymEnv with the numpy engine plays the same games from the same seed as with the jax engine, across chunks of
+    step noise and resets without a seed. No-op actions leave the game symmetric, so matches end in tie breaks"""
+    env = LuxAIS3GymEnv(numpy_output=True)
+    numpy_env = LuxAIS3GymEnv(numpy_output=True, engine="numpy")
+    action = {k: np.zeros(space.shape, dtype=np.int16) for k, space in env.action_space.items()}
+    for seed in [0, None]:
+        obs, info = env.reset(seed=seed)
+        numpy_obs, numpy_info = numpy_env.reset(seed=seed)
+        assert info["full_params"] == numpy_info["full_params"]
+        assert_trees_equal((obs, info["state"]), (numpy_obs, numpy_info["state"]), f"seed {seed} reset ")
+        truncated = dict(player_0=False)
+        steps = 0
+        while not truncated["player_0"] and steps < 300:
+            obs, reward, terminated, truncated, info = env.step(action)
+            outputs = numpy_env.step(action)
+            assert_trees_equal(
+                (obs, reward, terminated, truncated, info["final_state"]),
+                outputs[:4] + (outputs[4]["final_state"],),
+                f"seed {seed} step {steps} ",
+            )
+            steps += 1
+    assert info["final_state"].team_wins.sum() > 0
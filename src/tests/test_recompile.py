@@ -0,0 +1,112 @@
+import jax
+import numpy as np
+from jax import monitoring
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams, canonicalize_env_params, env_params_ranges
+from luxai_s3.wrappers import LuxAIS3GymEnv, _compiled_jax_envs, get_compiled_jax_env
+
+
+def sample_params(rng: np.random.RandomState, as_python_scalars: bool) -> EnvParams:
+    """Sample randomized env params either as python scalars or as numpy values, like params coming from different sources"""
+    params = dict()
+    for k, v in env_params_ranges.items():
+        value = rng.choice(v)
+        params[k] = value.item() if as_python_scalars else value
+    return EnvParams(**params)
+
+
+def test_randomized_params_do_not_recompile():
+    """After warm up, resetting and stepping with canonicalized randomized params never compiles reset or step again"""
+    env = LuxAIS3Env(auto_reset=False)
+    rng = np.random.RandomState(0)
+    key = jax.random.key(0)
+    action = env.action_space().sample(key)
+
+    def run(params):
+        nonlocal key
+        params = canonicalize_env_params(params)
+        key, reset_key, step_key = jax.random.split(key, 3)
+        obs, state = env.reset(reset_key, params)
+        for _ in range(2):
+            obs, state, reward, terminated, truncated, info = env.step(
+                step_key, state, action, params
+            )
+
+    run(env.default_params)
+    reset_cache_size = LuxAIS3Env.reset._cache_size()
+    step_cache_size = LuxAIS3Env.step._cache_size()
+    for i in range(6):
+        run(sample_params(rng, as_python_scalars=i % 2 == 0))
+    # params with a python int for a float field
+    run(EnvParams(energy_node_drift_speed=1, unit_sap_dropoff_factor=1))
+    assert LuxAIS3Env.reset._cache_size() == reset_cache_size
+    assert LuxAIS3Env.step._cache_size() == step_cache_size
+
+
+def test_gym_env_does_not_recompile():
+    """After the first reset, resets of LuxAIS3GymEnv with new randomized params and steps do not compile anything"""
+    compile_events = []
+
+    def listener(event, duration, **kwargs):
+        if event == "/jax/core/compile/backend_compile_duration":
+            compile_events.append(event)
+
+    monitoring.register_event_duration_secs_listener(listener)
+    env = LuxAIS3GymEnv(numpy_output=True)
+    env.reset(seed=0)
+    env.step(env.action_space.sample())
+    num_compiles = len(compile_events)
+    for seed in range(1, 11):
+        env.reset(seed=seed)
+        env.step(env.action_space.sample())
+    monitoring.unregister_event_duration_listener(listener)
+    assert len(compile_events) == num_compiles
+
+
+def test_gym_envs_share_compiled_env():
+    """Gym envs with the same fixed env params share one compiled jax env, and creating another one compiles nothing"""
+    compile_events = []
+
+    def listener(event, duration, **kwargs):
+        if event == "/jax/core/compile/backend_compile_duration":
+            compile_events.append(event)
+
+    env = LuxAIS3GymEnv(numpy_output=True)
+    num_compiled_envs = len(_compiled_jax_envs)
+    monitoring.register_event_duration_secs_listener(listener)
+    other_env = LuxAIS3GymEnv(numpy_output=True)
+    monitoring.unregister_event_duration_listener(listener)
+    assert other_env.jax_env is env.jax_env
+    assert get_compiled_jax_env(EnvParams()) is env.jax_env
+    assert len(_compiled_jax_envs) == num_compiled_envs
+    assert len(compile_events) == 0
+    # other fixed env params get their own env
+    fixed_env_params = EnvParams(max_steps_in_match=50)
+    assert get_compiled_jax_env(fixed_env_params) is not env.jax_env
+    assert len(_compiled_jax_envs) == num_compiled_envs + 1
+    assert get_compiled_jax_env(EnvParams(max_steps_in_match=50)) is get_compiled_jax_env(fixed_env_params)
+    assert len(_compiled_jax_envs) == num_compiled_envs + 1
+
+
+def test_compiled_env_warm_up_matches_fixed_env_params():
+    """The warm up of get_compiled_jax_env uses the fixed env params, so resets and steps with the env's default params
+    compile nothing"""
+    compile_events = []
+
+    def listener(event, duration, **kwargs):
+        if event == "/jax/core/compile/backend_compile_duration":
+            compile_events.append(event)
+
+    fixed_env_params = EnvParams(map_width=16, map_height=16, max_units=20, max_steps_in_match=50)
+    jax_env = get_compiled_jax_env(fixed_env_params, use_exported=False)
+    params = jax_env.default_params
+    assert params.max_steps_in_match == 50
+    key, reset_key, step_key = jax.random.split(jax.random.key(0), 3)
+    action = jax_env.action_space(params).sample(key)
+    monitoring.register_event_duration_secs_listener(listener)
+    # params by keyword like LuxAIS3GymEnv passes them
+    obs, state = jax_env.reset(reset_key, params=params)
+    jax_env.step(step_key, state, action, params=params)
+    monitoring.unregister_event_duration_listener(listener)
+    assert len(compile_events) == 0
@@ -0,0 +1,36 @@
+import jax
+import numpy as np
+
+from luxai_s3.env import LuxAIS3Env, ResetPool
+
+from helpers import trees_equal
+
+
+def test_reset_pool():
+    """Auto resets with a reset pool start the initial state of one of the pool's maps, and the pool refills itself"""
+    env = LuxAIS3Env(auto_reset=True)
+    params = env.default_params
+    pool = ResetPool(env, size=4, key=jax.random.key(0), refill_every=2)
+    initial_states = [jax.jit(env.reset_env_state)(map_key, params) for map_key in pool.map_keys]
+    _, state = env.reset(jax.random.key(1), params)
+    action = env.action_space(params).sample(jax.random.key(2))
+    reset_pool = pool.get()
+
+    # a step that does not end the episode keeps playing
+    obs, state, _, _, truncated, _ = env.step(jax.random.key(3), state, action, params, reset_pool=reset_pool)
+    assert not truncated["player_0"] and state.steps == 1
+
+    # the last step of the episode resets to one of the maps
+    episode_length = (params.max_steps_in_match + 1) * params.match_count_per_episode
+    state = state.replace(steps=(episode_length - 1).astype(state.steps.dtype))
+    obs, state, _, _, truncated, info = env.step(jax.random.key(4), state, action, params, reset_pool=reset_pool)
+    assert truncated["player_0"] and info["final_state"].steps == episode_length
+    assert sum(trees_equal(initial_state, state) for initial_state in initial_states) == 1
+    assert trees_equal(env.get_obs(state, params=params), obs)
+
+    # the same maps are used until get was called refill_every times
+    assert pool.get() is reset_pool
+    map_keys = pool.map_keys
+    assert pool.get() is not reset_pool
+    assert pool.uses == 1
+    assert not np.array_equal(jax.random.key_data(pool.map_keys), jax.random.key_data(map_keys))
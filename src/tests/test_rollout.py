@@ -0,0 +1,68 @@
+import jax
+import numpy as np
+import pytest
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams, canonicalize_env_params
+
+
+def test_rollout_matches_step_loop():
+    """rollout gives the same outputs as stepping one step at a time and resetting at episode boundaries"""
+    # short episodes of 12 steps
+    fixed_env_params = EnvParams(max_steps_in_match=5, match_count_per_episode=2)
+    env = LuxAIS3Env(auto_reset=False, fixed_env_params=fixed_env_params)
+    params = canonicalize_env_params(fixed_env_params)
+    key, reset_key, rollout_key = jax.random.split(jax.random.key(0), 3)
+    obs, state = env.reset(reset_key, params)
+    action_space = env.action_space(params)
+
+    def policy_fn(key, obs):
+        return action_space.sample(key)
+
+    start_step = 3
+    # the rest of the first episode, a full episode and part of a third one
+    num_steps = 30
+    step_env = jax.jit(env.step_env)
+    reset_env = jax.jit(env.reset_env)
+    for _ in range(start_step):
+        key, step_key, action_key = jax.random.split(key, 3)
+        obs, state, _, _, _, _ = step_env(step_key, state, policy_fn(action_key, obs), params)
+
+    final_obs, final_state, outputs = env.rollout(
+        rollout_key,
+        state,
+        params,
+        policy_fn=policy_fn,
+        num_steps=num_steps,
+        outputs=("state", "reward", "truncated"),
+        start_step=start_step,
+    )
+
+    key = rollout_key
+    expected = []
+    for t in range(start_step, start_step + num_steps):
+        if t > start_step and t % 12 == 0:
+            key, reset_key = jax.random.split(key)
+            obs, state = reset_env(reset_key, params)
+        key, policy_key, step_key = jax.random.split(key, 3)
+        obs, state, reward, _, truncated, _ = step_env(step_key, state, policy_fn(policy_key, obs), params)
+        expected.append(dict(state=state, reward=reward, truncated=truncated))
+    expected = jax.tree.map(lambda *xs: np.stack(xs), *expected)
+    assert jax.tree.structure(expected) == jax.tree.structure(outputs)
+    for x, y in zip(jax.tree.leaves((expected, obs, state)), jax.tree.leaves((outputs, final_obs, final_state))):
+        np.testing.assert_array_equal(np.asarray(x), np.asarray(y))
+    np.testing.assert_array_equal(np.flatnonzero(outputs["truncated"]), [8, 20])
+
+
+def test_rollout_validates_arguments():
+    env = LuxAIS3Env(auto_reset=False, fixed_env_params=EnvParams(max_steps_in_match=5, match_count_per_episode=2))
+    params = canonicalize_env_params(EnvParams(max_steps_in_match=5, match_count_per_episode=2))
+    _, state = env.reset(jax.random.key(0), params)
+
+    def policy_fn(key, obs):
+        return env.action_space(params).sample(key)
+
+    with pytest.raises(ValueError, match="start_step"):
+        env.rollout(jax.random.key(1), state, params, policy_fn=policy_fn, num_steps=4, start_step=13)
+    with pytest.raises(ValueError, match="max_steps_in_match"):
+        env.rollout(jax.random.key(1), state, canonicalize_env_params(EnvParams()), policy_fn=policy_fn, num_steps=4)
@@ -0,0 +1,113 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams
+from luxai_s3.state import UnitState
+
+
+def pairwise_sap(units: UnitState, units_mask, action, params: EnvParams, fixed_env_params: EnvParams) -> UnitState:
+    """The original sap resolution, comparing every unit against every sap target one team at a time"""
+    sap_action_mask = action[..., 0] == 5
+    sap_action_deltas = action[..., 1:]
+    current_energy = units.energy
+    all_units = units
+    for t in range(fixed_env_params.num_teams):
+        other_team_ids = jnp.array([t2 for t2 in range(fixed_env_params.num_teams) if t2 != t])
+        team_sap_action_deltas = sap_action_deltas[t]
+        other_team_unit_mask = units_mask[other_team_ids]
+        team_sapped_positions = all_units.position[t] + team_sap_action_deltas
+        team_unit_sapped = (
+            units_mask[t]
+            & sap_action_mask[t]
+            & (current_energy[t, :, 0] >= params.unit_sap_cost)
+            & (jnp.max(jnp.abs(team_sap_action_deltas), axis=-1) <= params.unit_sap_range)
+            & (team_sapped_positions >= 0).all(-1)
+            & (team_sapped_positions[:, 0] < fixed_env_params.map_width)
+            & (team_sapped_positions[:, 1] < fixed_env_params.map_height)
+        )
+        other_units_sapped_count = jnp.sum(
+            jnp.all(all_units.position[other_team_ids][:, :, None] == team_sapped_positions[None], axis=-1),
+            axis=-1,
+            dtype=jnp.int16,
+        )
+        all_units = all_units.replace(
+            energy=all_units.energy.at[other_team_ids].set(
+                jnp.where(
+                    team_unit_sapped[None, :, None]
+                    & other_team_unit_mask[:, :, None]
+                    & (other_units_sapped_count[:, :, None] > 0),
+                    all_units.energy[other_team_ids] - params.unit_sap_cost * other_units_sapped_count[:, :, None],
+                    all_units.energy[other_team_ids],
+                )
+            )
+        )
+        adjacent_offsets = jnp.array(
+            [[-1, -1], [-1, 0], [-1, 1], [0, -1], [0, 1], [1, -1], [1, 0], [1, 1]], dtype=jnp.int16
+        )
+        team_sapped_adjacent_positions = team_sapped_positions[:, None, :] + adjacent_offsets
+        other_units_adjacent_sapped_count = jnp.sum(
+            jnp.all(all_units.position[other_team_ids][:, :, None] == team_sapped_adjacent_positions[None], axis=-1),
+            axis=-1,
+            dtype=jnp.int16,
+        )
+        all_units = all_units.replace(
+            energy=all_units.energy.at[other_team_ids].set(
+                jnp.where(
+                    team_unit_sapped[None, :, None]
+                    & other_team_unit_mask[:, :, None]
+                    & (other_units_adjacent_sapped_count[:, :, None] > 0),
+                    all_units.energy[other_team_ids]
+                    - jnp.array(
+                        params.unit_sap_cost.astype(jnp.float32)
+                        * params.unit_sap_dropoff_factor
+                        * other_units_adjacent_sapped_count[:, :, None].astype(jnp.float32),
+                        dtype=jnp.int16,
+                    ),
+                    all_units.energy[other_team_ids],
+                )
+            )
+        )
+        all_units = all_units.replace(
+            energy=all_units.energy.at[t].set(
+                jnp.where(team_unit_sapped[:, None], all_units.energy[t] - params.unit_sap_cost, all_units.energy[t])
+            )
+        )
+    return all_units
+
+
+def random_sap_states(rng: np.random.Generator, num_states: int, fixed_env_params: EnvParams):
+    """Units crowded into a corner of the map so that sap actions often hit, with energies around the sap cost"""
+    shape = (num_states, fixed_env_params.num_teams, fixed_env_params.max_units)
+    position = rng.integers(0, 6, size=shape + (2,)).astype(np.int16)
+    energy = rng.integers(0, 60, size=shape + (1,)).astype(np.int16)
+    units_mask = rng.random(shape) < 0.7
+    action = np.concatenate(
+        [
+            np.where(rng.random(shape) < 0.7, 5, rng.integers(0, 5, size=shape))[..., None],
+            rng.integers(-5, 6, size=shape + (2,)),
+        ],
+        axis=-1,
+    ).astype(np.int16)
+    return UnitState(position=position, energy=energy), units_mask, action
+
+
+def test_sap_matches_pairwise():
+    """Resolving saps with hit count maps removes exactly the energy the original pairwise comparison removes"""
+    env = LuxAIS3Env(auto_reset=False)
+    params = env.default_params.replace(unit_sap_cost=jnp.int16(30), unit_sap_range=jnp.int16(4))
+    _, state = env.reset(jax.random.key(0), params)
+    units, units_mask, action = random_sap_states(np.random.default_rng(0), 256, env.fixed_env_params)
+
+    def apply_sap_actions(units, units_mask, action):
+        return env.apply_sap_actions(state.replace(units=units, units_mask=units_mask), action, params).units
+
+    expected = jax.jit(
+        jax.vmap(lambda units, units_mask, action: pairwise_sap(units, units_mask, action, params, env.fixed_env_params))
+    )(units, units_mask, action)
+    actual = jax.jit(jax.vmap(apply_sap_actions))(units, units_mask, action)
+    np.testing.assert_array_equal(actual.position, expected.position)
+    np.testing.assert_array_equal(actual.energy, expected.energy)
+    # a good share of units saps or gets sapped
+    assert (np.asarray(actual.energy) != units.energy).mean() > 0.1
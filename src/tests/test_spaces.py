@@ -0,0 +1,82 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import env_params_ranges
+from luxai_s3.spaces import MultiDiscrete, legal_action_mask
+from luxai_s3.state import ASTEROID_TILE
+
+
+def test_multi_discrete_contains():
+    env = LuxAIS3Env(auto_reset=False)
+    space: MultiDiscrete = env.action_space().spaces["player_0"]
+    action = space.sample(jax.random.key(0))
+    assert space.contains(action)
+    assert not space.contains(action[:-1])
+    assert not space.contains(action.at[0, 0].set(7))
+    assert not space.contains(action.at[0, 1].set(-100))
+
+
+def expected_legal_actions(state, params):
+    """Legal moves and sap targets of every unit, computed one unit at a time"""
+    tile_type = np.asarray(state.map_features.tile_type)
+    width, height = tile_type.shape
+    max_sap_range = env_params_ranges["unit_sap_range"][-1]
+    moves = [(0, -1), (1, 0), (0, 1), (-1, 0)]
+    num_teams, max_units = state.units_mask.shape
+    action = np.zeros((num_teams, max_units, 6), dtype=bool)
+    sap_target = np.zeros((num_teams, max_units, 2 * max_sap_range + 1, 2 * max_sap_range + 1), dtype=bool)
+    for t in range(num_teams):
+        for i in range(max_units):
+            action[t, i, 0] = True
+            if not state.units_mask[t, i]:
+                continue
+            x, y = (int(v) for v in state.units.position[t, i])
+            energy = int(np.asarray(state.units.energy[t, i]).reshape(-1)[0])
+            for a, (dx, dy) in enumerate(moves):
+                on_map = 0 <= x + dx < width and 0 <= y + dy < height
+                action[t, i, a + 1] = (
+                    energy >= params.unit_move_cost and on_map and tile_type[x + dx, y + dy] != ASTEROID_TILE
+                )
+            for dx in range(-max_sap_range, max_sap_range + 1):
+                for dy in range(-max_sap_range, max_sap_range + 1):
+                    sap_target[t, i, dx + max_sap_range, dy + max_sap_range] = (
+                        energy >= params.unit_sap_cost
+                        and max(abs(dx), abs(dy)) <= params.unit_sap_range
+                        and 0 <= x + dx < width
+                        and 0 <= y + dy < height
+                    )
+            action[t, i, 5] = sap_target[t, i].any()
+    return action, sap_target
+
+
+def test_legal_action_mask():
+    """legal_action_mask of batched states and observations matches a per unit computation of the rules"""
+    num_envs = 4
+    env = LuxAIS3Env(auto_reset=False)
+    params = env.default_params.replace(unit_sap_cost=jnp.int16(50))
+    obs, state = jax.vmap(env.reset, in_axes=(0, None))(jax.random.split(jax.random.key(0), num_envs), params)
+    step = jax.jit(jax.vmap(env.step, in_axes=(0, 0, 0, None)))
+    sample_action = jax.vmap(env.action_space(params).sample)
+    key = jax.random.key(1)
+    masks = jax.jit(jax.vmap(legal_action_mask, in_axes=(0, None)))
+    for i in range(60):
+        key, step_key, action_key = jax.random.split(key, 3)
+        action = sample_action(jax.random.split(action_key, num_envs))
+        obs, state, _, _, _, _ = step(jax.random.split(step_key, num_envs), state, action, params)
+        if i % 20 != 19:
+            continue
+        state_mask = masks(state, params)
+        obs_mask = masks(obs["player_0"], params)
+        assert state_mask.action[..., 1:5].any() and not state_mask.action[..., 1:5].all()
+        for e in range(num_envs):
+            env_state = jax.tree.map(lambda x: np.asarray(x[e]), state)
+            expected_action, expected_sap_target = expected_legal_actions(env_state, params)
+            np.testing.assert_array_equal(state_mask.action[e], expected_action)
+            np.testing.assert_array_equal(state_mask.sap_target[e], expected_sap_target)
+            # own units can sap the same tiles in the observation as in the state. They can make all moves they can make in
+            # the state, and more if they are next to asteroids that are not sensed
+            np.testing.assert_array_equal(obs_mask.action[e, 0, :, 5], expected_action[0, :, 5])
+            np.testing.assert_array_equal(obs_mask.sap_target[e, 0], expected_sap_target[0])
+            assert (obs_mask.action[e, 0] >= expected_action[0]).all()
@@ -0,0 +1,44 @@
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams, canonicalize_env_params
+from luxai_s3.state import merge_env_state, split_env_state
+
+
+def test_step_donated_matches_step():
+    """Batched step_donated on split states gives the same results as step, across auto resets, and consumes the state but
+    not the constants"""
+    num_envs = 3
+    env = LuxAIS3Env(auto_reset=True)
+    # short episodes of 12 steps
+    params = canonicalize_env_params(EnvParams(max_steps_in_match=5, match_count_per_episode=2))
+    _, state = jax.vmap(env.reset, in_axes=(0, None))(jax.random.split(jax.random.key(0), num_envs), params)
+    step = jax.vmap(env.step, in_axes=(0, 0, 0, None))
+    step_donated = jax.vmap(env.step_donated, in_axes=(0, 0, 0, 0, None))
+    sample_action = jax.vmap(env.action_space(params).sample)
+    split_state, constants = split_env_state(jax.tree.map(jnp.copy, state))
+    assert len(jax.tree.leaves(split_state)) + len(jax.tree.leaves(constants)) == len(jax.tree.leaves(state))
+    key = jax.random.key(1)
+    for _ in range(30):
+        key, step_key, action_key = jax.random.split(key, 3)
+        step_keys = jax.random.split(step_key, num_envs)
+        action = sample_action(jax.random.split(action_key, num_envs))
+        obs, state, reward, terminated, truncated, _ = step(step_keys, state, action, params)
+        previous_state, previous_constants = split_state, constants
+        donated_obs, split_state, constants, donated_reward, donated_terminated, donated_truncated = step_donated(
+            step_keys, split_state, constants, action, params
+        )
+        assert previous_state.units_mask.is_deleted()
+        assert not previous_constants.relic_nodes.is_deleted()
+        for expected, actual in [
+            (obs, donated_obs),
+            (state, merge_env_state(split_state, constants)),
+            ((reward, terminated, truncated), (donated_reward, donated_terminated, donated_truncated)),
+        ]:
+            assert jax.tree.structure(expected) == jax.tree.structure(actual)
+            for x, y in zip(jax.tree.leaves(expected), jax.tree.leaves(actual)):
+                np.testing.assert_array_equal(np.asarray(x), np.asarray(y))
+    # all envs were auto reset
+    assert (state.steps < 30).all()
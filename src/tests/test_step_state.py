@@ -0,0 +1,31 @@
+import jax
+import numpy as np
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams, canonicalize_env_params
+
+
+def test_step_state_matches_step():
+    """step_state gives the same states, rewards, terminations and truncations as step, across auto resets"""
+    num_envs = 3
+    env = LuxAIS3Env(auto_reset=True)
+    # short episodes of 12 steps
+    params = canonicalize_env_params(EnvParams(max_steps_in_match=5, match_count_per_episode=2))
+    _, state = jax.vmap(env.reset, in_axes=(0, None))(jax.random.split(jax.random.key(0), num_envs), params)
+    step = jax.vmap(env.step, in_axes=(0, 0, 0, None))
+    step_state = jax.vmap(env.step_state, in_axes=(0, 0, 0, None))
+    sample_action = jax.vmap(env.action_space(params).sample)
+    step_state_state = state
+    key = jax.random.key(1)
+    for _ in range(30):
+        key, step_key, action_key = jax.random.split(key, 3)
+        step_keys = jax.random.split(step_key, num_envs)
+        action = sample_action(jax.random.split(action_key, num_envs))
+        _, state, reward, terminated, truncated, _ = step(step_keys, state, action, params)
+        step_state_state, *step_state_outputs = step_state(step_keys, step_state_state, action, params)
+        for expected, actual in [(state, step_state_state), ((reward, terminated, truncated), tuple(step_state_outputs))]:
+            assert jax.tree.structure(expected) == jax.tree.structure(actual)
+            for x, y in zip(jax.tree.leaves(expected), jax.tree.leaves(actual)):
+                np.testing.assert_array_equal(np.asarray(x), np.asarray(y))
+    # all envs were auto reset
+    assert (state.steps < 30).all()
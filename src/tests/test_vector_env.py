@@ -0,0 +1,98 @@
+import flax.serialization
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+from luxai_s3.env import LuxAIS3Env
+from luxai_s3.params import EnvParams
+from luxai_s3.wrappers import LuxAIS3VectorEnv
+
+from helpers import assert_trees_equal
+
+
+def test_vector_env():
+    """Batched obs and rewards match stepping every env with LuxAIS3Env.step, finished envs are reset on the next step and
+    the donated state is never left deleted"""
+    num_envs = 3
+    vector_env = LuxAIS3VectorEnv(num_envs)
+    env = LuxAIS3Env(auto_reset=False)
+    step = jax.jit(env.step)
+    obs, _ = vector_env.reset(seed=0)
+    assert all(x.shape[0] == num_envs for x in jax.tree.leaves(obs))
+    assert obs["player_0"]["units"]["position"].shape == (num_envs, 2, 16, 2)
+    vector_env.action_space.seed(0)
+
+    def expected_step(action):
+        """Step every env on its own with the keys the vector env uses"""
+        _, step_key = jax.random.split(vector_env.rng_key)
+        step_keys = jax.random.split(step_key, num_envs)
+        outputs = []
+        for i in range(num_envs):
+            state, params = jax.tree.map(lambda x: jnp.copy(x[i]), (vector_env.state, vector_env.env_params))
+            env_action = jax.tree.map(lambda x: jnp.asarray(x[i], dtype=jnp.int16), action)
+            obs, _, reward, terminated, truncated, _ = step(step_keys[i], state, env_action, params)
+            outputs.append((flax.serialization.to_state_dict(obs), reward, terminated, truncated))
+        return jax.tree.map(lambda *xs: np.stack(xs), *outputs)
+
+    def vector_step(action):
+        previous_state = vector_env.state
+        outputs = vector_env.step(action)
+        # the previous state was donated, the wrapper only holds the new one
+        assert previous_state.units_mask.is_deleted()
+        assert not any(x.is_deleted() for x in jax.tree.leaves((vector_env.state, vector_env.env_params)))
+        return outputs
+
+    for _ in range(3):
+        action = vector_env.action_space.sample()
+        expected = expected_step(action)
+        obs, reward, terminated, truncated, _ = vector_step(action)
+        assert_trees_equal(expected, (obs, reward, terminated, truncated))
+        assert reward["player_0"].shape == (num_envs,)
+
+    # env 1 is one step before the end of its episode
+    episode_length = (vector_env.env_params.max_steps_in_match + 1) * vector_env.env_params.match_count_per_episode
+    steps = np.asarray(vector_env.state.steps)
+    vector_env.state = vector_env.state.replace(steps=vector_env.state.steps.at[1].set(episode_length[1] - 1))
+    action = vector_env.action_space.sample()
+    expected = expected_step(action)
+    obs, reward, terminated, truncated, _ = vector_step(action)
+    assert_trees_equal(expected, (obs, reward, terminated, truncated))
+    np.testing.assert_array_equal(truncated["player_0"], [False, True, False])
+
+    # env 1 is reset on the step after it was truncated, the other envs keep playing
+    action = vector_env.action_space.sample()
+    expected = expected_step(action)
+    obs, reward, terminated, truncated, _ = vector_step(action)
+    for i in [0, 2]:
+        assert_trees_equal(
+            jax.tree.map(lambda x: x[i], expected), jax.tree.map(lambda x: x[i], (obs, reward, terminated, truncated))
+        )
+    np.testing.assert_array_equal(np.asarray(vector_env.state.steps), [steps[0] + 2, 0, steps[2] + 2])
+    state, params = jax.tree.map(lambda x: x[1], (vector_env.state, vector_env.env_params))
+    assert_trees_equal(
+        flax.serialization.to_state_dict(env.get_obs(state, params=params)), jax.tree.map(lambda x: x[1], obs)
+    )
+    for x in jax.tree.leaves((reward, terminated, truncated)):
+        assert not x[1]
+    # the new episode plays one of the maps of the reset pool
+    pool = vector_env.reset_pool.states
+    assert (
+        (np.asarray(pool.relic_nodes) == np.asarray(state.relic_nodes)).all((1, 2))
+        & (np.asarray(pool.map_features.tile_type) == np.asarray(state.map_features.tile_type)).all((1, 2))
+    ).any()
+
+
+def test_vector_env_fixed_env_params():
+    """Envs are reset and stepped with the static fields of the fixed env params, e.g. their map size and max units"""
+    fixed_env_params = EnvParams(max_units=20, map_width=16, map_height=16)
+    vector_env = LuxAIS3VectorEnv(2, fixed_env_params=fixed_env_params)
+    obs, _ = vector_env.reset(seed=0)
+    assert vector_env.env_params.map_width == 16 and vector_env.env_params.max_units == 20
+    assert obs["player_0"]["units"]["position"].shape == (2, 2, 20, 2)
+    assert obs["player_0"]["map_features"]["tile_type"].shape == (2, 16, 16)
+    vector_env.step(vector_env.action_space.sample())
+    # the first step spawns a unit of each team in its corner
+    state = vector_env.state
+    np.testing.assert_array_equal(state.units_mask[:, :, 0], True)
+    np.testing.assert_array_equal(state.units.position[:, 0, 0], [[0, 0], [0, 0]])
+    np.testing.assert_array_equal(state.units.position[:, 1, 0], [[15, 15], [15, 15]])